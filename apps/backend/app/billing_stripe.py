@@ -7,7 +7,7 @@ import stripe
 from fastapi import APIRouter, HTTPException, Header, Request
 from pydantic import BaseModel
 
-from .entitlements import add_access, upsert_customer
+from .entitlements import add_access, add_access_many, upsert_customer
 
 router = APIRouter(prefix="/billing", tags=["billing"])
 
@@ -156,8 +156,8 @@ async def stripe_webhook(request: Request):
                 grades   = [x.strip() for x in (md.get("grades_csv") or "").split(",") if x.strip()]
                 pairs = list(zip(subjects, grades))[:2]
                 if pairs:
-                    for subj, grd in pairs:
-                        add_access(uid, {"plan": "pro", "subject": subj, "grade": grd}, expires_at=None)
+                    # 兩組一個 transaction 寫：重複送嘅 webhook 唔會插重疊 grant
+                    add_access_many(uid, [{"plan": "pro", "subject": subj, "grade": grd} for subj, grd in pairs])
                 else:
                     add_access(uid, {"plan": "pro"}, expires_at=None)
 
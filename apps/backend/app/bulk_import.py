@@ -0,0 +1,191 @@
+# apps/backend/app/bulk_import.py
+from __future__ import annotations
+
+import asyncio
+import os
+import tarfile
+import time
+import zipfile
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple
+
+from .packs import PREFIX, is_valid_slug
+from .upload_stream import UPLOAD_MAX_BYTES, CsvStreamValidator, UploadRejected
+
+# === 設定 ===
+BULK_CONCURRENCY = max(1, int(os.getenv("BULK_CONCURRENCY", "8")))
+BULK_MAX_FILES = int(os.getenv("BULK_MAX_FILES", "2000"))
+# 解壓後總大小上限（防 zip bomb）
+BULK_MAX_BYTES = int(os.getenv("BULK_MAX_BYTES", str(500 * 1024 * 1024)))
+
+
+class ArchiveRejected(Exception):
+    pass
+
+
+def _skip_name(name: str) -> bool:
+    parts = name.split("/")
+    return any(p.startswith(".") or p == "__MACOSX" for p in parts)
+
+
+def member_slug(name: str) -> Tuple[Optional[str], str]:
+    """
+    壓縮檔入面嘅路徑 → (slug, 錯誤)。佈局：subject/grade/name.csv（可以有 packs/ 前綴）。
+    """
+    path = name.replace("\\", "/").strip("/")
+    if path.startswith(PREFIX):
+        path = path[len(PREFIX):]
+    if not path.lower().endswith(".csv"):
+        return None, "not a .csv file"
+    slug = path[:-4]
+    if len(slug.split("/")) != 3:
+        return None, "expected subject/grade/name.csv"
+    if not is_valid_slug(slug):
+        return None, "invalid slug"
+    return slug, ""
+
+
+def iter_archive(f: IO[bytes]) -> Iterator[Tuple[str, int, Any]]:
+    """
+    逐個檔案 yield (路徑, 解壓後大小, 讀取函數)；zip / tar / tar.gz 自動識別。
+    讀取函數要按次序叫（tar 係串流）。
+    """
+    f.seek(0)
+    if zipfile.is_zipfile(f):
+        f.seek(0)
+        with zipfile.ZipFile(f) as zf:
+            for info in zf.infolist():
+                if info.is_dir() or _skip_name(info.filename):
+                    continue
+                yield info.filename, info.file_size, (lambda i=info: zf.read(i))
+        return
+    f.seek(0)
+    try:
+        tf = tarfile.open(fileobj=f, mode="r:*")
+    except tarfile.TarError:
+        raise ArchiveRejected("not a zip or tar archive")
+    with tf:
+        for m in tf:
+            if not m.isfile() or _skip_name(m.name):
+                continue
+            yield m.name, m.size, (lambda m=m: tf.extractfile(m).read())
+
+
+def check_csv(content: bytes) -> str:
+    """同串流上載一樣驗編碼 + header；回傳偵測到嘅編碼，有問題 raise UploadRejected。"""
+    v = CsvStreamValidator()
+    v.feed(content, final=True)
+    return v.encoding
+
+
+async def import_archive(storage, f: IO[bytes], *, concurrency: int = BULK_CONCURRENCY, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    匯入一個壓縮檔入面所有 CSV：
+    - 每個檔案獨立驗證（路徑 / slug / 大小 / 編碼 / header），壞嘅只記錄唔會拖累其他
+    - put 有上限咁並發（storage executor 做 I/O）；同時喺記憶體嘅檔案最多 concurrency 個
+    - 目錄 manifest 最後一次過更新
+    回傳 {"files": [...每個檔案報告], "summary": {...}}
+    """
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    sem = asyncio.Semaphore(max(1, concurrency))
+    reports: List[Dict[str, Any]] = []
+    tasks: List[asyncio.Task] = []
+    seen: Dict[str, str] = {}
+    total_bytes = 0
+
+    async def put_one(report: Dict[str, Any], slug: str, content: bytes) -> None:
+        t0 = time.perf_counter()
+        try:
+            result = await storage.put_pack(slug, content, update_catalog=False)
+            report.update(
+                status="ok",
+                etag=(result.get("etag") or "").strip('"'),
+                encoding=result.get("encoding", ""),
+                compiled=result.get("compiled", False),
+                rows=(result.get("entry") or {}).get("rows"),
+            )
+            report["_entry"] = result.get("entry")
+        except Exception as e:
+            report.update(status="failed", error=str(e))
+        finally:
+            report["seconds"] = round(time.perf_counter() - t0, 3)
+            sem.release()
+
+    members = iter_archive(f)
+    aborted = ""
+    try:
+        while True:
+            # 讀壓縮檔係 blocking I/O + 解壓：丟去 thread
+            item = await loop.run_in_executor(None, next, members, None)
+            if item is None:
+                break
+            name, size, read = item
+            report: Dict[str, Any] = {"path": name, "slug": None, "status": "", "bytes": size}
+            reports.append(report)
+            if len(reports) > BULK_MAX_FILES:
+                raise ArchiveRejected(f"too many files (max {BULK_MAX_FILES})")
+
+            slug, err = member_slug(name)
+            if slug is None:
+                report.update(status="skipped" if err == "not a .csv file" else "invalid", error=err)
+                continue
+            report["slug"] = slug
+            if slug in seen:
+                report.update(status="invalid", error=f"duplicate of {seen[slug]}")
+                continue
+            seen[slug] = name
+            if size > UPLOAD_MAX_BYTES:
+                report.update(status="invalid", error=f"file too large (max {UPLOAD_MAX_BYTES} bytes)")
+                continue
+            total_bytes += size
+            if total_bytes > BULK_MAX_BYTES:
+                raise ArchiveRejected(f"archive too large when extracted (max {BULK_MAX_BYTES} bytes)")
+
+            await sem.acquire()
+            try:
+                content = await loop.run_in_executor(None, read)
+                report["detected_encoding"] = check_csv(content)
+            except UploadRejected as e:
+                sem.release()
+                report.update(status="invalid", error=e.detail)
+                continue
+            except Exception as e:
+                sem.release()
+                report.update(status="failed", error=str(e))
+                continue
+            if dry_run:
+                sem.release()
+                report["status"] = "would_import"
+                continue
+            tasks.append(asyncio.create_task(put_one(report, slug, content)))
+    except ArchiveRejected as e:
+        if not reports:
+            raise
+        # 中途超出上限：已開始嘅 put 照做完，目錄照更新，其餘唔處理
+        aborted = str(e)
+        for r in reports:
+            if not r["status"]:
+                r.update(status="not_processed", error=aborted)
+
+    if tasks:
+        await asyncio.gather(*tasks)
+
+    entries = [r.pop("_entry") for r in reports if r.get("_entry")]
+    for r in reports:
+        r.pop("_entry", None)
+    cataloged = await storage.update_catalog(entries) if entries else None
+
+    counts: Dict[str, int] = {}
+    for r in reports:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+    return {
+        "files": reports,
+        "summary": {
+            "files": len(reports),
+            **counts,
+            "bytes": total_bytes,
+            "cataloged": cataloged,
+            "aborted": aborted,
+            "seconds": round(time.perf_counter() - started, 3),
+        },
+    }
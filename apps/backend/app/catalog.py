@@ -0,0 +1,232 @@
+# apps/backend/app/catalog.py
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from .packs import PREFIX, fetch_pack, is_missing, is_not_modified, is_precondition_failed
+
+# === 設定 ===
+CATALOG_KEY = os.getenv("CATALOG_KEY", "catalog/packs.json")  # 唔放喺 packs/ 底下，免得撞 slug
+CATALOG_TTL = float(os.getenv("CATALOG_TTL", "15"))  # 秒；過期後用 ETag 重新驗證
+CATALOG_VERSION = 1
+_MAX_WRITE_RETRIES = 5
+
+
+def derive_entry(slug: str) -> Dict[str, Any]:
+    """由 slug 推導 subject / grade / title（同舊版 list_packs 一樣）。"""
+    parts = slug.split("/")
+    title = parts[-1].replace("-", " ").title() if parts else slug
+    subject = parts[0] if len(parts) > 0 else ""
+    grade = parts[1] if len(parts) > 1 else ""
+    return {"slug": slug, "title": title, "subject": subject, "grade": grade}
+
+
+def make_entry(
+    slug: str,
+    *,
+    size: int = 0,
+    etag: str = "",
+    rows: Optional[int] = None,
+    pack_title: str = "",
+    artifact_bytes: Optional[int] = None,
+) -> Dict[str, Any]:
+    e = derive_entry(slug)
+    e.update(
+        {
+            "pack_title": pack_title,
+            "rows": rows,
+            "size": int(size or 0),
+            "etag": (etag or "").strip('"'),
+            "updated_at": int(time.time()),
+        }
+    )
+    if artifact_bytes is not None:
+        # 編譯產物大細：讀取時用嚟決定使唔使攞 row-offset index（細題包直接 GET 產物）
+        e["artifact_bytes"] = int(artifact_bytes)
+    return e
+
+
+def _empty_doc() -> Dict[str, Any]:
+    return {"v": CATALOG_VERSION, "version": 0, "updated_at": 0, "packs": {}}
+
+
+def _put_conditional(s3, bucket: str, body: bytes, etag: Optional[str]) -> str:
+    """
+    用 If-Match / If-None-Match 做樂觀鎖寫入（R2 同新版 S3 都支援）。
+    舊版 botocore 未識呢啲參數就退返普通 put（同一 worker 內仍有 lock 保護）。
+    """
+    kwargs: Dict[str, Any] = {
+        "Bucket": bucket,
+        "Key": CATALOG_KEY,
+        "Body": body,
+        "ContentType": "application/json; charset=utf-8",
+    }
+    if etag:
+        kwargs["IfMatch"] = etag
+    else:
+        kwargs["IfNoneMatch"] = "*"
+    try:
+        resp = s3.put_object(**kwargs)
+    except Exception as e:
+        if type(e).__name__ != "ParamValidationError":
+            raise
+        kwargs.pop("IfMatch", None)
+        kwargs.pop("IfNoneMatch", None)
+        resp = s3.put_object(**kwargs)
+    return (resp or {}).get("ETag") or ""
+
+
+class CatalogStore:
+    """
+    題包目錄 manifest（CATALOG_KEY），取代每次 list_objects_v2 掃晒成個 packs/。
+    - 讀：記憶體內有就直接用；TTL 過咗用 ETag 條件式 GET 重新驗證
+    - 寫：讀最新 → 修改 → If-Match 寫返；撞車（412）就重試
+    """
+
+    def __init__(self, ttl: float = CATALOG_TTL):
+        self.ttl = ttl
+        self._doc: Optional[Dict[str, Any]] = None
+        self._etag: Optional[str] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    # --- 讀 ---
+    def get(self, s3, bucket: str) -> Optional[Dict[str, Any]]:
+        """回傳 manifest；bucket 入面未有 manifest 就回傳 None。"""
+        with self._lock:
+            if self._doc is not None and time.monotonic() - self._checked_at < self.ttl:
+                return self._doc
+        return self._refresh(s3, bucket)
+
+    def peek(self) -> Optional[Dict[str, Any]]:
+        """記憶體入面最後一份（唔理 TTL、唔做 I/O）；只可以做 hint，唔好當最新。"""
+        with self._lock:
+            return self._doc
+
+    def get_fresh(self) -> Optional[Dict[str, Any]]:
+        """只睇記憶體：TTL 內有就回傳，否則 None（唔做任何 I/O）。"""
+        with self._lock:
+            if self._doc is not None and time.monotonic() - self._checked_at < self.ttl:
+                return self._doc
+        return None
+
+    def _refresh(self, s3, bucket: str) -> Optional[Dict[str, Any]]:
+        kwargs: Dict[str, Any] = {"Bucket": bucket, "Key": CATALOG_KEY}
+        if self._etag:
+            kwargs["IfNoneMatch"] = self._etag
+        try:
+            obj = s3.get_object(**kwargs)
+        except Exception as e:
+            if self._etag and is_not_modified(e):
+                with self._lock:
+                    self._checked_at = time.monotonic()
+                    return self._doc
+            if is_missing(e):
+                with self._lock:
+                    self._doc, self._etag = None, None
+                return None
+            raise
+
+        doc = json.loads(obj["Body"].read())
+        if not isinstance(doc, dict) or doc.get("v") != CATALOG_VERSION:
+            doc = _empty_doc()
+        with self._lock:
+            self._doc = doc
+            self._etag = obj.get("ETag") or ""
+            self._checked_at = time.monotonic()
+        return doc
+
+    # --- 寫 ---
+    def update(
+        self,
+        s3,
+        bucket: str,
+        upserts: Iterable[Dict[str, Any]] = (),
+        removes: Iterable[str] = (),
+        replace: bool = False,
+    ) -> Dict[str, Any]:
+        upserts = list(upserts)
+        removes = list(removes)
+        with self._write_lock:
+            for _ in range(_MAX_WRITE_RETRIES):
+                current = self._refresh(s3, bucket)
+                etag = self._etag if current is not None else None
+                doc = _empty_doc() if current is None else json.loads(json.dumps(current))
+                if replace:
+                    doc["packs"] = {}
+                for e in upserts:
+                    doc["packs"][e["slug"]] = e
+                for slug in removes:
+                    doc["packs"].pop(slug, None)
+                doc["version"] = int(doc.get("version") or 0) + 1
+                doc["updated_at"] = int(time.time())
+
+                body = json.dumps(doc, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                try:
+                    new_etag = _put_conditional(s3, bucket, body, etag)
+                except Exception as e:
+                    if is_precondition_failed(e):
+                        continue  # 其他 worker 啱啱寫咗，重讀再嚟
+                    raise
+                with self._lock:
+                    self._doc = doc
+                    self._etag = new_etag or None
+                    self._checked_at = time.monotonic() if new_etag else 0.0
+                return doc
+        raise RuntimeError("catalog update conflicted too many times")
+
+    def rebuild(self, s3, bucket: str, count_rows: bool = False) -> Dict[str, Any]:
+        """
+        掃一次 packs/ 重建 manifest。
+        count_rows=True 會逐個題包讀取計行數（慢，建議用 CLI 離線跑）。
+        """
+        entries: List[Dict[str, Any]] = []
+        kwargs = {"Bucket": bucket, "Prefix": PREFIX, "MaxKeys": 1000}
+        while True:
+            resp = s3.list_objects_v2(**kwargs)
+            for obj in resp.get("Contents", []):
+                key = obj["Key"]
+                if not key.endswith(".csv"):
+                    continue
+                slug = key[len(PREFIX):-4]
+                rows: Optional[int] = None
+                pack_title = ""
+                if count_rows:
+                    try:
+                        pack = fetch_pack(s3, bucket, slug)
+                        rows, pack_title = pack.count, pack.title
+                    except Exception:
+                        pass
+                entries.append(
+                    make_entry(slug, size=obj.get("Size") or 0, etag=obj.get("ETag") or "", rows=rows, pack_title=pack_title)
+                )
+            if resp.get("IsTruncated") and resp.get("NextContinuationToken"):
+                kwargs["ContinuationToken"] = resp["NextContinuationToken"]
+            else:
+                break
+        return self.update(s3, bucket, upserts=entries, replace=True)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._checked_at = 0.0
+
+
+def filter_items(doc: Dict[str, Any], subject: str = "", grade: str = "") -> List[Dict[str, Any]]:
+    subject = (subject or "").strip().lower()
+    grade = (grade or "").strip().lower()
+    if grade.isdigit():
+        grade = f"grade{grade}"
+    items = sorted((doc.get("packs") or {}).values(), key=lambda e: e["slug"])
+    if subject:
+        items = [e for e in items if (e.get("subject") or "").lower() == subject]
+    if grade:
+        items = [e for e in items if (e.get("grade") or "").lower() == grade]
+    return items
+
+
+catalog = CatalogStore()
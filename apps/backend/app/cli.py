@@ -0,0 +1,305 @@
+# apps/backend/app/cli.py
+# 維護指令（喺 apps/backend 底下執行）：
+#   python -m app.cli backfill-artifacts [--prefix math/] [--force] [--dry-run]
+#   python -m app.cli rebuild-catalog [--no-rows]
+#   python -m app.cli reencode [--prefix math/] [--dry-run]
+#   python -m app.cli import-archive term1.zip [--concurrency 8] [--dry-run]
+from __future__ import annotations
+
+import argparse
+import asyncio
+import csv
+import io
+import sys
+from typing import Any, Dict, Iterator
+
+import requests
+
+from .bulk_import import ArchiveRejected, BULK_CONCURRENCY, import_archive
+from .catalog import catalog, CATALOG_KEY
+from .images import ImageRejected, ingest, is_immutable_url
+from .packs import (
+    ARTIFACT_VERSION,
+    PREFIX,
+    decode_pack_bytes,
+    detect_encoding,
+    is_missing,
+    is_normalized,
+    put_artifact,
+    slug_to_artifact_key,
+)
+from .s3_client import s3_registry
+from .storage import ThreadedPackStorage, get_storage, publish_pack, put_csv
+
+
+def iter_csv_objects(s3, bucket: str, prefix: str = "") -> Iterator[Dict[str, Any]]:
+    """逐頁列出 packs/ 底下所有 .csv 物件。"""
+    kwargs = {"Bucket": bucket, "Prefix": PREFIX + prefix, "MaxKeys": 1000}
+    while True:
+        resp = s3.list_objects_v2(**kwargs)
+        for obj in resp.get("Contents", []):
+            if obj["Key"].endswith(".csv"):
+                yield obj
+        if resp.get("IsTruncated") and resp.get("NextContinuationToken"):
+            kwargs["ContinuationToken"] = resp["NextContinuationToken"]
+        else:
+            break
+
+
+def cmd_backfill_artifacts(args: argparse.Namespace) -> int:
+    s3, bucket = s3_registry.get()
+    done = skipped = failed = 0
+    for obj in iter_csv_objects(s3, bucket, args.prefix):
+        key = obj["Key"]
+        slug = key[len(PREFIX):-4]
+        etag = (obj.get("ETag") or "").strip('"')
+
+        if not args.force:
+            try:
+                head = s3.head_object(Bucket=bucket, Key=slug_to_artifact_key(slug))
+                meta = head.get("Metadata") or {}
+                if meta.get("source-etag") == etag and meta.get("artifact-v") == str(ARTIFACT_VERSION):
+                    skipped += 1
+                    continue
+            except Exception as e:
+                if not is_missing(e):
+                    print(f"⚠️  {slug}: head failed: {e}")
+
+        if args.dry_run:
+            print(f"would compile {slug}")
+            done += 1
+            continue
+
+        try:
+            src = s3.get_object(Bucket=bucket, Key=key)
+            info = put_artifact(s3, bucket, slug, src["Body"].read(), etag, is_normalized(src.get("Metadata")))
+            print(f"✅ {slug} -> {slug_to_artifact_key(slug)} ({info['bytes']} bytes, {info['count']} rows)")
+            done += 1
+        except Exception as e:
+            print(f"❌ {slug}: {e}")
+            failed += 1
+
+    print(f"compiled={done} skipped={skipped} failed={failed}")
+    return 1 if failed else 0
+
+
+def cmd_rebuild_catalog(args: argparse.Namespace) -> int:
+    s3, bucket = s3_registry.get()
+    doc = catalog.rebuild(s3, bucket, count_rows=not args.no_rows)
+    print(f"✅ {CATALOG_KEY}: {len(doc['packs'])} packs, version={doc['version']}")
+    return 0
+
+
+def cmd_reencode(args: argparse.Namespace) -> int:
+    """舊題包（未標記 UTF-8）轉碼重寫，再重新編譯產物 + 更新目錄。"""
+    s3, bucket = s3_registry.get()
+    done = skipped = failed = 0
+    for obj in iter_csv_objects(s3, bucket, args.prefix):
+        key = obj["Key"]
+        slug = key[len(PREFIX):-4]
+        try:
+            head = s3.head_object(Bucket=bucket, Key=key)
+            if is_normalized(head.get("Metadata")):
+                skipped += 1
+                continue
+            raw = s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+            if args.dry_run:
+                print(f"would re-encode {slug} ({detect_encoding(raw)[0]})")
+                done += 1
+                continue
+            etag, encoding, content = put_csv(s3, bucket, slug, raw)
+            compiled, _ = publish_pack(s3, bucket, slug, content, etag, normalized=True)
+            note = "" if compiled else " (compile failed)"
+            print(f"✅ {slug}: {encoding} -> utf-8{note}")
+            done += 1
+        except Exception as e:
+            print(f"❌ {slug}: {e}")
+            failed += 1
+
+    print(f"reencoded={done} skipped={skipped} failed={failed}")
+    return 1 if failed else 0
+
+
+def cmd_import_archive(args: argparse.Namespace) -> int:
+    storage = get_storage()
+    try:
+        with open(args.archive, "rb") as f:
+            result = asyncio.run(import_archive(storage, f, concurrency=args.concurrency, dry_run=args.dry_run))
+    except ArchiveRejected as e:
+        print(f"❌ {e}")
+        return 1
+    finally:
+        if isinstance(storage, ThreadedPackStorage):
+            storage.shutdown()
+
+    marks = {"ok": "✅", "would_import": "·", "skipped": "-"}
+    for r in result["files"]:
+        line = f"{marks.get(r['status'], '❌')} {r['path']}: {r['status']}"
+        if r.get("error"):
+            line += f" ({r['error']})"
+        if r.get("seconds") is not None:
+            line += f" {r['seconds']}s"
+        print(line)
+    print(" ".join(f"{k}={v}" for k, v in result["summary"].items()))
+    return 1 if result["summary"].get("failed") or result["summary"].get("invalid") or result["summary"]["aborted"] else 0
+
+
+def _fetch_image(s3, bucket: str, slug: str, ref: str) -> bytes:
+    """image 欄嘅舊值：http(s) URL 直接下載；其他當係 bucket key（相對題包目錄或者完整 key）。"""
+    if ref.startswith(("http://", "https://")):
+        r = requests.get(ref, timeout=15)
+        r.raise_for_status()
+        return r.content
+    key = ref.lstrip("/")
+    candidates = [f"{PREFIX}{slug.rsplit('/', 1)[0]}/{key}", key]
+    for k in candidates:
+        try:
+            return s3.get_object(Bucket=bucket, Key=k)["Body"].read()
+        except Exception as e:
+            if not is_missing(e):
+                raise
+    raise FileNotFoundError(ref)
+
+
+def cmd_ingest_images(args: argparse.Namespace) -> int:
+    """題包 image 欄仲係舊 URL / key 嘅：搬入內容 hash 圖庫，欄位改寫成 immutable URL。"""
+    s3, bucket = s3_registry.get()
+    storage = get_storage()
+    done = skipped = failed = 0
+    cache: Dict[str, str] = {}  # 舊值 → 新 URL（多個題目用同一張圖）
+    try:
+        for obj in iter_csv_objects(s3, bucket, args.prefix):
+            key = obj["Key"]
+            slug = key[len(PREFIX):-4]
+            try:
+                got = s3.get_object(Bucket=bucket, Key=key)
+                text = decode_pack_bytes(got["Body"].read(), got.get("Metadata"))
+                reader = csv.DictReader(io.StringIO(text))
+                fields = reader.fieldnames or []
+                rows = list(reader)
+                col = next((f for f in fields if f.strip().lower() == "image"), None)
+                todo = sorted({(r.get(col) or "").strip() for r in rows} - {""}) if col else []
+                todo = [v for v in todo if not is_immutable_url(v)]
+                if not todo:
+                    skipped += 1
+                    continue
+                if args.dry_run:
+                    print(f"would ingest {len(todo)} image(s) in {slug}")
+                    done += 1
+                    continue
+
+                errors = []
+                for ref in todo:
+                    if ref in cache:
+                        continue
+                    try:
+                        data = _fetch_image(s3, bucket, slug, ref)
+                        cache[ref] = asyncio.run(ingest(storage, data, args.api_base))["url"]
+                    except (ImageRejected, requests.RequestException, FileNotFoundError) as e:
+                        errors.append(f"{ref}: {e}")
+                for r in rows:
+                    ref = (r.get(col) or "").strip()
+                    if ref in cache:
+                        r[col] = cache[ref]
+
+                out = io.StringIO()
+                w = csv.DictWriter(out, fieldnames=fields, lineterminator="\n")
+                w.writeheader()
+                w.writerows(rows)
+                etag, _, content = put_csv(s3, bucket, slug, out.getvalue().encode("utf-8"))
+                compiled, _ = publish_pack(s3, bucket, slug, content, etag, normalized=True)
+                note = "" if compiled else " (compile failed)"
+                print(f"✅ {slug}: {len(todo) - len(errors)}/{len(todo)} image(s){note}")
+                for err in errors:
+                    print(f"   ❌ {err}")
+                done += 1
+                failed += bool(errors)
+            except Exception as e:
+                print(f"❌ {slug}: {e}")
+                failed += 1
+    finally:
+        if isinstance(storage, ThreadedPackStorage):
+            storage.shutdown()
+
+    print(f"rewritten={done} skipped={skipped} failed={failed}")
+    return 1 if failed else 0
+
+
+def cmd_compact_grants(args: argparse.Namespace) -> int:
+    from .entitlements import compact_grants  # 要 DATABASE_URL；其他指令唔使
+
+    result = compact_grants(args.user or None)
+    print(f"✅ compacted users={result['users']} added={result['added']} removed={result['removed']}")
+    return 0
+
+
+def cmd_sweep_grants(args: argparse.Namespace) -> int:
+    from .grant_sweeper import sweep_expired
+
+    deleted = sweep_expired(batch_size=args.batch, max_batches=args.max_batches, grace=args.grace)
+    print(f"✅ deleted {deleted} expired grant(s)")
+    return 0
+
+
+def cmd_migrate(args: argparse.Namespace) -> int:
+    from database import apply_migrations
+
+    names = apply_migrations(dry_run=args.dry_run)
+    verb = "would apply" if args.dry_run else "applied"
+    for name in names:
+        print(f"{'·' if args.dry_run else '✅'} {name}")
+    print(f"{verb} {len(names)} migration(s)")
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m app.cli")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("backfill-artifacts", help="為舊題包補生成編譯產物 packs/<slug>.json")
+    p.add_argument("--prefix", default="", help="只處理某個 slug 前綴，例如 math/grade3/")
+    p.add_argument("--force", action="store_true", help="就算產物已經係最新都重新編譯")
+    p.add_argument("--dry-run", action="store_true")
+    p.set_defaults(func=cmd_backfill_artifacts)
+
+    p = sub.add_parser("rebuild-catalog", help="掃 packs/ 重建題包目錄 manifest")
+    p.add_argument("--no-rows", action="store_true", help="唔讀題包計行數（快好多）")
+    p.set_defaults(func=cmd_rebuild_catalog)
+
+    p = sub.add_parser("reencode", help="將舊題包 CSV 轉做 UTF-8（讀取唔使再估編碼）")
+    p.add_argument("--prefix", default="", help="只處理某個 slug 前綴，例如 math/grade3/")
+    p.add_argument("--dry-run", action="store_true")
+    p.set_defaults(func=cmd_reencode)
+
+    p = sub.add_parser("import-archive", help="由 zip / tar 批量匯入題包（subject/grade/name.csv）")
+    p.add_argument("archive")
+    p.add_argument("--concurrency", type=int, default=BULK_CONCURRENCY)
+    p.add_argument("--dry-run", action="store_true", help="只驗證，唔寫入")
+    p.set_defaults(func=cmd_import_archive)
+
+    p = sub.add_parser("ingest-images", help="題包圖片搬入內容 hash 圖庫（img/），image 欄改寫成 immutable URL")
+    p.add_argument("--prefix", default="", help="只處理某個 slug 前綴，例如 math/grade3/")
+    p.add_argument("--api-base", default="", help="冇設定 IMAGE_PUBLIC_BASE 時，URL 用嘅 API 網址，例如 https://api.example.com")
+    p.add_argument("--dry-run", action="store_true")
+    p.set_defaults(func=cmd_ingest_images)
+
+    p = sub.add_parser("compact-grants", help="合併重疊 / 相鄰嘅授權 grant（ent_grants）")
+    p.add_argument("--user", default="", help="只處理一個 user_id")
+    p.set_defaults(func=cmd_compact_grants)
+
+    p = sub.add_parser("sweep-grants", help="分批刪走已過期嘅授權 grant")
+    p.add_argument("--batch", type=int, default=500)
+    p.add_argument("--max-batches", type=int, default=1000)
+    p.add_argument("--grace", type=float, default=0, help="過期之後保留幾多秒")
+    p.set_defaults(func=cmd_sweep_grants)
+
+    p = sub.add_parser("migrate", help="跑 migrations/*.sql 未跑過嘅 schema 變更（deploy 時先跑）")
+    p.add_argument("--dry-run", action="store_true", help="只列出未跑嘅 migration")
+    p.set_defaults(func=cmd_migrate)
+
+    args = ap.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
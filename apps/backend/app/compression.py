@@ -0,0 +1,297 @@
+# apps/backend/app/compression.py
+from __future__ import annotations
+
+import asyncio
+import gzip
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+# brotli (optional)：冇裝就只出 gzip
+try:
+    import brotli
+except ModuleNotFoundError:
+    brotli = None
+
+# === 設定 ===
+# 預先壓縮（目錄 / 編譯題包：每個版本做一次）用高壓縮率；
+# 即時壓縮（middleware、每個 seed 一份嘅題目 body）用快啲嘅等級
+PRECOMPRESS_GZIP_LEVEL = int(os.getenv("PRECOMPRESS_GZIP_LEVEL", "9"))
+PRECOMPRESS_BR_QUALITY = int(os.getenv("PRECOMPRESS_BR_QUALITY", "11"))
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "5"))
+COMPRESS_BR_QUALITY = int(os.getenv("COMPRESS_BR_QUALITY", "4"))
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+VARIANT_CACHE_MAX_ENTRIES = int(os.getenv("VARIANT_CACHE_MAX_ENTRIES", "512"))
+VARIANT_CACHE_MAX_BYTES = int(os.getenv("VARIANT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+_COMPRESSIBLE = ("application/json", "text/", "application/x-ndjson", "application/javascript", "image/svg+xml")
+
+
+def supported_encodings() -> Tuple[str, ...]:
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    由 Accept-Encoding 揀編碼：q 值高者優先，同分時 br 先過 gzip；q=0 當唔接受。
+    回傳 None = 唔壓縮。
+    """
+    if not accept_encoding:
+        return None
+    prefs: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        prefs[token] = q
+    best, best_q = None, 0.0
+    for enc in supported_encodings():
+        q = prefs.get(enc, prefs.get("*", 0.0))
+        if q > best_q:
+            best, best_q = enc, q
+    return best
+
+
+def is_compressible(content_type: str) -> bool:
+    ct = (content_type or "").lower()
+    return any(ct.startswith(t) for t in _COMPRESSIBLE)
+
+
+class CompressionStats:
+    """壓縮統計：bytes 入 / 出、CPU 時間（thread_time，唔計等 I/O）；分預先壓縮同即時壓縮。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._c: Dict[str, Dict[str, float]] = {}
+
+    def record(self, kind: str, encoding: str, raw: int, out: int, cpu: float) -> None:
+        with self._lock:
+            c = self._c.setdefault(f"{kind}.{encoding}", {"count": 0, "bytes_in": 0, "bytes_out": 0, "cpu_ms": 0.0})
+            c["count"] += 1
+            c["bytes_in"] += raw
+            c["bytes_out"] += out
+            c["cpu_ms"] += cpu * 1000
+
+    def served(self, kind: str, encoding: str, raw: int, out: int) -> None:
+        """每次派出壓縮版本都記一次慳咗幾多（預先壓縮嘅命中唔使 CPU）。"""
+        with self._lock:
+            c = self._c.setdefault(f"{kind}.{encoding}", {"count": 0, "bytes_in": 0, "bytes_out": 0, "cpu_ms": 0.0})
+            c["served"] = c.get("served", 0) + 1
+            c["bytes_saved"] = c.get("bytes_saved", 0) + max(0, raw - out)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            out = {k: dict(v, cpu_ms=round(v["cpu_ms"], 3)) for k, v in self._c.items()}
+        out["encodings"] = list(supported_encodings())
+        return out
+
+
+stats = CompressionStats()
+
+
+def compress(data: bytes, encoding: str, *, precompress: bool = False) -> bytes:
+    kind = "precompressed" if precompress else "dynamic"
+    started = time.thread_time()
+    if encoding == "br":
+        out = brotli.compress(data, quality=PRECOMPRESS_BR_QUALITY if precompress else COMPRESS_BR_QUALITY)
+    elif encoding == "gzip":
+        # mtime=0：同一 body 壓出嚟嘅 bytes 固定
+        out = gzip.compress(data, compresslevel=PRECOMPRESS_GZIP_LEVEL if precompress else COMPRESS_GZIP_LEVEL, mtime=0)
+    else:
+        raise ValueError(f"unsupported encoding {encoding}")
+    stats.record(kind, encoding, len(data), len(out), time.thread_time() - started)
+    return out
+
+
+async def compress_async(data: bytes, encoding: str, *, precompress: bool = False) -> bytes:
+    # 一律丟去 thread：br q11 壓幾十 KB 都要幾十 ms，唔可以卡住 event loop
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, lambda: compress(data, encoding, precompress=precompress))
+
+
+class VariantCache:
+    """
+    ETag → {編碼: 壓縮後 bytes}。ETag 已經包含版本（題包 / 目錄 version + 參數），
+    所以每個版本每種編碼只壓一次；舊版本自然由 LRU 淘汰。
+    """
+
+    def __init__(self, max_entries: int = VARIANT_CACHE_MAX_ENTRIES, max_bytes: int = VARIANT_CACHE_MAX_BYTES):
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max(0, max_bytes)
+        self._entries: "OrderedDict[str, Dict[str, bytes]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, etag: str, encoding: str) -> Optional[bytes]:
+        with self._lock:
+            variants = self._entries.get(etag)
+            if variants is None or encoding not in variants:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(etag)
+            self.hits += 1
+            return variants[encoding]
+
+    def put(self, etag: str, encoding: str, data: bytes) -> None:
+        with self._lock:
+            variants = self._entries.setdefault(etag, {})
+            self._entries.move_to_end(etag)
+            old = variants.get(encoding)
+            self._bytes += len(data) - (len(old) if old is not None else 0)
+            variants[encoding] = data
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, dropped = self._entries.popitem(last=False)
+                self._bytes -= sum(len(v) for v in dropped.values())
+                self.evictions += 1
+
+    async def get_or_compress(self, etag: str, encoding: str, body: bytes, *, precompress: bool = True) -> bytes:
+        hit = self.get(etag, encoding)
+        if hit is not None:
+            return hit
+        out = await compress_async(body, encoding, precompress=precompress)
+        self.put(etag, encoding, out)
+        return out
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+variant_cache = VariantCache()
+
+
+async def negotiate(
+    body: bytes,
+    etag: str,
+    headers: Dict[str, str],
+    accept_encoding: Optional[str],
+    *,
+    precompress: bool = True,
+) -> Tuple[bytes, Dict[str, str]]:
+    """
+    按 Accept-Encoding 回傳 (body, headers)：細過門檻或者 client 唔接受就原封不動。
+    壓縮版本嘅 ETag 轉做 weak（同 nginx 一樣），If-None-Match 照樣對得上。
+    precompress=False：body 重用機會低（例如每個 seed 一份），用即時壓縮等級。
+    """
+    headers = dict(headers)
+    headers["Vary"] = "Accept-Encoding"
+    encoding = choose_encoding(accept_encoding)
+    if encoding is None or len(body) < COMPRESS_MIN_BYTES:
+        return body, headers
+    out = await variant_cache.get_or_compress(etag, encoding, body, precompress=precompress)
+    if len(out) >= len(body):
+        return body, headers
+    stats.served("precompressed" if precompress else "dynamic", encoding, len(body), len(out))
+    headers["Content-Encoding"] = encoding
+    if headers.get("ETag") and not headers["ETag"].startswith("W/"):
+        headers["ETag"] = "W/" + headers["ETag"]
+    return out, headers
+
+
+def _header(headers: List[Tuple[bytes, bytes]], name: bytes) -> Optional[bytes]:
+    for k, v in headers:
+        if k.lower() == name:
+            return v
+    return None
+
+
+class CompressionMiddleware:
+    """
+    其他 route 用嘅即時壓縮（pure ASGI）：
+    - 只處理有 Content-Length、夠大（COMPRESS_MIN_BYTES）、可壓縮 content-type、未有 Content-Encoding 嘅 response
+    - 串流 response（冇 Content-Length）原封不動
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        accept = _header(scope.get("headers") or [], b"accept-encoding")
+        encoding = choose_encoding(accept.decode("latin-1") if accept else None)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Dict[str, Any]] = None
+        chunks: List[bytes] = []
+        passthrough = False
+
+        async def wrapped_send(message):
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = message.get("headers") or []
+                length = _header(headers, b"content-length")
+                ctype = _header(headers, b"content-type") or b""
+                if (
+                    message.get("status", 200) in (204, 304)
+                    or _header(headers, b"content-encoding") is not None
+                    or length is None
+                    or int(length) < self.minimum_size
+                    or not is_compressible(ctype.decode("latin-1"))
+                ):
+                    passthrough = True
+                    await send(message)
+                    return
+                start = message
+                return
+            if message["type"] == "http.response.body" and start is not None:
+                chunks.append(message.get("body", b""))
+                if message.get("more_body", False):
+                    return
+                body = b"".join(chunks)
+                out = await compress_async(body, encoding)
+                headers = [(k, v) for k, v in start.get("headers") or [] if k.lower() not in (b"content-length", b"etag")]
+                etag = _header(start.get("headers") or [], b"etag")
+                if len(out) < len(body):
+                    stats.served("dynamic", encoding, len(body), len(out))
+                    headers.append((b"content-encoding", encoding.encode("latin-1")))
+                    if etag is not None:
+                        headers.append((b"etag", etag if etag.startswith(b"W/") else b"W/" + etag))
+                else:
+                    out = body
+                    if etag is not None:
+                        headers.append((b"etag", etag))
+                vary = _header(headers, b"vary")
+                if vary is None:
+                    headers.append((b"vary", b"Accept-Encoding"))
+                elif b"accept-encoding" not in vary.lower():
+                    headers = [(k, v) for k, v in headers if k.lower() != b"vary"]
+                    headers.append((b"vary", vary + b", Accept-Encoding"))
+                headers.append((b"content-length", str(len(out)).encode("latin-1")))
+                await send({**start, "headers": headers})
+                await send({"type": "http.response.body", "body": out})
+                return
+            await send(message)
+
+        await self.app(scope, receive, wrapped_send)
@@ -1,10 +1,18 @@
 # apps/backend/app/entitlements.py
 from __future__ import annotations
 
-from typing import Optional, Dict, Any
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, Iterable, List, Tuple
 from datetime import datetime, timezone
 
-from database import SessionLocal          # ✅ 改：由 apps/backend/database.py 引入
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from database import AsyncSessionLocal, SessionLocal          # ✅ 改：由 apps/backend/database.py 引入
 from .models import Customer, EntGrant
 
 # === 方案旗標（前端廣告/報告/可見年級判斷用） ==========================
@@ -123,6 +131,326 @@ def _parse_subject_grade_from_slug(slug: str) -> tuple[str, int]:
     return _norm_subject(subject), _parse_grade_to_num(grade_raw)
 
 
+# === 授權快照（process 內 cache） ================================
+# 每個用戶一條 query 攞晒所有 grant，has_access / current_plan / get_entitlement 都由快照答；
+# add_access / upsert_customer 寫完即清。多個 process 之間靠 TTL 收斂。
+ENT_CACHE_TTL = float(os.getenv("ENT_CACHE_TTL", "60"))  # 秒；0 = 唔 cache
+ENT_CACHE_MAX_ENTRIES = int(os.getenv("ENT_CACHE_MAX_ENTRIES", "10000"))
+
+
+def _aware(dt: Optional[datetime]) -> Optional[datetime]:
+    # SQLite 等回傳 naive datetime：當 UTC
+    if dt is not None and dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+@dataclass(frozen=True)
+class GrantRow:
+    plan: str
+    subject: Optional[str]  # None = 通配
+    grade_from: int
+    grade_to: int
+    expires_at: Optional[datetime]
+
+    def active(self, now: datetime) -> bool:
+        return self.expires_at is None or self.expires_at > now
+
+    def covers(self, subj: str, gnum: int) -> bool:
+        return (self.subject is None or self.subject == subj) and self.grade_from <= gnum <= self.grade_to
+
+
+# === 科目×年級 bitmap ===========================================
+# 每行 6 bit（小一..小六）：第 0 行 = 通配（subject None），之後每個科目一行。
+# 次序唔好改（只可以喺尾加）：cache / token 入面嘅 bit 位置靠佢。
+ACCESS_SUBJECTS: Tuple[str, ...] = ("chinese", "math", "general")
+GRADE_BITS = 6
+_ROW_MASK = (1 << GRADE_BITS) - 1
+_SUBJECT_ROW = {subj: i + 1 for i, subj in enumerate(ACCESS_SUBJECTS)}
+BITMAP_FORMAT = "b1"
+
+
+def _grade_mask(grade_from: int, grade_to: int) -> int:
+    lo, hi = max(1, grade_from), min(GRADE_BITS, grade_to)
+    if lo > hi:
+        return 0
+    return ((1 << (hi - lo + 1)) - 1) << (lo - 1)
+
+
+@dataclass(frozen=True)
+class AccessBitmap:
+    """
+    用戶有效 grant 編譯成嘅 bitmap：has_access 變成一次 bit test。
+    expires_at = 最早到期時間（epoch 秒）；過咗就要由 grant 重新編譯。
+    表外科目（ACCESS_SUBJECTS 冇嘅）放 extra。
+    """
+
+    bits: int = 0
+    extra: Tuple[Tuple[str, int], ...] = ()
+    expires_at: Optional[int] = None
+
+    @classmethod
+    def compile(cls, grants, now: Optional[datetime] = None) -> "AccessBitmap":
+        now = now or _now()
+        bits = 0
+        extra: Dict[str, int] = {}
+        expires: Optional[datetime] = None
+        for g in grants:
+            if not g.active(now):
+                continue
+            mask = _grade_mask(g.grade_from, g.grade_to)
+            if not mask:
+                continue
+            if g.subject is None:
+                bits |= mask
+            elif g.subject in _SUBJECT_ROW:
+                bits |= mask << (_SUBJECT_ROW[g.subject] * GRADE_BITS)
+            else:
+                extra[g.subject] = extra.get(g.subject, 0) | mask
+            if g.expires_at is not None and (expires is None or g.expires_at < expires):
+                expires = g.expires_at
+        return cls(
+            bits=bits,
+            extra=tuple(sorted(extra.items())),
+            expires_at=int(expires.timestamp()) if expires else None,
+        )
+
+    def grades(self, subj: str) -> int:
+        """某科目可用年級嘅 6-bit mask（已包通配）。"""
+        row = _SUBJECT_ROW.get(subj)
+        mask = self.bits & _ROW_MASK
+        if row is not None:
+            return mask | ((self.bits >> (row * GRADE_BITS)) & _ROW_MASK)
+        for name, m in self.extra:
+            if name == subj:
+                return mask | m
+        return mask
+
+    def test(self, subj: str, gnum: int) -> bool:
+        return 1 <= gnum <= GRADE_BITS and bool(self.grades(subj) >> (gnum - 1) & 1)
+
+    def stale(self, now: Optional[datetime] = None) -> bool:
+        return self.expires_at is not None and (now or _now()).timestamp() >= self.expires_at
+
+    def dumps(self) -> str:
+        """'b1:<bits hex>:<到期 epoch 或空>:<科目=mask hex,...>'，可以擺入 cache / token。"""
+        extra = ",".join(f"{name}={m:x}" for name, m in self.extra)
+        exp = "" if self.expires_at is None else str(self.expires_at)
+        return f"{BITMAP_FORMAT}:{self.bits:x}:{exp}:{extra}"
+
+    @classmethod
+    def loads(cls, raw: str) -> "AccessBitmap":
+        """dumps 嘅相反；格式唔啱 raise ValueError。"""
+        parts = (raw or "").split(":", 3)
+        if len(parts) != 4 or parts[0] != BITMAP_FORMAT:
+            raise ValueError("bad access bitmap")
+        extra = []
+        for item in filter(None, parts[3].split(",")):
+            name, sep, m = item.rpartition("=")
+            if not sep or not name:
+                raise ValueError("bad access bitmap")
+            extra.append((name, int(m, 16)))
+        return cls(bits=int(parts[1], 16), extra=tuple(extra), expires_at=int(parts[2]) if parts[2] else None)
+
+
+@dataclass
+class EntitlementSnapshot:
+    user_id: str
+    grants: Tuple[GrantRow, ...]
+    version: int = 0  # customers.grant_version：add_access 每次 +1
+    loaded_at: float = field(default_factory=time.monotonic)
+    _bitmap: Optional[AccessBitmap] = field(default=None, repr=False, compare=False)
+
+    def bitmap(self, now: Optional[datetime] = None) -> AccessBitmap:
+        """有效 grant 嘅 bitmap；最早嗰個 grant 到期之後自動重新編譯。"""
+        now = now or _now()
+        bm = self._bitmap
+        if bm is None or bm.stale(now):
+            bm = self._bitmap = AccessBitmap.compile(self.grants, now)
+        return bm
+
+    def has_access(self, subj: str, gnum: int, now: Optional[datetime] = None) -> bool:
+        return self.bitmap(now).test(subj, gnum)
+
+    def plan(self) -> str:
+        # 同舊版一樣：唔理到期，有 pro grant 就係 pro
+        plans = {g.plan for g in self.grants}
+        if "pro" in plans:
+            return "pro"
+        return "starter" if "starter" in plans else "free"
+
+    def entitlement(self) -> Optional[dict]:
+        if not self.grants:
+            return None
+        return {
+            "grants": [
+                {
+                    "plan": g.plan,
+                    "subjects": ["*"] if g.subject is None else [g.subject],
+                    "grade_from": g.grade_from,
+                    "grade_to": g.grade_to,
+                    "expires_at": int(g.expires_at.timestamp()) if g.expires_at else None,
+                }
+                for g in self.grants
+            ]
+        }
+
+
+class EntitlementCache:
+    """
+    user_id → EntitlementSnapshot（LRU + TTL）。
+    invalidate 會推高 epoch：清 cache 之前已經開始讀 DB 嘅快照唔會再寫返入去（舊資料唔會蓋新）。
+    """
+
+    def __init__(self, ttl: float = ENT_CACHE_TTL, max_entries: int = ENT_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, EntitlementSnapshot]" = OrderedDict()
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def epoch(self) -> int:
+        return self._epoch
+
+    def get(self, user_id: str) -> Optional[EntitlementSnapshot]:
+        with self._lock:
+            snap = self._items.get(user_id)
+            if snap is not None and time.monotonic() - snap.loaded_at > self.ttl:
+                del self._items[user_id]
+                snap = None
+            if snap is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(user_id)
+            self.hits += 1
+            return snap
+
+    def put(self, snap: EntitlementSnapshot, epoch: int) -> None:
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            if epoch != self._epoch:
+                return
+            self._items[snap.user_id] = snap
+            self._items.move_to_end(snap.user_id)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def invalidate(self, user_id: Optional[str] = None) -> None:
+        with self._lock:
+            self._epoch += 1
+            self.invalidations += 1
+            if user_id is None:
+                self._items.clear()
+            else:
+                self._items.pop(user_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._items),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "ttl": self.ttl,
+            }
+
+
+entitlement_cache = EntitlementCache()
+
+
+ENT_VERSION_TTL = float(os.getenv("ENT_VERSION_TTL", "15"))  # 秒；token digest 新鮮度檢查
+
+
+class GrantVersions:
+    """
+    user_id → customers.grant_version（process 內，短 TTL）。
+    token digest 嘅 version 同呢度一樣就唔使查 DB；本 process 寫入會即時更新，其他 process 最多遲 TTL。
+    """
+
+    def __init__(self, ttl: float = ENT_VERSION_TTL, max_entries: int = ENT_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+
+    def get(self, user_id: str) -> Optional[int]:
+        with self._lock:
+            item = self._items.get(user_id)
+            if item is None or time.monotonic() - item[1] > self.ttl:
+                return None
+            return item[0]
+
+    def set(self, user_id: str, version: int) -> None:
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            item = self._items.get(user_id)
+            if item is not None and item[0] > version:
+                return  # version 只會升：較舊嘅讀取結果唔好蓋新
+            self._items[user_id] = (version, time.monotonic())
+            self._items.move_to_end(user_id)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+
+grant_versions = GrantVersions()
+
+
+def _snapshot_query(user_id: str):
+    # grant 有 FK 指住 customers：冇 customer 行即係冇 grant、version 0
+    return (
+        select(
+            Customer.grant_version,
+            EntGrant.plan,
+            EntGrant.subject,
+            EntGrant.grade_from,
+            EntGrant.grade_to,
+            EntGrant.expires_at,
+        )
+        .outerjoin(EntGrant, EntGrant.user_id == Customer.user_id)
+        .where(Customer.user_id == user_id)
+        .order_by(EntGrant.id)
+    )
+
+
+def _store_snapshot(user_id: str, rows, epoch: int) -> EntitlementSnapshot:
+    snap = EntitlementSnapshot(
+        user_id=user_id,
+        grants=tuple(GrantRow(r[1], r[2], r[3], r[4], _aware(r[5])) for r in rows if r[1] is not None),
+        version=int(rows[0][0] or 0) if rows else 0,
+    )
+    grant_versions.set(user_id, snap.version)
+    entitlement_cache.put(snap, epoch)
+    return snap
+
+
+def load_snapshot(user_id: str) -> EntitlementSnapshot:
+    """攞用戶授權快照：cache 冇就一條 query 讀晒佢所有 EntGrant。"""
+    snap = entitlement_cache.get(user_id)
+    if snap is not None:
+        return snap
+    epoch = entitlement_cache.epoch
+    with SessionLocal() as s:
+        rows = s.execute(_snapshot_query(user_id)).all()
+    return _store_snapshot(user_id, rows, epoch)
+
+
+async def load_snapshot_async(user_id: str) -> EntitlementSnapshot:
+    """load_snapshot 嘅 async 版（AsyncSession）：同一個 cache，等 DB 唔使佔 threadpool。"""
+    snap = entitlement_cache.get(user_id)
+    if snap is not None:
+        return snap
+    epoch = entitlement_cache.epoch
+    async with AsyncSessionLocal() as s:
+        rows = (await s.execute(_snapshot_query(user_id))).all()
+    return _store_snapshot(user_id, rows, epoch)
+
+
 # === 對外 API：顧客 / 授權（存取 Postgres） ======================
 def upsert_customer(user_id: str, email: str | None, stripe_customer_id: str | None):
     with SessionLocal() as s, s.begin():
@@ -140,120 +468,208 @@ def upsert_customer(user_id: str, email: str | None, stripe_customer_id: str | N
                     stripe_customer_id=stripe_customer_id,
                 )
             )
+    entitlement_cache.invalidate(user_id)
 
 
-def add_access(
-    user_id: str,
-    scope: dict,
-    expires_at: Optional[int | datetime] = None,
-) -> bool:
-    """
-    scope 範例：
-      - {"plan":"pro"}  → Pro 通配（科目不限、年級 1..6）
-      - {"plan":"starter","subject":"math","grade":"grade1"}
-      - {"plan":"pro","subject":"chinese","grade":"grade3"}（Pro 自選 2 組時各寫一筆）
-      - 區間也可：{"plan":"starter","subject":"chinese","grade_from":1,"grade_to":3}
-    合併規則：相同 plan + 相同 subject（或通配 None）且年級區間相交/相鄰 → 合併
-    """
-    if not user_id:
-        return False
-
+def _normalize_scope(scope: dict) -> Optional[Tuple[str, Optional[str], int, int]]:
+    """scope → (plan, subject 或 None=通配, grade_from, grade_to)；年級無效回 None。"""
     plan = (scope.get("plan") or "starter").lower()
     subj = _norm_subject(scope.get("subject"))
     g_from = scope.get("grade_from")
     g_to = scope.get("grade_to")
     g_one = scope.get("grade")
 
-    # 年級規範化
     if plan == "pro" and not subj and not g_from and not g_to and not g_one:
         # 通配 Pro：subject=None, grade 1..6
-        subj_val = None
-        gf, gt = 1, 6
+        return plan, None, 1, 6
+
+    if g_one is not None:
+        gf = gt = _parse_grade_to_num(g_one)
     else:
-        subj_val = subj or None
-        if g_one is not None:
-            gf = gt = _parse_grade_to_num(g_one)
-        else:
-            gf = _parse_grade_to_num(g_from)
-            gt = _parse_grade_to_num(g_to)
+        gf = _parse_grade_to_num(g_from)
+        gt = _parse_grade_to_num(g_to)
+
+    if not (1 <= gf <= 6):
+        return None
+    if not (1 <= gt <= 6):
+        gt = gf
+    if gf > gt:
+        gf, gt = gt, gf
+    return plan, subj or None, gf, gt
 
-        if not (1 <= gf <= 6):
-            return False
-        if not (1 <= gt <= 6):
-            gt = gf
-        if gf > gt:
-            gf, gt = gt, gf
 
-    # 到期時間標準化
+def _expiry_dt(expires_at: Optional[int | datetime]) -> Optional[datetime]:
     if expires_at is None:
-        exp_dt: Optional[datetime] = None
-    elif isinstance(expires_at, int):
-        exp_dt = datetime.fromtimestamp(expires_at, tz=timezone.utc)
-    else:
-        exp_dt = expires_at
+        return None
+    if isinstance(expires_at, int):
+        return datetime.fromtimestamp(expires_at, tz=timezone.utc)
+    return _aware(expires_at)
 
-    # 合併/新增
-    with SessionLocal() as s, s.begin():
-        q = s.query(EntGrant).filter(
-            EntGrant.user_id == user_id,
-            EntGrant.plan == plan,
-        )
-        if subj_val is None:
-            q = q.filter(EntGrant.subject.is_(None))
-        else:
-            q = q.filter(EntGrant.subject == subj_val)
 
-        merged = False
-        for g in q.all():
-            # 年級區間相交或相鄰才合併
-            if g.grade_to + 1 < gf or gt + 1 < g.grade_from:
+def _lock_customer(s, user_id: str) -> None:
+    """
+    鎖住用戶嘅 customers 行（冇就先建）：同一用戶嘅 grant 寫入排隊做，
+    重複 / 並發 webhook 唔會各自插入重疊 grant。
+    """
+    if s.get_bind().dialect.name == "postgresql":
+        s.execute(pg_insert(Customer).values(user_id=user_id).on_conflict_do_nothing(index_elements=["user_id"]))
+    elif s.get(Customer, user_id) is None:
+        s.add(Customer(user_id=user_id))
+        s.flush()
+    s.query(Customer.user_id).filter(Customer.user_id == user_id).with_for_update().one()
+
+
+def _merge_grants(s, user_id: str, new: List[Tuple[str, Optional[str], int, int, Optional[datetime]]]) -> Tuple[int, int]:
+    """
+    喺已鎖嘅 transaction 入面，將用戶現有有效 grant + 新 grant 按 (plan, subject) 合併：
+    每個年級取覆蓋佢嘅 grant 入面最遲嘅到期（None 視為永久），再將相鄰而到期相同嘅年級併成一行。
+    到期唔同嘅重疊區間會切開，唔會將短期 grant 延長。已過期嘅行唔郁（交俾 sweeper）。
+    回傳 (新增行數, 刪除行數)。
+    """
+    now = _now()
+    groups: Dict[Tuple[str, Optional[str]], List[tuple]] = {}
+    for g in s.query(EntGrant).filter(EntGrant.user_id == user_id).order_by(EntGrant.id).all():
+        exp = _aware(g.expires_at)
+        if exp is not None and exp <= now:
+            continue
+        groups.setdefault((g.plan, g.subject), []).append((g.grade_from, g.grade_to, exp, g))
+    for plan, subj, gf, gt, exp in new:
+        groups.setdefault((plan, subj), []).append((gf, gt, exp, None))
+
+    added = removed = 0
+    for (plan, subj), items in groups.items():
+        # 切成基本區間：每段入面覆蓋佢嘅 grant 一樣，所以最遲到期都一樣
+        bounds = sorted({gf for gf, _, _, _ in items} | {gt + 1 for _, gt, _, _ in items})
+        runs: List[list] = []
+        for lo, hi in zip(bounds, bounds[1:]):
+            cover = [exp for gf, gt, exp, _ in items if gf <= lo and gt >= hi - 1]
+            if not cover:
                 continue
-            g.grade_from = min(g.grade_from, gf)
-            g.grade_to = max(g.grade_to, gt)
-            # 到期：取較晚（None 視為永久）
-            if g.expires_at is None or exp_dt is None:
-                g.expires_at = None
+            best = None if any(e is None for e in cover) else max(cover)
+            if runs and runs[-1][1] == lo - 1 and runs[-1][2] == best:
+                runs[-1][1] = hi - 1
+            else:
+                runs.append([lo, hi - 1, best])
+
+        # 盡量沿用現有行：完全一樣嘅唔郁，其餘按 id 改寫，唔夠先新增、多出嘅刪走
+        existing = sorted((r for *_, r in items if r is not None), key=lambda r: r.id)
+        todo = []
+        for gf, gt, exp in runs:
+            same = next((r for r in existing if (r.grade_from, r.grade_to, _aware(r.expires_at)) == (gf, gt, exp)), None)
+            if same is not None:
+                existing.remove(same)
+            else:
+                todo.append((gf, gt, exp))
+        for gf, gt, exp in todo:
+            if existing:
+                row = existing.pop(0)
+                row.grade_from, row.grade_to, row.expires_at = gf, gt, exp
             else:
-                g.expires_at = max(g.expires_at, exp_dt)
-            merged = True
-            break
+                s.add(EntGrant(user_id=user_id, plan=plan, subject=subj, grade_from=gf, grade_to=gt, expires_at=exp))
+                added += 1
+        for r in existing:
+            s.delete(r)
+            removed += 1
+    return added, removed
+
+
+def add_access_many(
+    user_id: str,
+    scopes: Iterable[dict],
+    expires_at: Optional[int | datetime] = None,
+) -> int:
+    """
+    一個 transaction 寫入多個 scope（格式見 add_access），同用戶現有 grant 一齊合併。
+    會鎖住該用戶：並發 / 重複寫入最後都收斂成同一組唔重疊嘅 grant。
+    回傳有效 scope 數（年級無效嘅略過）。
+    """
+    if not user_id:
+        return 0
+    exp_dt = _expiry_dt(expires_at)
+    new = []
+    for scope in scopes:
+        norm = _normalize_scope(scope)
+        if norm is not None:
+            new.append((*norm, exp_dt))
+    if not new:
+        return 0
+
+    with SessionLocal() as s, s.begin():
+        _lock_customer(s, user_id)
+        _merge_grants(s, user_id, new)
+        # 已經鎖住 customers 行：+1 唔會撞
+        s.query(Customer).filter(Customer.user_id == user_id).update(
+            {Customer.grant_version: Customer.grant_version + 1}, synchronize_session=False
+        )
+        version = s.query(Customer.grant_version).filter(Customer.user_id == user_id).scalar()
+    entitlement_cache.invalidate(user_id)
+    grant_versions.set(user_id, int(version or 0))
+    return len(new)
+
+
+def add_access(
+    user_id: str,
+    scope: dict,
+    expires_at: Optional[int | datetime] = None,
+) -> bool:
+    """
+    scope 範例：
+      - {"plan":"pro"}  → Pro 通配（科目不限、年級 1..6）
+      - {"plan":"starter","subject":"math","grade":"grade1"}
+      - {"plan":"pro","subject":"chinese","grade":"grade3"}（Pro 自選 2 組時各寫一筆）
+      - 區間也可：{"plan":"starter","subject":"chinese","grade_from":1,"grade_to":3}
+    合併規則：相同 plan + 相同 subject（或通配 None）且年級區間相交/相鄰 → 合併
+    """
+    return add_access_many(user_id, [scope], expires_at) > 0
 
-        if not merged:
-            s.add(
-                EntGrant(
-                    user_id=user_id,
-                    plan=plan,
-                    subject=subj_val,  # None = 通配
-                    grade_from=gf,
-                    grade_to=gt,
-                    expires_at=exp_dt,
-                )
-            )
-    return True
+
+def compact_grants(user_id: Optional[str] = None) -> Dict[str, int]:
+    """
+    合併碎片化 grant（舊版 add_access 並發留落嘅重疊 / 相鄰行）。
+    冇指定 user 就搵晒有同組多行嘅用戶，每個用戶一個細 transaction。
+    """
+    if user_id:
+        users = [user_id]
+    else:
+        with SessionLocal() as s:
+            users = [
+                r[0]
+                for r in s.query(EntGrant.user_id)
+                .group_by(EntGrant.user_id, EntGrant.plan, EntGrant.subject)
+                .having(func.count(EntGrant.id) > 1)
+                .distinct()
+                .all()
+            ]
+    added = removed = 0
+    for uid in users:
+        with SessionLocal() as s, s.begin():
+            _lock_customer(s, uid)
+            a, r = _merge_grants(s, uid, [])
+            added, removed = added + a, removed + r
+        entitlement_cache.invalidate(uid)
+    return {"users": len(users), "added": added, "removed": removed}
 
 
 def get_entitlement(user_id: Optional[str]) -> Optional[dict]:
     if not user_id:
         return None
-    with SessionLocal() as s:
-        grants = s.query(EntGrant).filter(EntGrant.user_id == user_id).all()
-        if not grants:
-            return None
-        # 與舊版回傳結構相容
-        return {
-            "grants": [
-                {
-                    "plan": g.plan,
-                    "subjects": ["*"] if g.subject is None else [g.subject],
-                    "grade_from": g.grade_from,
-                    "grade_to": g.grade_to,
-                    "expires_at": int(g.expires_at.timestamp())
-                    if g.expires_at
-                    else None,
-                }
-                for g in grants
-            ]
-        }
+    # 與舊版回傳結構相容
+    return load_snapshot(user_id).entitlement()
+
+
+def access_bitmap(user_id: Optional[str]) -> AccessBitmap:
+    """用戶而家嘅 subject×grade bitmap（冇 user 就係空 bitmap）。"""
+    if not user_id:
+        return AccessBitmap()
+    return load_snapshot(user_id).bitmap()
+
+
+def access_target(subject_or_slug: str, grade: str | int | None = None) -> Tuple[str, int]:
+    """has_access 嘅參數 → (正規化科目, 年級 1..6；無效 0)。"""
+    # 如果 grade 無傳，而且 subject_or_slug 裏面有 "/"，當 slug 用：
+    if grade is None and "/" in (subject_or_slug or ""):
+        return _parse_subject_grade_from_slug(subject_or_slug)
+    return _norm_subject(subject_or_slug), _parse_grade_to_num(grade)
 
 
 def has_access(
@@ -271,29 +687,52 @@ def has_access(
     if not user_id:
         return False
 
-    # 如果 grade 無傳，而且 subject_or_slug 裏面有 "/"，當 slug 用：
-    subj = ""
-    gnum = 0
-    if grade is None and "/" in (subject_or_slug or ""):
-        subj, gnum = _parse_subject_grade_from_slug(subject_or_slug)
-    else:
-        subj = _norm_subject(subject_or_slug)
-        gnum = _parse_grade_to_num(grade)
-
+    subj, gnum = access_target(subject_or_slug, grade)
     if gnum == 0:
         return False
 
-    now = _now()
+    return load_snapshot(user_id).has_access(subj, gnum)
+
+
+def check_access_many(user_id: Optional[str], slugs) -> Dict[str, bool]:
+    """
+    一次過判斷多個 slug（題包目錄過濾用）：一條 query（或 cache）+ 記憶體內 bit test。
+    slug 語義同 has_access(user_id, slug) 一樣；冇 user 全部 False。
+    """
+    slugs = list(slugs)
+    if not user_id:
+        return {slug: False for slug in slugs}
+    return check_access_bitmap(access_bitmap(user_id), slugs)
+
+
+def check_access_bitmap(bm: AccessBitmap, slugs) -> Dict[str, bool]:
+    out: Dict[str, bool] = {}
+    for slug in slugs:
+        subj, gnum = _parse_subject_grade_from_slug(slug)
+        out[slug] = gnum != 0 and bm.test(subj, gnum)
+    return out
+
+
+def current_grant_version(user_id: str) -> int:
+    """customers.grant_version；cache 新鮮就唔查 DB（一條 PK 查詢）。"""
+    v = grant_versions.get(user_id)
+    if v is not None:
+        return v
     with SessionLocal() as s:
-        q = (
-            s.query(EntGrant)
-            .filter(EntGrant.user_id == user_id)
-            .filter((EntGrant.expires_at.is_(None)) | (EntGrant.expires_at > now))
-            .filter(EntGrant.grade_from <= gnum, EntGrant.grade_to >= gnum)
-        )
-        # subject 命中：通配(None) 或等於
-        q = q.filter((EntGrant.subject.is_(None)) | (EntGrant.subject == subj))
-        return s.query(q.exists()).scalar() or False
+        v = int(s.query(Customer.grant_version).filter(Customer.user_id == user_id).scalar() or 0)
+    grant_versions.set(user_id, v)
+    return v
+
+
+# JWT 入面嘅授權摘要：{"v": grant_version, "p": plan, "a": AccessBitmap.dumps()}
+DIGEST_CLAIM = "ent"
+# 摘要屬於邊個授權 uid（customers.user_id），唔係 auth users.id
+UID_CLAIM = "uid"
+
+
+def entitlement_digest(user_id: str) -> Dict[str, Any]:
+    snap = load_snapshot(user_id)
+    return {"v": snap.version, "p": snap.plan(), "a": snap.bitmap().dumps()}
 
 
 def current_plan(user_id: str) -> str:
@@ -301,19 +740,35 @@ def current_plan(user_id: str) -> str:
     if not user_id:
         return "free"
 
-    with SessionLocal() as s:
-        has_pro = s.query(
-            s.query(EntGrant)
-            .filter(EntGrant.user_id == user_id, EntGrant.plan == "pro")
-            .exists()
-        ).scalar()
-        if has_pro:
-            return "pro"
+    return load_snapshot(user_id).plan()
+
+
+# === async 版本（async handler 用；同步版本照用，兩邊共用 cache） ===
+async def get_entitlement_async(user_id: Optional[str]) -> Optional[dict]:
+    if not user_id:
+        return None
+    return (await load_snapshot_async(user_id)).entitlement()
+
+
+async def has_access_async(
+    user_id: str,
+    subject_or_slug: str,
+    grade: str | int | None = None,
+) -> bool:
+    if not user_id:
+        return False
+    subj, gnum = access_target(subject_or_slug, grade)
+    if gnum == 0:
+        return False
+    return (await load_snapshot_async(user_id)).has_access(subj, gnum)
+
+
+async def current_plan_async(user_id: str) -> str:
+    if not user_id:
+        return "free"
+    return (await load_snapshot_async(user_id)).plan()
 
-        has_starter = s.query(
-            s.query(EntGrant)
-            .filter(EntGrant.user_id == user_id, EntGrant.plan == "starter")
-            .exists()
-        ).scalar()
 
-        return "starter" if has_starter else "free"
+async def entitlement_digest_async(user_id: str) -> Dict[str, Any]:
+    snap = await load_snapshot_async(user_id)
+    return {"v": snap.version, "p": snap.plan(), "a": snap.bitmap().dumps()}
@@ -0,0 +1,120 @@
+# apps/backend/app/facets.py
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .sampling import pick_count, pick_indices
+
+# ETL（tools/pdf_to_csv_multi.py）寫入嘅分類欄
+FACET_FIELDS = ("topic", "lo", "diff")
+# diff 係數字；俾老師用字都得
+DIFF_ALIASES = {"easy": "1", "medium": "2", "hard": "3"}
+
+# field → 值（已正規化）→ 排好序嘅 row index
+Facets = Dict[str, Dict[str, List[int]]]
+
+
+def norm_value(field: str, value: Any) -> str:
+    v = " ".join(str(value or "").split()).lower()
+    if field == "diff":
+        v = DIFF_ALIASES.get(v, v)
+    return v
+
+
+def build_facets(questions: Iterable[Dict[str, Any]]) -> Facets:
+    """倒排索引：每個題包版本建一次（編譯時寫入產物 header；舊產物載入時補建）。"""
+    facets: Facets = {f: {} for f in FACET_FIELDS}
+    for i, q in enumerate(questions):
+        for f in FACET_FIELDS:
+            v = norm_value(f, q.get(f))
+            if v:
+                facets[f].setdefault(v, []).append(i)
+    return facets
+
+
+def parse_filter(raw: Optional[str], field: str) -> List[str]:
+    """"LO-1,LO-2" → 正規化後嘅值 list（同一欄入面係 OR）。"""
+    return [norm_value(field, v) for v in (raw or "").split(",") if v.strip()]
+
+
+def parse_take(raw: Optional[str], field: str) -> List[Tuple[str, int]]:
+    """分層數量："easy:5,hard:5" → [("1", 5), ("3", 5)]；格式錯 raise ValueError。"""
+    out: List[Tuple[str, int]] = []
+    for part in (raw or "").split(","):
+        if not part.strip():
+            continue
+        value, sep, count = part.rpartition(":")
+        if not sep or not value.strip():
+            raise ValueError(f"bad take item {part!r} (expected value:count)")
+        try:
+            n = int(count)
+        except ValueError:
+            raise ValueError(f"bad take count in {part!r} (expected an integer)") from None
+        out.append((norm_value(field, value), max(0, n)))
+    return out
+
+
+def select_rows(facets: Facets, filters: Dict[str, List[str]]) -> Optional[List[int]]:
+    """
+    篩選：同一欄 OR、唔同欄 AND。冇篩選回傳 None（= 全部行）。
+    結果排好序，所以有 seed 時抽出嚟嘅題目可重現。
+    """
+    pool: Optional[set] = None
+    for field, values in filters.items():
+        if not values:
+            continue
+        index = facets.get(field) or {}
+        rows: set = set()
+        for v in values:
+            rows.update(index.get(v, ()))
+        pool = rows if pool is None else pool & rows
+        if not pool:
+            return []
+    return None if pool is None else sorted(pool)
+
+
+def sample_pool(pool: Sequence[int], k: int, rnd) -> List[int]:
+    return [pool[i] for i in pick_indices(len(pool), k, rnd)]
+
+
+def stratified(
+    facets: Facets, pool: Optional[Sequence[int]], by: str, take: Sequence[Tuple[str, int]], rnd
+) -> List[int]:
+    """
+    每層（by 欄嘅某個值）喺篩選結果入面抽指定數量，之後合埋洗牌。
+    某層唔夠就有幾多抽幾多；同一個值寫兩次唔會抽重複題。
+    """
+    base = None if pool is None else set(pool)
+    picked: List[int] = []
+    for value, count in take:
+        rows = (facets.get(by) or {}).get(value, [])
+        taken = set(picked)
+        layer = [i for i in rows if (base is None or i in base) and i not in taken]
+        picked.extend(sample_pool(layer, count, rnd))
+    rnd.shuffle(picked)
+    return picked
+
+
+def draw(
+    facets: Facets,
+    total: int,
+    filters: Dict[str, List[str]],
+    by: str,
+    take: Sequence[Tuple[str, int]],
+    n: Optional[int],
+    nmin: int,
+    nmax: int,
+    rnd,
+) -> Tuple[List[int], int]:
+    """
+    篩選 + （可選）分層抽題 → (row indices, 篩選後可抽題數)。
+    唔分層時數量規則同 get_quiz 一樣（n 或 [nmin, nmax]），只係喺篩選結果入面抽。
+    """
+    pool = select_rows(facets, filters)
+    size = total if pool is None else len(pool)
+    if take:
+        return stratified(facets, pool, by, take, rnd), size
+    k = pick_count(size, n, nmin, nmax, rnd)
+    if pool is None:
+        return pick_indices(total, k, rnd), size
+    return sample_pool(pool, k, rnd), size
@@ -0,0 +1,118 @@
+# apps/backend/app/grant_sweeper.py
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from database import SessionLocal
+from .entitlements import entitlement_cache
+from .models import Customer, EntGrant
+
+# === 設定 ===
+GRANT_SWEEP_INTERVAL = float(os.getenv("GRANT_SWEEP_INTERVAL", "3600"))  # 秒；0 = 唔自動清
+# 每個 transaction 刪幾多行：鎖同 WAL 都細，唔會阻住 add_access
+GRANT_SWEEP_BATCH = max(1, int(os.getenv("GRANT_SWEEP_BATCH", "500")))
+GRANT_SWEEP_MAX_BATCHES = int(os.getenv("GRANT_SWEEP_MAX_BATCHES", "100"))  # 每輪上限，剩低下輪再清
+# 過期之後留幾耐先刪（客服查得返）
+GRANT_SWEEP_GRACE = float(os.getenv("GRANT_SWEEP_GRACE", str(24 * 3600)))
+
+
+class SweepStats:
+    def __init__(self):
+        self.runs = 0
+        self.deleted = 0
+        self.last_deleted = 0
+        self.last_run_at: Optional[float] = None
+        self.last_seconds = 0.0
+        self.last_error = ""
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "deleted": self.deleted,
+            "last_deleted": self.last_deleted,
+            "last_run_at": self.last_run_at,
+            "last_seconds": self.last_seconds,
+            "last_error": self.last_error,
+        }
+
+
+sweep_stats = SweepStats()
+
+
+def sweep_expired(
+    batch_size: int = GRANT_SWEEP_BATCH,
+    max_batches: int = GRANT_SWEEP_MAX_BATCHES,
+    grace: float = GRANT_SWEEP_GRACE,
+) -> int:
+    """
+    刪走過期超過 grace 秒嘅 grant，每批一個細 transaction（按 expires_at 由舊到新，行 partial index）。
+    同一個 transaction 將受影響用戶嘅 customers.grant_version +1：plan() / entitlement() 睇得到已過期嘅 grant，
+    刪走之後結果會變，JWT 入面嘅授權摘要要知道自己過時。
+    鎖次序同 add_access 一樣（先 customers 再 grant），SKIP LOCKED：正被 add_access 鎖住嘅用戶留俾下一輪。
+    回傳刪咗幾多行。
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=grace)
+    expired = (EntGrant.expires_at.isnot(None), EntGrant.expires_at < cutoff)
+    started = time.perf_counter()
+    total = 0
+    for _ in range(max(1, max_batches)):
+        deleted = 0
+        with SessionLocal() as s, s.begin():
+            candidates = (
+                s.query(EntGrant.id, EntGrant.user_id)
+                .filter(*expired)
+                .order_by(EntGrant.expires_at)
+                .limit(batch_size)
+                .all()
+            )
+            users = sorted({r[1] for r in candidates})
+            locked = [
+                r[0]
+                for r in s.query(Customer.user_id)
+                .filter(Customer.user_id.in_(users))
+                .order_by(Customer.user_id)
+                .with_for_update(skip_locked=True)
+                .all()
+            ] if users else []
+            if locked:
+                ids = [r[0] for r in candidates if r[1] in set(locked)]
+                # 重新對一次條件：鎖之前 add_access 可能已經改寫咗嗰行
+                deleted = (
+                    s.query(EntGrant)
+                    .filter(EntGrant.id.in_(ids), *expired)
+                    .delete(synchronize_session=False)
+                )
+                s.query(Customer).filter(Customer.user_id.in_(locked)).update(
+                    {Customer.grant_version: Customer.grant_version + 1}, synchronize_session=False
+                )
+        for uid in locked:
+            entitlement_cache.invalidate(uid)
+        total += deleted
+        # 唔夠一批 = 清完；成批都鎖唔到 / 冇嘢刪就等下一輪，唔好原地兜圈
+        if len(candidates) < batch_size or not deleted:
+            break
+
+    sweep_stats.runs += 1
+    sweep_stats.deleted += total
+    sweep_stats.last_deleted = total
+    sweep_stats.last_run_at = time.time()
+    sweep_stats.last_seconds = round(time.perf_counter() - started, 3)
+    return total
+
+
+async def sweep_loop() -> None:
+    """每 GRANT_SWEEP_INTERVAL 秒清一次（DB 操作丟去 thread）。"""
+    if GRANT_SWEEP_INTERVAL <= 0:
+        return
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(GRANT_SWEEP_INTERVAL)
+        try:
+            await loop.run_in_executor(None, sweep_expired)
+            sweep_stats.last_error = ""
+        except Exception as e:
+            sweep_stats.last_error = str(e)
@@ -0,0 +1,52 @@
+# apps/backend/app/http_cache.py
+from __future__ import annotations
+
+import hashlib
+import os
+from typing import Any, Dict, Optional
+
+from fastapi import Response
+
+# === Cache-Control 設定（秒） ===
+QUIZ_MAX_AGE = int(os.getenv("QUIZ_CACHE_MAX_AGE", "300"))
+QUIZ_S_MAXAGE = int(os.getenv("QUIZ_CACHE_S_MAXAGE", "3600"))
+PACKS_MAX_AGE = int(os.getenv("PACKS_CACHE_MAX_AGE", "30"))
+PACKS_S_MAXAGE = int(os.getenv("PACKS_CACHE_S_MAXAGE", "120"))
+
+
+def make_etag(*parts: Any) -> str:
+    """由各部分組成 strong ETag（已包引號）。"""
+    h = hashlib.sha1("\x1f".join("" if p is None else str(p) for p in parts).encode("utf-8"))
+    return f'"{h.hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 可以係 "*" 或者逗號分隔多個（可能帶 W/）。"""
+    if not if_none_match or not etag:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+def cache_control(max_age: int, s_maxage: int) -> str:
+    # stale-while-revalidate：CDN 喺背景重新驗證期間仍然可以派舊版
+    return f"public, max-age={max_age}, s-maxage={s_maxage}, stale-while-revalidate={max(s_maxage, 60)}"
+
+
+def cache_headers(etag: str, max_age: int, s_maxage: int) -> Dict[str, str]:
+    # 同一 URL 會按 Accept-Encoding 派唔同壓縮版本，CDN 要分開 cache
+    return {"ETag": etag, "Cache-Control": cache_control(max_age, s_maxage), "Vary": "Accept-Encoding"}
+
+
+def not_modified(headers: Dict[str, str]) -> Response:
+    return Response(status_code=304, headers=headers)
+
+
+NO_STORE = {"Cache-Control": "no-store"}
@@ -0,0 +1,167 @@
+# apps/backend/app/images.py
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# Pillow (optional)：冇裝就只存原圖，唔出縮圖
+try:
+    from PIL import Image
+except ModuleNotFoundError:
+    Image = None
+
+# === 設定 ===
+IMAGE_PREFIX = "img/"
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+IMAGE_WIDTHS = tuple(sorted(int(w) for w in os.getenv("IMAGE_WIDTHS", "320,640,1280").split(",") if w.strip()))
+# 題目 image 欄改寫成邊個闊度（冇呢個闊度就用原圖）
+IMAGE_DEFAULT_WIDTH = int(os.getenv("IMAGE_DEFAULT_WIDTH", "640"))
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "webp").lower()  # webp / jpeg / png
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "80"))
+# 有 CDN / R2 public domain 直出 bucket 就設定，例如 https://img.example.com；否則經 /api/img 派
+IMAGE_PUBLIC_BASE = os.getenv("IMAGE_PUBLIC_BASE", "").rstrip("/")
+
+# 內容決定 key：同一個 URL 永遠係同一堆 bytes，可以 cache 一年
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_DIGEST_LEN = 32
+MANIFEST_NAME = "index.json"
+IMAGE_DIGEST_RE = re.compile(r"[0-9a-f]{%d}" % _DIGEST_LEN)
+IMMUTABLE_RE = re.compile(r"/img/([0-9a-f]{%d})/([a-z0-9]+\.[a-z0-9]+)$" % _DIGEST_LEN)
+VARIANT_NAME_RE = re.compile(r"^(orig|w[0-9]+)\.(png|jpg|gif|webp)$")
+
+# 只收呢幾種（唔收 SVG：可以夾 script）
+_MAGIC = (
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpg"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+)
+_PIL_SAVE = {"webp": ("WEBP", "webp"), "jpeg": ("JPEG", "jpg"), "png": ("PNG", "png")}
+
+
+class ImageRejected(Exception):
+    pass
+
+
+def sniff(data: bytes) -> Optional[str]:
+    for magic, ext in _MAGIC:
+        if data.startswith(magic):
+            return ext
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def content_type(name: str) -> str:
+    return mimetypes.guess_type(name)[0] or ("image/webp" if name.endswith(".webp") else "application/octet-stream")
+
+
+def image_key(digest: str, name: str) -> str:
+    return f"{IMAGE_PREFIX}{digest}/{name}"
+
+
+def identify(data: bytes) -> Tuple[str, str]:
+    """驗證 + 內容 hash → (digest, 副檔名)。"""
+    if not data:
+        raise ImageRejected("empty image")
+    if len(data) > IMAGE_MAX_BYTES:
+        raise ImageRejected(f"image too large (max {IMAGE_MAX_BYTES} bytes)")
+    ext = sniff(data)
+    if ext is None:
+        raise ImageRejected("unsupported image type (png / jpeg / gif / webp)")
+    return hashlib.sha256(data).hexdigest()[:_DIGEST_LEN], ext
+
+
+def make_variants(data: bytes, ext: str) -> List[Tuple[str, bytes]]:
+    """
+    原圖 → [(檔名, bytes), ...]。第一個一定係原圖 orig.<ext>；
+    有 Pillow 就再出比原圖窄嘅 w<闊度>.<IMAGE_FORMAT>（CPU 重，caller 丟去 thread）。
+    """
+    out = [(f"orig.{ext}", data)]
+    if Image is None or ext == "gif":  # GIF 可能係動畫，唔縮
+        return out
+
+    fmt, out_ext = _PIL_SAVE.get(IMAGE_FORMAT, _PIL_SAVE["webp"])
+    try:
+        with Image.open(io.BytesIO(data)) as im:
+            im.load()
+            if fmt == "JPEG" and im.mode not in ("RGB", "L"):
+                im = im.convert("RGB")
+            for w in IMAGE_WIDTHS:
+                if w >= im.width:
+                    break
+                h = max(1, round(im.height * w / im.width))
+                buf = io.BytesIO()
+                im.resize((w, h), Image.LANCZOS).save(buf, format=fmt, quality=IMAGE_QUALITY)
+                out.append((f"w{w}.{out_ext}", buf.getvalue()))
+    except Exception as e:
+        raise ImageRejected(f"cannot decode image: {e}")
+    return out
+
+
+def _parse_manifest(raw: Optional[bytes]) -> Optional[List[str]]:
+    if not raw:
+        return None
+    try:
+        names = json.loads(raw).get("variants")
+    except (ValueError, AttributeError):
+        return None
+    if not isinstance(names, list) or not names or not all(isinstance(n, str) and VARIANT_NAME_RE.match(n) for n in names):
+        return None
+    return names
+
+
+def public_url(digest: str, name: str, api_base: str = "") -> str:
+    if IMAGE_PUBLIC_BASE:
+        return f"{IMAGE_PUBLIC_BASE}/{image_key(digest, name)}"
+    return f"{api_base.rstrip('/')}/api/img/{digest}/{name}"
+
+
+def pick_display(names: List[str]) -> str:
+    """image 欄用邊個版本：IMAGE_DEFAULT_WIDTH 或者最接近而唔大過佢嘅縮圖，冇就原圖。"""
+    best, best_w = names[0], 0
+    for name in names[1:]:
+        w = int(name[1:].split(".")[0])
+        if best_w < w <= IMAGE_DEFAULT_WIDTH:
+            best, best_w = name, w
+    return best
+
+
+async def ingest(storage, data: bytes, api_base: str = "") -> Dict[str, Any]:
+    """
+    存入圖片（內容 hash 做 key）：同一張圖第二次上載唔使再縮圖 / 再寫。
+    回傳 {"digest", "url"（題目 image 欄用）, "variants": {檔名: url}, "existing"}。
+    """
+    digest, ext = identify(data)
+    manifest_key = image_key(digest, MANIFEST_NAME)
+    names = _parse_manifest(await storage.read_blob(manifest_key))
+    existing = names is not None
+    if names is None:
+        loop = asyncio.get_running_loop()
+        variants = await loop.run_in_executor(None, make_variants, data, ext)
+        names = [name for name, _ in variants]
+        await asyncio.gather(
+            *(
+                storage.write_blob(image_key(digest, name), body, content_type(name), IMMUTABLE_CACHE_CONTROL)
+                for name, body in variants
+            )
+        )
+        # manifest 最後寫：有 manifest 就代表全部版本齊晒
+        await storage.write_blob(manifest_key, json.dumps({"variants": names}).encode("utf-8"))
+    return {
+        "digest": digest,
+        "url": public_url(digest, pick_display(names), api_base),
+        "variants": {name: public_url(digest, name, api_base) for name in names},
+        "existing": existing,
+    }
+
+
+def is_immutable_url(value: str) -> bool:
+    return bool(IMMUTABLE_RE.search((value or "").split("?")[0]))
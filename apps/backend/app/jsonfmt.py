@@ -0,0 +1,41 @@
+# apps/backend/app/jsonfmt.py
+from __future__ import annotations
+
+import json
+import os
+from typing import Any, Iterable
+
+# orjson (optional)：有裝而且 JSON_IMPL 唔係 "std" 就用佢
+try:
+    import orjson
+except ModuleNotFoundError:
+    orjson = None
+
+USE_ORJSON = orjson is not None and os.getenv("JSON_IMPL", "orjson").lower() != "std"
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """Compact、UTF-8（唔 escape 中文），同 Starlette JSONResponse 輸出等價。"""
+    if USE_ORJSON:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def assemble_quiz(title: str, fragments: Iterable[bytes], used_url: str, debug: str) -> bytes:
+    """
+    /api/quiz body：題目已經係預先 serialize 好嘅 bytes，直接 join，
+    唔使每個 request 再建 dict + encode。key 次序同舊版一樣。
+    """
+    return b"".join(
+        (
+            b'{"title":',
+            dumps_bytes(title),
+            b',"list":[',
+            b",".join(fragments),
+            b'],"usedUrl":',
+            dumps_bytes(used_url),
+            b',"debug":',
+            dumps_bytes(debug),
+            b"}",
+        )
+    )
@@ -0,0 +1,315 @@
+# apps/backend/app/local_store.py
+from __future__ import annotations
+
+import mmap
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+from .catalog import CATALOG_TTL, make_entry
+from .pack_cache import CachedPack, pack_cache
+from .packs import (
+    PREFIX,
+    READABLE_ARTIFACT_VERSIONS,
+    compile_pack,
+    compile_pack_stream,
+    dump_artifact,
+    normalize_to_utf8,
+    pack_from_artifact,
+    parse_csv_bytes,
+    questions_pack,
+    row_offsets,
+    slug_to_artifact_key,
+    slug_to_key,
+)
+from .storage import ThreadedPackStorage
+from .upload_stream import transcode_chunks
+
+# === 設定（PACK_STORAGE=local 時用）===
+PACK_LOCAL_DIR = os.getenv("PACK_LOCAL_DIR", "./data")
+
+
+def version_token(st: os.stat_result) -> str:
+    """本地檔案嘅版本：mtime + size（同 S3 ETag 一樣包引號，可以直接做 HTTP ETag 嘅一部分）。"""
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def _stat(path: str) -> Optional[os.stat_result]:
+    try:
+        return os.stat(path)
+    except FileNotFoundError:
+        return None
+
+
+def write_atomic(path: str, data: bytes | Iterable[bytes]) -> os.stat_result:
+    """寫 temp file 再 os.replace：讀緊（mmap 緊）舊版本嘅 request 唔受影響。data 可以係逐塊嘅 iterable。"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if isinstance(data, (bytes, bytearray, memoryview)):
+                f.write(data)
+            else:
+                for chunk in data:
+                    f.write(chunk)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return os.stat(path)
+
+
+def _map_file(path: str) -> bytes:
+    """唯讀 mmap；空檔案 mmap 唔到，直接回傳 b""。"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)  # type: ignore[return-value]
+
+
+class LocalUpload:
+    """串流上載寫本地檔案（同 MultipartUpload 一樣嘅介面）；complete 先 rename 到正式位置。"""
+
+    def __init__(self, path: str, run: Callable[..., Any]):
+        self.path = path
+        self._run = run
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, self._tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        self._f = os.fdopen(fd, "wb")
+        self.bytes = 0
+        self.parts = 0
+
+    async def write(self, data: bytes) -> None:
+        await self._run(self._f.write, data)
+        self.bytes += len(data)
+        self.parts += 1
+
+    async def complete(self) -> str:
+        self._f.close()
+        await self._run(os.replace, self._tmp, self.path)
+        return version_token(os.stat(self.path))
+
+    async def abort(self) -> None:
+        self._f.close()
+        try:
+            os.unlink(self._tmp)
+        except OSError:
+            pass
+
+
+class LocalPackStorage(ThreadedPackStorage):
+    """
+    本地目錄做題包儲存（on-prem / CI / 離線 benchmark）：
+    - 佈局同 bucket 一樣：<root>/packs/<slug>.csv + 編譯產物 <root>/packs/<slug>.json
+    - 產物用 mmap 讀：大題包唔使讀入 heap，抽題只 touch 抽中嗰幾行嘅 page
+    - 版本 = mtime + size；產物 header 記住 CSV 版本，對唔上就 fallback 讀 CSV
+    - 目錄直接掃檔案（CATALOG_TTL 內用記憶體）
+    """
+
+    def __init__(self, root: str = PACK_LOCAL_DIR, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.root = os.path.abspath(root)
+        self._catalog: Optional[Dict[str, Any]] = None
+        self._catalog_at = 0.0
+        self._lock = threading.Lock()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    # --- 讀 ---
+    def fetch_local(self, slug: str, prev: Optional[CachedPack] = None) -> Optional[CachedPack]:
+        key = slug_to_key(slug)
+        csv_path = self.path(key)
+        csv_st = _stat(csv_path)
+        if csv_st is None:
+            raise FileNotFoundError(csv_path)
+        csv_token = version_token(csv_st)
+
+        art_key = slug_to_artifact_key(slug)
+        art_path = self.path(art_key)
+        art_st = _stat(art_path)
+        if art_st is not None:
+            token = version_token(art_st)
+            if prev is not None and prev.source == art_key and prev.etag == token:
+                return None
+            raw = _map_file(art_path)
+            try:
+                header, _ = row_offsets(raw)
+                current = header.get("source_etag") == csv_token
+            except ValueError:
+                current = False
+            if current:
+                pack = pack_from_artifact(key, art_key, raw, token)
+                if pack is not None:
+                    return pack
+
+        if prev is not None and prev.source == key and prev.etag == csv_token:
+            return None
+        with open(csv_path, "rb") as f:
+            title, qs = parse_csv_bytes(f.read())
+        return questions_pack(key, csv_token, title, qs, key)
+
+    def load_pack_sync(self, slug: str) -> CachedPack:
+        return pack_cache.get_or_load(slug_to_key(slug), lambda prev: self.fetch_local(slug, prev))
+
+    # --- 寫 ---
+    def compile_sync(self, slug: str, content: bytes, csv_token: str) -> Dict[str, Any]:
+        doc = compile_pack(slug, content, csv_token, normalized=True)
+        write_atomic(self.path(slug_to_artifact_key(slug)), dump_artifact(doc))
+        return doc
+
+    def put_pack_sync(self, slug: str, content: bytes, update_catalog: bool = True) -> Dict[str, Any]:
+        content, encoding = normalize_to_utf8(content)
+        token = version_token(write_atomic(self.path(slug_to_key(slug)), content))
+        compiled = True
+        try:
+            self.compile_sync(slug, content, token)
+        except Exception:
+            compiled = False
+        pack_cache.invalidate(slug_to_key(slug))
+        # 目錄係掃檔案得嚟：清記憶體版本就算更新咗（批量匯入都係咁）
+        self.invalidate_catalog()
+        return {"etag": token, "encoding": encoding, "compiled": compiled, "cataloged": True}
+
+    def republish_sync(self, slug: str, csv_etag: str, encoding: str) -> None:
+        # 逐塊轉碼 / 逐行編譯，唔使成個 CSV 入記憶體；期間檔案再被上載就交俾新上載處理
+        path = self.path(slug_to_key(slug))
+        st = _stat(path)
+        if st is None or version_token(st) != csv_etag:
+            return
+        if encoding != "utf-8":
+            with open(path, "rb") as src:
+                csv_etag = version_token(write_atomic(path, transcode_chunks(src, encoding)))
+        with open(path, "rb") as f:
+            doc = compile_pack_stream(slug, f, "utf-8", csv_etag)
+        write_atomic(self.path(slug_to_artifact_key(slug)), dump_artifact(doc))
+        pack_cache.invalidate(slug_to_key(slug))
+        self.invalidate_catalog()
+
+    # --- 目錄 ---
+    def scan_catalog(self) -> Dict[str, Any]:
+        base = self.path(PREFIX.rstrip("/"))
+        packs: Dict[str, Dict[str, Any]] = {}
+        newest = 0
+        for dirpath, _, files in os.walk(base):
+            for name in files:
+                if not name.endswith(".csv"):
+                    continue
+                full = os.path.join(dirpath, name)
+                st = _stat(full)
+                if st is None:
+                    continue
+                slug = os.path.relpath(full, base)[:-4].replace(os.sep, "/")
+                rows, title = self._artifact_summary(slug, version_token(st))
+                entry = make_entry(slug, size=st.st_size, etag=version_token(st), rows=rows, pack_title=title)
+                entry["updated_at"] = int(st.st_mtime)
+                packs[slug] = entry
+                newest = max(newest, st.st_mtime_ns)
+        return {"v": 1, "version": f"{len(packs)}-{newest:x}", "updated_at": newest // 10**9, "packs": packs}
+
+    def _artifact_summary(self, slug: str, csv_token: str) -> tuple[Optional[int], str]:
+        """只讀產物第一行 header 攞行數同標題；產物舊咗就當未知。"""
+        try:
+            with open(self.path(slug_to_artifact_key(slug)), "rb") as f:
+                header = row_offsets(f.readline())[0]
+        except (OSError, ValueError):
+            return None, ""
+        if header.get("source_etag") != csv_token or header.get("v") not in READABLE_ARTIFACT_VERSIONS:
+            return None, ""
+        return header.get("count"), str(header.get("title") or "")
+
+    def catalog_sync(self) -> Dict[str, Any]:
+        with self._lock:
+            if self._catalog is not None and time.monotonic() - self._catalog_at < CATALOG_TTL:
+                return self._catalog
+        doc = self.scan_catalog()
+        with self._lock:
+            self._catalog, self._catalog_at = doc, time.monotonic()
+        return doc
+
+    def invalidate_catalog(self) -> None:
+        with self._lock:
+            self._catalog = None
+
+    # --- async 介面 ---
+    async def catalog(self) -> Dict[str, Any]:
+        with self._lock:
+            if self._catalog is not None and time.monotonic() - self._catalog_at < CATALOG_TTL:
+                return self._catalog
+        return await self.run(self.catalog_sync)
+
+    async def put_pack(self, slug: str, content: bytes, update_catalog: bool = True) -> Dict[str, Any]:
+        return await self.run(self.put_pack_sync, slug, content, update_catalog)
+
+    async def update_catalog(self, entries: Sequence[Dict[str, Any]]) -> bool:
+        self.invalidate_catalog()
+        return True
+
+    async def republish(self, slug: str, upload: Any, encoding: str, csv_etag: str) -> None:
+        # LocalUpload 已經寫咗正式檔案：直接由檔案做
+        await self.run(self.republish_sync, slug, csv_etag, encoding)
+
+    async def open_upload(self, slug: str) -> LocalUpload:
+        return LocalUpload(self.path(slug_to_key(slug)), self.run)
+
+    async def discard_artifact(self, slug: str) -> None:
+        # 產物 header 記住 CSV 版本，CSV 一改就自動唔用舊產物；清 cache 就夠
+        pack_cache.invalidate(slug_to_key(slug))
+        self.invalidate_catalog()
+
+    def read_blob_sync(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self.path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    async def read_blob(self, key: str) -> Optional[bytes]:
+        return await self.run(self.read_blob_sync, key)
+
+    async def write_blob(
+        self, key: str, data: bytes, content_type: str = "application/json; charset=utf-8", cache_control: Optional[str] = None
+    ) -> None:
+        # 本地檔案冇 metadata：content type 由副檔名推返
+        await self.run(write_atomic, self.path(key), data)
+
+    def read_blob_versioned_sync(self, key: str) -> Tuple[Optional[bytes], Optional[str]]:
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                st = os.fstat(f.fileno())
+                return f.read(), version_token(st)
+        except FileNotFoundError:
+            return None, None
+
+    def write_blob_if_sync(self, key: str, data: bytes, version: Optional[str]) -> bool:
+        # 版本 = mtime + size；process 內用 lock 保護「比較再寫」（本地儲存本身就係單機用）
+        path = self.path(key)
+        with self._lock:
+            st = _stat(path)
+            if (version_token(st) if st is not None else None) != version:
+                return False
+            write_atomic(path, data)
+        return True
+
+    async def read_blob_versioned(self, key: str) -> Tuple[Optional[bytes], Optional[str]]:
+        return await self.run(self.read_blob_versioned_sync, key)
+
+    async def write_blob_if(
+        self, key: str, data: bytes, version: Optional[str], content_type: str = "application/json; charset=utf-8"
+    ) -> bool:
+        return await self.run(self.write_blob_if_sync, key, data, version)
+
+    def location(self, key: str) -> str:
+        return f"file://{self.path(key)}"
+
+    def public_url(self, key: str) -> str:
+        return self.location(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "root": self.root}
@@ -1,41 +1,118 @@
 # apps/backend/app/main.py
 from __future__ import annotations
 
+import asyncio
+import hmac
 import os
-import io
-import csv
-import random
-import re
+import time
+from contextlib import asynccontextmanager
 from typing import Optional, List, Dict, Any
 
-from fastapi import FastAPI, UploadFile, File, Query, HTTPException
-from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi import FastAPI, UploadFile, File, Query, HTTPException, Header, Request, BackgroundTasks, Depends
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from pydantic import BaseModel
 
 # routers
 from .routers.report import router as report_router
 from .billing_stripe import router as billing_router
-from auth import auth_router
+from auth import TokenEntitlement, auth_router, optional_token_entitlement
+from .pack_cache import pack_cache
+from .catalog import filter_items
+from .packs import PREFIX, is_valid_slug, slug_to_key
+from .quiz_mix import MIX_MAX_PACKS, load_packs, mix_quiz
+from .http_cache import (
+    NO_STORE,
+    PACKS_MAX_AGE,
+    PACKS_S_MAXAGE,
+    QUIZ_MAX_AGE,
+    QUIZ_S_MAXAGE,
+    cache_headers,
+    etag_matches,
+    make_etag,
+    not_modified,
+)
+from .jsonfmt import assemble_quiz, dumps_bytes
+from .facets import FACET_FIELDS, draw, parse_filter, parse_take
+from .compression import CompressionMiddleware, negotiate, stats as compression_stats, variant_cache
+from .sampling import make_rng, pick_count, pick_indices
+from .storage import get_storage, set_storage, ThreadedPackStorage
+from .local_store import LocalPackStorage
+from .s3_client import s3_registry, S3ConfigError
+from .upload_stream import CsvStreamValidator, UploadRejected, UPLOAD_MAX_BYTES
+from .bulk_import import ArchiveRejected, BULK_CONCURRENCY, import_archive
+from .images import (
+    IMAGE_DIGEST_RE,
+    IMMUTABLE_CACHE_CONTROL,
+    VARIANT_NAME_RE,
+    ImageRejected,
+    content_type as image_content_type,
+    image_key,
+    ingest as ingest_image,
+)
+from .warmup import access_stats, flush_access_stats, flush_loop, warm_up, warmup_state
+from .entitlements import check_access_many, entitlement_cache
+from .grant_sweeper import sweep_loop, sweep_stats
+from database import pool_stats, warm_pool
 
 try:
     from .entitlements import router as entitlements_router
 except Exception:
     entitlements_router = None
 
-# boto3 (optional)
-try:
-    import boto3
-    from botocore.config import Config
-except ModuleNotFoundError:
-    boto3 = None
-    Config = None
+
+# 題包儲存後端：s3（預設，R2）或者 local（PACK_LOCAL_DIR 目錄，on-prem / CI / benchmark）
+PACK_STORAGE = os.getenv("PACK_STORAGE", "s3").strip().lower()
+if PACK_STORAGE == "local":
+    set_storage(LocalPackStorage())
+
+# POST /api/packs/access 一次最多幾多個 slug
+ACCESS_MAX_SLUGS = int(os.getenv("ACCESS_MAX_SLUGS", "2000"))
+
+
+class FastJSONResponse(JSONResponse):
+    """全 app 預設 response class：有 orjson 就用 orjson render（JSON_IMPL=std 可關）。"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps_bytes(content)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 背景執行：R2 / DB 慢或者未設定都唔會阻住 boot，/health 照常即刻答
+    storage = get_storage()
+    warm_db = warm_pool if os.getenv("DATABASE_URL") else None
+    tasks = [
+        asyncio.create_task(warm_up(storage, warm_s3=PACK_STORAGE != "local", warm_db=warm_db)),
+        asyncio.create_task(flush_loop(storage)),
+    ]
+    if warm_db is not None:
+        tasks.append(asyncio.create_task(sweep_loop()))
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        storage = get_storage()
+        try:
+            await flush_access_stats(storage)
+        except Exception:
+            pass
+        if isinstance(storage, ThreadedPackStorage):
+            storage.shutdown()
 
 
 app = FastAPI(
     title="Study Game API",
     version=os.getenv("APP_VERSION", "0.1.0"),
+    default_response_class=FastJSONResponse,
+    lifespan=lifespan,
 )
 
+# 其他 route 嘅即時壓縮；/api/packs 同有 seed 嘅 /api/quiz 已經預先壓縮，會直接放行
+app.add_middleware(CompressionMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -76,54 +153,55 @@ def version():
 
 
 # =========================================================
-# S3 (Cloudflare R2) - lazy init (唔會阻止 app boot)
+# Internal metrics（要設定 INTERNAL_TOKEN，request 帶 X-Internal-Token）
 # =========================================================
-PREFIX = "packs/"
-_slug_re = re.compile(r"^[a-z0-9/_-]+$", re.I)
+def _require_internal(token: Optional[str]) -> None:
+    # 冇設定 INTERNAL_TOKEN 就當冇呢啲 route（預設唔對外開放）
+    expected = os.getenv("INTERNAL_TOKEN", "").strip()
+    if not expected:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest((token or "").strip().encode(), expected.encode()):
+        raise HTTPException(status_code=403, detail="forbidden")
+
+
+@app.get("/internal/metrics")
+def internal_metrics(x_internal_token: Optional[str] = Header(default=None, alias="X-Internal-Token")):
+    _require_internal(x_internal_token)
+    return {
+        "pack_cache": pack_cache.stats(),
+        "s3": s3_registry.stats(),
+        "storage": get_storage().stats(),
+        "entitlements": {**entitlement_cache.stats(), "sweeper": sweep_stats.snapshot()},
+        "compression": {"variants": variant_cache.stats(), **compression_stats.snapshot()},
+        "warmup": warmup_state.snapshot(),
+        "db": pool_stats(),
+    }
+
 
+@app.get("/internal/warmup")
+def internal_warmup(x_internal_token: Optional[str] = Header(default=None, alias="X-Internal-Token")):
+    _require_internal(x_internal_token)
+    return {**warmup_state.snapshot(), "access_pending": access_stats.pending()}
+
+
+# =========================================================
+# S3 (Cloudflare R2) - lazy init (唔會阻止 app boot)
+# =========================================================
 def validate_slug(slug: str) -> str:
     slug = (slug or "").strip().strip("/")
-    if not slug or ".." in slug or not _slug_re.fullmatch(slug):
+    if not is_valid_slug(slug):
         raise HTTPException(status_code=400, detail="invalid slug")
     return slug
 
-def slug_to_key(slug: str) -> str:
-    return f"{PREFIX}{slug}.csv"
-
-def smart_decode(b: bytes) -> str:
-    for enc in ("utf-8-sig", "utf-8", "cp950", "big5", "gb18030"):
-        try:
-            return b.decode(enc)
-        except Exception:
-            continue
-    return b.decode("utf-8", errors="replace")
-
 def get_s3_client():
     """
     ✅ Lazy init：就算你未設定 S3/R2 env，/health 仍然可以起服務
+    ✅ 全 process 共用一個 client（連線池 + keep-alive），唔再每個 request 重新建立
     """
-    if boto3 is None:
-        raise HTTPException(500, "boto3 not installed")
-
-    bucket = os.getenv("S3_BUCKET")
-    ak = os.getenv("S3_ACCESS_KEY")
-    sk = os.getenv("S3_SECRET_KEY")
-
-    if not bucket or not ak or not sk:
-        raise HTTPException(500, "Missing S3 env vars: S3_BUCKET/S3_ACCESS_KEY/S3_SECRET_KEY")
-
-    endpoint = os.getenv("S3_ENDPOINT") or None
-    region = os.getenv("S3_REGION", "auto")
-
-    s3 = boto3.client(
-        "s3",
-        endpoint_url=endpoint,
-        aws_access_key_id=ak,
-        aws_secret_access_key=sk,
-        region_name=region,
-        config=Config(s3={"addressing_style": "path"}) if Config else None,
-    )
-    return s3, bucket
+    try:
+        return s3_registry.get()
+    except S3ConfigError as e:
+        raise HTTPException(500, str(e))
 
 
 # =========================================================
@@ -138,130 +216,379 @@ async def upload_csv(slug: str, file: UploadFile = File(...)):
     if not content:
         raise HTTPException(status_code=400, detail="empty file")
 
-    key = f"packs/{slug}.csv"
-
-    s3, bucket = get_s3_client()
+    key = slug_to_key(slug)
+    storage = get_storage()
+    try:
+        url = storage.public_url(key)
+    except S3ConfigError as e:
+        raise HTTPException(500, str(e))
 
     try:
-        s3.put_object(
-            Bucket=bucket,
-            Key=key,
-            Body=content,
-            ContentType="text/csv",
-        )
+        result = await storage.put_pack(slug, content)
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"S3 put_object failed: {e}")
+    compiled, cataloged = result["compiled"], result["cataloged"]
 
     return {
         "ok": True,
         "slug": slug,
         "key": key,
-        "url": f"https://{bucket}.r2.cloudflarestorage.com/{key}",
+        "url": url,
         "size": len(content),
+        "encoding": result.get("encoding", ""),
+        "compiled": compiled,
+        "cataloged": cataloged,
     }
 
 
-@app.get("/api/packs")
-def list_packs():
-    s3, bucket = get_s3_client()
-
-    items: List[Dict[str, Any]] = []
-    kwargs = {"Bucket": bucket, "Prefix": PREFIX, "MaxKeys": 1000}
-    while True:
-        resp = s3.list_objects_v2(**kwargs)
-        for obj in resp.get("Contents", []):
-            key = obj["Key"]
-            if not key.endswith(".csv"):
+@app.post("/api/upload/stream")
+async def upload_csv_stream(request: Request, background: BackgroundTasks, slug: str = Query(...)):
+    """
+    大檔案上載：request body 直接係 CSV（唔係 multipart form），
+    邊收邊驗編碼同 header，湊夠一個 part 就寫去 S3 multipart，記憶體只用一個 part。
+    """
+    slug = validate_slug(slug)
+    slug = slug.replace(":", "/").replace("\\", "/").strip("/")
+
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"file too large (max {UPLOAD_MAX_BYTES} bytes)")
+
+    key = slug_to_key(slug)
+    storage = get_storage()
+    try:
+        url = storage.public_url(key)
+        upload = await storage.open_upload(slug)
+    except S3ConfigError as e:
+        raise HTTPException(500, str(e))
+
+    validator = CsvStreamValidator()
+    started = time.perf_counter()
+    try:
+        async for chunk in request.stream():
+            if not chunk:
                 continue
-            slug = key[len(PREFIX):-4]
-            parts = slug.split("/")
-            title = parts[-1].replace("-", " ").title() if parts else slug
-            subject = parts[0] if len(parts) > 0 else ""
-            grade = parts[1] if len(parts) > 1 else ""
-            items.append({"slug": slug, "title": title, "subject": subject, "grade": grade})
+            if upload.bytes + len(chunk) > UPLOAD_MAX_BYTES:
+                raise UploadRejected(413, f"file too large (max {UPLOAD_MAX_BYTES} bytes)")
+            validator.feed(chunk)
+            await upload.write(chunk)
+        validator.feed(b"", final=True)
+        csv_etag = await upload.complete()
+    except UploadRejected as e:
+        await upload.abort()
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except Exception as e:
+        await upload.abort()
+        raise HTTPException(status_code=502, detail=f"S3 multipart upload failed: {e}")
+    elapsed = time.perf_counter() - started
 
-        if resp.get("IsTruncated") and resp.get("NextContinuationToken"):
-            kwargs["ContinuationToken"] = resp["NextContinuationToken"]
-        else:
-            break
-    return items
+    # 舊 sidecar 即刻作廢，背景重新編譯之前讀取會 fallback 去新 CSV
+    await storage.discard_artifact(slug)
+    background.add_task(storage.republish, slug, upload, validator.encoding, csv_etag)
+
+    return {
+        "ok": True,
+        "slug": slug,
+        "key": key,
+        "url": url,
+        "size": upload.bytes,
+        "parts": upload.parts,
+        "encoding": validator.encoding,
+        "seconds": round(elapsed, 3),
+        "throughput_mbps": round(upload.bytes / elapsed / 1e6, 3) if elapsed > 0 else None,
+    }
+
+
+@app.post("/api/upload/bulk")
+async def upload_bulk(
+    file: UploadFile = File(..., description="zip / tar / tar.gz，入面係 subject/grade/name.csv"),
+    concurrency: int = Query(BULK_CONCURRENCY, ge=1, le=32),
+    dry_run: bool = Query(False),
+):
+    """批量匯入：並發寫入題包，目錄最後一次過更新；回傳每個檔案嘅報告同時間。"""
+    storage = get_storage()
+    try:
+        storage.location(PREFIX)
+        result = await import_archive(storage, file.file, concurrency=concurrency, dry_run=dry_run)
+    except S3ConfigError as e:
+        raise HTTPException(500, str(e))
+    except ArchiveRejected as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"ok": not result["summary"].get("failed") and not result["summary"]["aborted"], **result}
+
+
+@app.post("/api/images")
+async def upload_image(request: Request, file: UploadFile = File(...)):
+    """
+    題目圖片：按內容 hash 存，同時出縮圖；回傳嘅 url 可以直接填入 CSV 嘅 image 欄。
+    同一張圖再上載唔會重新處理。
+    """
+    data = await file.read()
+    try:
+        return {"ok": True, **await ingest_image(get_storage(), data, str(request.base_url))}
+    except ImageRejected as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except S3ConfigError as e:
+        raise HTTPException(500, str(e))
+
+
+@app.get("/api/img/{digest}/{name}")
+async def get_image(
+    digest: str,
+    name: str,
+    if_none_match: Optional[str] = Header(default=None, alias="If-None-Match"),
+):
+    # URL 由內容決定，永遠唔會變：cache 一年 + immutable（瀏覽器連 revalidate 都唔使）
+    if not IMAGE_DIGEST_RE.fullmatch(digest) or not VARIANT_NAME_RE.fullmatch(name):
+        raise HTTPException(404, "not found")
+    headers = {"ETag": f'"{digest}-{name}"', "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+    if etag_matches(if_none_match, headers["ETag"]):
+        return not_modified(headers)
+    try:
+        data = await get_storage().read_blob(image_key(digest, name))
+    except S3ConfigError as e:
+        raise HTTPException(500, str(e))
+    if data is None:
+        raise HTTPException(404, "not found")
+    return Response(data, media_type=image_content_type(name), headers=headers)
+
+
+@app.get("/api/packs")
+async def list_packs(
+    subject: str = Query(""),
+    grade: str = Query(""),
+    if_none_match: Optional[str] = Header(default=None, alias="If-None-Match"),
+    accept_encoding: Optional[str] = Header(default=None, alias="Accept-Encoding"),
+):
+    try:
+        doc = await get_storage().catalog()
+    except S3ConfigError as e:
+        raise HTTPException(500, str(e))
+
+    # manifest 每次寫入 version +1，所以 version + 篩選條件就足夠做 ETag
+    headers = cache_headers(
+        make_etag("packs", doc.get("version"), doc.get("updated_at"), subject.lower(), grade.lower()),
+        PACKS_MAX_AGE,
+        PACKS_S_MAXAGE,
+    )
+    if etag_matches(if_none_match, headers["ETag"]):
+        return not_modified(headers)
+    # 同一目錄版本 + 篩選嘅 body 固定：壓縮版本按 ETag cache 住，每個版本只壓一次
+    body, headers = await negotiate(
+        dumps_bytes(filter_items(doc, subject, grade)), headers["ETag"], headers, accept_encoding
+    )
+    return Response(body, media_type="application/json; charset=utf-8", headers=headers)
+
+
+class AccessQuery(BaseModel):
+    slugs: List[str] = []
+
+
+# 逐個用戶唔同：唔俾共享 cache 存
+_PRIVATE_HEADERS = {"Cache-Control": "private, no-store"}
+
+
+async def _access_map(
+    user_id: Optional[str], slugs: List[str], ent: Optional[TokenEntitlement] = None
+) -> Dict[str, bool]:
+    # 帶 Bearer token 而且 token 嘅授權 uid 同 X-User-Id 一致（或者冇帶 header）：
+    # 由 token 入面嘅授權摘要答（摘要過時 dependency 已經重新讀咗）；否則照舊用 header 查
+    if ent is not None and ent.user_id and (not user_id or user_id == ent.user_id):
+        return ent.check_many(slugs)
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(None, check_access_many, user_id, slugs)
+    except RuntimeError as e:  # 冇 DATABASE_URL
+        raise HTTPException(500, str(e))
+
+
+@app.get("/api/packs/access")
+async def list_packs_access(
+    subject: str = Query(""),
+    grade: str = Query(""),
+    x_user_id: Optional[str] = Header(default=None, alias="X-User-Id"),
+    ent: Optional[TokenEntitlement] = Depends(optional_token_entitlement),
+):
+    """
+    題包目錄 + 每個題包加 "access"（呢個用戶開唔開得）：Packs 頁一個 request 搞掂，
+    唔使逐個 has_access。授權只查一次 DB（有 cache 就零次）。
+    """
+    try:
+        doc = await get_storage().catalog()
+    except S3ConfigError as e:
+        raise HTTPException(500, str(e))
+    items = filter_items(doc, subject, grade)
+    access = await _access_map(x_user_id, [e["slug"] for e in items], ent)
+    packs = [{**e, "access": access[e["slug"]]} for e in items]
+    return FastJSONResponse(
+        {"version": doc.get("version"), "packs": packs, "allowed": sum(access.values())},
+        headers=_PRIVATE_HEADERS,
+    )
+
+
+@app.post("/api/packs/access")
+async def check_packs_access(
+    body: AccessQuery,
+    x_user_id: Optional[str] = Header(default=None, alias="X-User-Id"),
+    ent: Optional[TokenEntitlement] = Depends(optional_token_entitlement),
+):
+    """指定一批 slug 判斷授權 → {"access": {slug: bool}}。"""
+    if len(body.slugs) > ACCESS_MAX_SLUGS:
+        raise HTTPException(400, f"too many slugs (max {ACCESS_MAX_SLUGS})")
+    access = await _access_map(x_user_id, [s.strip().strip("/") for s in body.slugs], ent)
+    return FastJSONResponse({"access": access}, headers=_PRIVATE_HEADERS)
 
 
 @app.get("/api/quiz")
-def get_quiz(
+async def get_quiz(
     slug: str = Query(""),
     n: Optional[int] = Query(None),
     nmin: int = Query(10),
     nmax: int = Query(15),
     seed: Optional[str] = Query(None),
+    topic: Optional[str] = Query(None, description="篩選 topic（逗號分隔 = 任一）"),
+    lo: Optional[str] = Query(None, description="篩選 learning objective，例如 LO-X"),
+    diff: Optional[str] = Query(None, description="篩選難度：1,2,3 或 easy / medium / hard"),
+    by: str = Query("diff", description="分層欄位：topic / lo / diff"),
+    take: Optional[str] = Query(None, description="分層數量，例如 easy:5,hard:5（會取代 n / nmin / nmax）"),
+    if_none_match: Optional[str] = Header(default=None, alias="If-None-Match"),
+    accept_encoding: Optional[str] = Header(default=None, alias="Accept-Encoding"),
 ):
     try:
         slug = validate_slug(slug)
     except HTTPException:
         return JSONResponse({"title": "", "list": []}, media_type="application/json; charset=utf-8")
 
-    s3, bucket = get_s3_client()
+    if by not in FACET_FIELDS:
+        raise HTTPException(400, f"by must be one of {', '.join(FACET_FIELDS)}")
+    filters = {"topic": parse_filter(topic, "topic"), "lo": parse_filter(lo, "lo"), "diff": parse_filter(diff, "diff")}
+    try:
+        strata = parse_take(take, by)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    faceted = bool(strata) or any(filters.values())
+
     key = slug_to_key(slug)
+    storage = get_storage()
+    try:
+        used_url = storage.location(key)
+    except S3ConfigError as e:
+        raise HTTPException(500, str(e))
 
     try:
-        obj = s3.get_object(Bucket=bucket, Key=key)
+        pack = await storage.load_pack(slug)
+        access_stats.hit(slug)
     except Exception:
         return JSONResponse(
-            {"title": "", "list": [], "usedUrl": f"s3://{bucket}/{key}", "debug": "s3 get_object failed"},
+            {"title": "", "list": [], "usedUrl": used_url, "debug": "s3 get_object failed"},
             media_type="application/json; charset=utf-8",
         )
 
-    raw = obj["Body"].read()
-    text = smart_decode(raw)
-    rows = list(csv.DictReader(io.StringIO(text)))
-
-    pack_title = ""
-    for r in rows:
-        t = (r.get("title") or r.get("標題") or "").strip()
-        if t:
-            pack_title = t
-            break
-
-    qs: List[Dict[str, Any]] = []
-    for i, r in enumerate(rows, start=1):
-        qs.append(
-            {
-                "id": r.get("id") or str(i),
-                "type": r.get("type") or r.get("kind") or "",
-                "question": r.get("question") or r.get("題目") or "",
-                "choiceA": r.get("choiceA") or r.get("A") or "",
-                "choiceB": r.get("choiceB") or r.get("B") or "",
-                "choiceC": r.get("choiceC") or r.get("C") or "",
-                "choiceD": r.get("choiceD") or r.get("D") or "",
-                "answer": r.get("answer") or r.get("答案") or "",
-                "answers": r.get("answers") or "",
-                "explain": r.get("explain") or r.get("解析") or "",
-                "image": r.get("image") or "",
-                "pairs": r.get("pairs") or r.get("Pairs") or "",
-                "left": r.get("left") or r.get("Left") or "",
-                "right": r.get("right") or r.get("Right") or "",
-                "answerMap": r.get("answerMap") or r.get("map") or r.get("index") or "",
-            }
+    # 有 seed 時結果只取決於題包版本 + 參數 → 可以俾 CDN / 瀏覽器 cache；冇 seed 每次都唔同
+    if seed:
+        parts = [pack.etag, slug, n, nmin, nmax, seed]
+        if faceted:
+            parts += [topic, lo, diff, by, take]
+        headers = cache_headers(make_etag("quiz", *parts), QUIZ_MAX_AGE, QUIZ_S_MAXAGE)
+        if etag_matches(if_none_match, headers["ETag"]):
+            return not_modified(headers)
+    else:
+        headers = dict(NO_STORE)
+
+    pack_title = pack.title
+    total = pack.count
+    pool_size = total
+    qs: List[bytes] = []
+    if total > 0:
+        # 只抽 index，再攞抽中嗰幾行預先 serialize 好嘅 JSON（唔使 materialize / encode 全部題目）
+        rnd = make_rng(seed)
+        try:
+            if faceted:
+                # 篩選 / 分層：用題包版本嘅倒排索引，唔使掃晒所有行（舊 remote 題包冇索引就補建）
+                facets = await storage.ensure_facets(pack)
+                indices, pool_size = draw(facets, total, filters, by, strata, n, nmin, nmax, rnd)
+            else:
+                indices = pick_indices(total, pick_count(total, n, nmin, nmax, rnd), rnd)
+            qs = await storage.load_rows_json(pack, indices)
+        except Exception:
+            return JSONResponse(
+                {"title": "", "list": [], "usedUrl": used_url, "debug": "s3 range read failed"},
+                media_type="application/json; charset=utf-8",
+            )
+    picked = len(qs)
+
+    debug_msg = f"rows={total}, picked={picked}" + (f", matched={pool_size}" if faceted else "")
+    debug_msg += f", seed={seed}" if seed else ""
+    body = assemble_quiz(pack_title, qs, used_url, debug_msg)
+    if seed:
+        # 有 seed：body 由 ETag 決定，壓縮版本可以重用；冇 seed 就交俾 middleware 即時壓
+        # 每個 seed 一份、重用率低：用即時壓縮等級，唔好用 q11
+        body, headers = await negotiate(body, headers["ETag"], headers, accept_encoding, precompress=False)
+    return Response(body, media_type="application/json; charset=utf-8", headers=headers)
+
+
+@app.get("/api/quiz/mix")
+async def get_mixed_quiz(
+    slugs: str = Query("", description="逗號分隔，例如 math/grade3/a,math/grade3/b"),
+    prefix: str = Query("", description="揀晒目錄入面某個前綴底下嘅題包，例如 math/grade3"),
+    per: Optional[int] = Query(None, description="每包抽幾多；唔俾就用 n / nmin-nmax 做總數"),
+    n: Optional[int] = Query(None),
+    nmin: int = Query(10),
+    nmax: int = Query(15),
+    seed: Optional[str] = Query(None),
+    if_none_match: Optional[str] = Header(default=None, alias="If-None-Match"),
+    accept_encoding: Optional[str] = Header(default=None, alias="Accept-Encoding"),
+):
+    wanted = [validate_slug(s) for s in slugs.split(",") if s.strip()]
+    storage = get_storage()
+    if prefix:
+        prefix = validate_slug(prefix) + "/"
+        try:
+            doc = await storage.catalog()
+        except S3ConfigError as e:
+            raise HTTPException(500, str(e))
+        wanted += [e["slug"] for e in filter_items(doc) if e["slug"].startswith(prefix)]
+    wanted = sorted(set(wanted))
+    if not wanted:
+        raise HTTPException(400, "no packs selected (slugs or prefix)")
+    if len(wanted) > MIX_MAX_PACKS:
+        raise HTTPException(400, f"too many packs ({len(wanted)} > {MIX_MAX_PACKS})")
+
+    try:
+        used_url = storage.location(PREFIX + prefix) if prefix else ""
+    except S3ConfigError as e:
+        raise HTTPException(500, str(e))
+
+    # 並發載入（有上限）；個別題包失敗照抽其餘嘅
+    loaded = await load_packs(storage, wanted)
+    packs = {s: p for s, p in loaded.items() if not isinstance(p, BaseException)}
+    failed = [s for s in wanted if s not in packs]
+    for s in packs:
+        access_stats.hit(s)
+
+    # 有 seed 而且全部載入成功：結果只取決於各題包版本 + 參數
+    if seed and not failed:
+        versions = [f"{s}={packs[s].etag}" for s in wanted]
+        headers = cache_headers(make_etag("mix", *versions, per, n, nmin, nmax, seed), QUIZ_MAX_AGE, QUIZ_S_MAXAGE)
+        if etag_matches(if_none_match, headers["ETag"]):
+            return not_modified(headers)
+    else:
+        headers = dict(NO_STORE)
+
+    try:
+        qs, summary = await mix_quiz(storage, packs, per=per, n=n, nmin=nmin, nmax=nmax, seed=seed)
+    except Exception:
+        return FastJSONResponse(
+            {"title": "", "list": [], "usedUrl": used_url, "debug": "s3 range read failed"},
+            headers=dict(NO_STORE),
         )
 
-    total = len(qs)
-    picked = 0
-    if total > 0:
-        rnd = random.Random(str(seed)) if seed else random
-        if n and n > 0:
-            k = min(max(1, n), total)
-        else:
-            lo, hi = sorted([nmin, nmax])
-            lo = max(1, lo)
-            hi = max(lo, hi)
-            k = min(rnd.randint(lo, hi), total)
-        qs_copy = qs[:]
-        rnd.shuffle(qs_copy)
-        qs = qs_copy[:k]
-        picked = len(qs)
-
-    debug_msg = f"rows={total}, picked={picked}" + (f", seed={seed}" if seed else "")
-    return JSONResponse(
-        {"title": pack_title, "list": qs, "usedUrl": f"s3://{bucket}/{key}", "debug": debug_msg},
-        media_type="application/json; charset=utf-8",
-    )
+    titles = [p["title"] for p in summary if p["title"]]
+    title = " + ".join(titles[:3]) + (" …" if len(titles) > 3 else "")
+    debug_msg = f"packs={len(packs)}, picked={len(qs)}" + (f", seed={seed}" if seed else "")
+    if failed:
+        debug_msg += f", failed={','.join(failed)}"
+    body = dumps_bytes({"title": title, "list": qs, "packs": summary, "usedUrl": used_url, "debug": debug_msg})
+    if "ETag" in headers:
+        body, headers = await negotiate(body, headers["ETag"], headers, accept_encoding, precompress=False)
+    return Response(body, media_type="application/json; charset=utf-8", headers=headers)
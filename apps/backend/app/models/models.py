@@ -25,6 +25,8 @@ class Customer(Base):
 
     email: Mapped[Optional[str]] = mapped_column(String, nullable=True, index=True)
     stripe_customer_id: Mapped[Optional[str]] = mapped_column(String, nullable=True, index=True)
+    # 每次 add_access +1：JWT 入面嘅授權摘要靠佢判斷係咪過時
+    grant_version: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0, server_default="0")
 
     created_at: Mapped[datetime] = mapped_column(
         TIMESTAMP(timezone=True),
@@ -111,5 +113,20 @@ class EntGrant(Base):
 
 
 Index("ix_ent_grants_user_plan", EntGrant.user_id, EntGrant.plan)
-Index("ix_ent_grants_user_subject", EntGrant.user_id, EntGrant.subject)
+# 授權查詢（entitlements.load_snapshot）：按 user 攞晒 grant，INCLUDE 埋其餘欄（連 ORDER BY 用嘅 id）→ index-only scan
+# （取代舊 ix_ent_grants_user_subject：佢係呢個 index 嘅前綴）
+Index(
+    "ix_ent_grants_access",
+    EntGrant.user_id,
+    EntGrant.subject,
+    EntGrant.grade_from,
+    EntGrant.grade_to,
+    postgresql_include=["plan", "expires_at", "id"],
+)
+# 過期清理（grant_sweeper）：只 index 有到期日嘅行，永久 grant 唔入 index
+Index(
+    "ix_ent_grants_expiring",
+    EntGrant.expires_at,
+    postgresql_where=EntGrant.expires_at.isnot(None),
+)
 Index("ix_subscriptions_user_status", Subscription.user_id, Subscription.status)
@@ -0,0 +1,209 @@
+# apps/backend/app/pack_cache.py
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from .jsonfmt import dumps_bytes
+
+# === 設定（可由環境變數覆蓋） ===
+PACK_CACHE_MAX_ENTRIES = int(os.getenv("PACK_CACHE_MAX_ENTRIES", "256"))
+PACK_CACHE_MAX_BYTES = int(os.getenv("PACK_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+PACK_CACHE_TTL = float(os.getenv("PACK_CACHE_TTL", "30"))  # 秒；過期後用 ETag 重新驗證
+
+
+@dataclass
+class CachedPack:
+    """
+    已正規化的題包，連同來源物件（source）的 ETag。三種形態：
+    - questions：全部題目已 decode（細題包）
+    - buffer + offsets：只留產物 bytes，抽中先 decode（大題包）
+    - 淨 offsets：連 bytes 都唔留，抽中嘅行用 range GET 讀（超大題包，is_remote）
+    """
+
+    key: str
+    etag: str
+    title: str
+    questions: Optional[List[Dict[str, Any]]]
+    size: int = 0
+    source: str = ""
+    checked_at: float = field(default_factory=time.monotonic)
+    buffer: Optional[bytes] = None
+    offsets: Optional[List[int]] = None
+    fragments: Optional[List[bytes]] = None  # 每條題目預先 serialize 好嘅 JSON bytes
+    facets: Optional[Dict[str, Dict[str, List[int]]]] = None  # topic / lo / diff 倒排索引（facets.py）
+
+    @property
+    def count(self) -> int:
+        if self.questions is not None:
+            return len(self.questions)
+        return max(0, len(self.offsets or []) - 1)
+
+    @property
+    def is_remote(self) -> bool:
+        return self.questions is None and self.buffer is None
+
+    def rows(self, indices: Sequence[int]) -> List[Dict[str, Any]]:
+        """本地取行（remote 形態要經 storage 做 range GET）。"""
+        if self.questions is not None:
+            return [self.questions[i] for i in indices]
+        if self.buffer is None or self.offsets is None:
+            raise ValueError("remote pack rows must be read through storage")
+        off = self.offsets
+        return [json.loads(self.buffer[off[i]:off[i + 1]]) for i in indices]
+
+    def row_bytes(self, indices: Sequence[int]) -> List[bytes]:
+        """本地取行嘅 JSON bytes（唔使 decode 再 encode）。"""
+        if self.fragments is not None:
+            return [self.fragments[i] for i in indices]
+        if self.buffer is not None and self.offsets is not None:
+            off = self.offsets
+            return [self.buffer[off[i]:off[i + 1]].rstrip(b"\n") for i in indices]
+        if self.questions is not None:
+            return [dumps_bytes(self.questions[i]) for i in indices]
+        raise ValueError("remote pack rows must be read through storage")
+
+
+def estimate_size(pack: CachedPack) -> int:
+    """粗略估算記憶體佔用（字元數 + 每行固定開銷），只用嚟做上限判斷。"""
+    total = len(pack.buffer or b"") + 8 * len(pack.offsets or [])
+    total += sum(len(f) + 40 for f in pack.fragments or [])
+    for index in (pack.facets or {}).values():
+        total += sum(len(v) + 8 * len(rows) + 64 for v, rows in index.items())
+    for q in pack.questions or []:
+        total += 256
+        for v in q.values():
+            total += len(v) if isinstance(v, str) else 8
+    return total
+
+
+# fetch(舊條目或 None) → 新的 CachedPack；如果舊條目仍然有效（未修改）就回傳 None
+Fetcher = Callable[[Optional[CachedPack]], Optional[CachedPack]]
+
+
+class PackCache:
+    """
+    有上限的 LRU：key → CachedPack。
+    - TTL 內直接命中，唔使再問 S3
+    - TTL 過咗就用 ETag 做條件式 GET；304 只會刷新時間
+    - 條目數或估算 bytes 超出上限時，由最舊開始淘汰
+    """
+
+    def __init__(
+        self,
+        max_entries: int = PACK_CACHE_MAX_ENTRIES,
+        max_bytes: int = PACK_CACHE_MAX_BYTES,
+        ttl: float = PACK_CACHE_TTL,
+    ):
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max(0, max_bytes)
+        self.ttl = max(0.0, ttl)
+        self._entries: "OrderedDict[str, CachedPack]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.reloads = 0
+        self.evictions = 0
+
+    def get_or_load(self, key: str, fetch: Fetcher) -> CachedPack:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if now - entry.checked_at < self.ttl:
+                    self.hits += 1
+                    return entry
+
+        # I/O 唔好攬住 lock；同一 key 並發 miss 最多重複載入一次
+        if entry is None:
+            fresh = fetch(None)
+            if fresh is None:
+                raise RuntimeError(f"pack fetch returned nothing for {key}")
+            with self._lock:
+                self.misses += 1
+                self._store(fresh)
+            return fresh
+
+        fresh = fetch(entry)
+        with self._lock:
+            if fresh is None:
+                entry.checked_at = time.monotonic()
+                self.revalidated += 1
+                self.hits += 1
+                return entry
+            self.reloads += 1
+            self._store(fresh)
+        return fresh
+
+    def get_fresh(self, key: str) -> Optional[CachedPack]:
+        """只睇記憶體：TTL 內有就當命中回傳，否則 None（唔做任何 I/O）。"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry.checked_at >= self.ttl:
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def peek(self, key: str) -> Optional[CachedPack]:
+        with self._lock:
+            return self._entries.get(key)
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidated": self.revalidated,
+                "reloads": self.reloads,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    # --- 內部（需持有 lock） ---
+    def _store(self, pack: CachedPack) -> None:
+        if not pack.size:
+            pack.size = estimate_size(pack)
+        old = self._entries.pop(pack.key, None)
+        if old is not None:
+            self._bytes -= old.size
+        pack.checked_at = time.monotonic()
+        self._entries[pack.key] = pack
+        self._bytes += pack.size
+        self._evict()
+
+    def _evict(self) -> None:
+        while len(self._entries) > self.max_entries or (
+            self.max_bytes and self._bytes > self.max_bytes and len(self._entries) > 1
+        ):
+            _, old = self._entries.popitem(last=False)
+            self._bytes -= old.size
+            self.evictions += 1
+
+
+pack_cache = PackCache()
@@ -0,0 +1,478 @@
+# apps/backend/app/packs.py
+from __future__ import annotations
+
+import codecs
+import csv
+import io
+import json
+import os
+import re
+import time
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional, Tuple
+
+from .facets import build_facets
+from .jsonfmt import dumps_bytes
+from .pack_cache import CachedPack
+
+# === Key 規則 ===
+PREFIX = "packs/"
+ARTIFACT_VERSION = 3
+# v3 = v2 + header 入面嘅 facets 倒排索引；v2 仍然識讀（載入時補建索引）
+READABLE_ARTIFACT_VERSIONS = (2, 3)
+
+# 大題包門檻：行數夠多就唔 decode 晒；產物夠大（而且有 index）就連 body 都唔載入，改用 range GET
+PACK_LAZY_MIN_ROWS = int(os.getenv("PACK_LAZY_MIN_ROWS", "2000"))
+PACK_RANGE_MIN_BYTES = int(os.getenv("PACK_RANGE_MIN_BYTES", str(8 * 1024 * 1024)))
+
+
+SLUG_RE = re.compile(r"^[a-z0-9/_-]+$", re.I)
+
+
+def is_valid_slug(slug: str) -> bool:
+    """同 main.validate_slug 一樣嘅規則（唔 raise，俾批量匯入 / CLI 用）。"""
+    return bool(slug) and ".." not in slug and SLUG_RE.fullmatch(slug) is not None
+
+
+def slug_to_key(slug: str) -> str:
+    return f"{PREFIX}{slug}.csv"
+
+
+def key_to_slug(key: str) -> str:
+    return key[len(PREFIX):-len(".csv")] if key.startswith(PREFIX) and key.endswith(".csv") else key
+
+
+def slug_to_artifact_key(slug: str) -> str:
+    """編譯後嘅 sidecar：packs/<slug>.json（同 CSV 放埋一齊）"""
+    return f"{PREFIX}{slug}.json"
+
+
+# === 解碼 / 正規化 ===
+# 有 UTF-8 BOM 就一定係 utf-8-sig；冇就先試 strict utf-8，再試中文編碼
+ENCODINGS = ("utf-8", "cp950", "big5", "gb18030")
+
+# 題目欄（任何一個存在先算係有效題包 header）
+QUESTION_COLUMNS = frozenset({"question", "題目", "pairs", "Pairs", "left", "Left"})
+
+
+# 上載時已經轉做 UTF-8 嘅 CSV 會帶呢個 metadata，讀取時唔使再逐個編碼試
+NORMALIZED_META = {"encoding": "utf-8"}
+
+
+def detect_encoding(b: bytes) -> Tuple[str, str]:
+    """回傳 (編碼, 文字)；全部候選都失敗就用 utf-8 replace，編碼記做 "unknown"。"""
+    # 明確睇 BOM：utf-8-sig 對冇 BOM 嘅 UTF-8 都 decode 到，放喺候選入面 "utf-8" 就永遠唔會出現
+    if b.startswith(codecs.BOM_UTF8):
+        try:
+            return "utf-8-sig", b[len(codecs.BOM_UTF8):].decode("utf-8")
+        except UnicodeDecodeError:
+            pass
+    for enc in ENCODINGS:
+        try:
+            return enc, b.decode(enc)
+        except Exception:
+            continue
+    return "unknown", b.decode("utf-8", errors="replace")
+
+
+def smart_decode(b: bytes) -> str:
+    return detect_encoding(b)[1]
+
+
+def normalize_to_utf8(raw: bytes) -> Tuple[bytes, str]:
+    """任何支援編碼 → UTF-8（無 BOM），連同原本編碼。本身已經係 UTF-8 就唔使重新 encode。"""
+    enc, text = detect_encoding(raw)
+    if enc == "utf-8":
+        return raw, enc
+    if enc == "utf-8-sig":
+        return raw[len(codecs.BOM_UTF8):], enc
+    return text.encode("utf-8"), enc
+
+
+def is_normalized(metadata: Optional[Dict[str, str]]) -> bool:
+    return (metadata or {}).get("encoding") == NORMALIZED_META["encoding"]
+
+
+def decode_pack_bytes(raw: bytes, metadata: Optional[Dict[str, str]] = None) -> str:
+    """已標記 UTF-8 嘅直接 decode（utf-8-sig 順手食咗 BOM）；舊題包先行 smart_decode。"""
+    if is_normalized(metadata):
+        return raw.decode("utf-8-sig", errors="replace")
+    return smart_decode(raw)
+
+
+def normalize_rows(rows: Iterable[Dict[str, Any]]) -> Tuple[str, List[Dict[str, Any]]]:
+    """CSV rows → (pack title, 統一欄位名嘅題目 list)。單次走過，rows 可以係 csv.DictReader（串流）。"""
+    pack_title = ""
+    qs: List[Dict[str, Any]] = []
+    for i, r in enumerate(rows, start=1):
+        if not pack_title:
+            pack_title = (r.get("title") or r.get("標題") or "").strip()
+        qs.append(
+            {
+                "id": r.get("id") or str(i),
+                "type": r.get("type") or r.get("kind") or "",
+                "question": r.get("question") or r.get("題目") or "",
+                "choiceA": r.get("choiceA") or r.get("A") or "",
+                "choiceB": r.get("choiceB") or r.get("B") or "",
+                "choiceC": r.get("choiceC") or r.get("C") or "",
+                "choiceD": r.get("choiceD") or r.get("D") or "",
+                "answer": r.get("answer") or r.get("答案") or "",
+                "answers": r.get("answers") or "",
+                "explain": r.get("explain") or r.get("解析") or "",
+                "image": r.get("image") or "",
+                "pairs": r.get("pairs") or r.get("Pairs") or "",
+                "left": r.get("left") or r.get("Left") or "",
+                "right": r.get("right") or r.get("Right") or "",
+                "answerMap": r.get("answerMap") or r.get("map") or r.get("index") or "",
+                "topic": r.get("topic") or "",
+                "lo": r.get("lo") or "",
+                "diff": r.get("diff") or "",
+            }
+        )
+    return pack_title, qs
+
+
+def parse_csv_bytes(raw: bytes, metadata: Optional[Dict[str, str]] = None) -> Tuple[str, List[Dict[str, Any]]]:
+    text = decode_pack_bytes(raw, metadata)
+    return normalize_rows(list(csv.DictReader(io.StringIO(text))))
+
+
+# === 編譯產物 ===
+# v2 / v3（JSON Lines，UTF-8，已正規化）：
+#   第 1 行：header {"v":3,"slug","title","count","facets",...}
+#   之後每行一條題目（JSON 字串入面嘅換行會 escape，所以一行 = 一條）
+#   v3 header 多咗 facets：topic / lo / diff → row index 嘅倒排索引
+# v1（舊版單一 JSON doc，"questions" 陣列）仍然識讀
+def compile_pack(slug: str, raw_csv: bytes, source_etag: str = "", normalized: bool = False) -> Dict[str, Any]:
+    title, qs = parse_csv_bytes(raw_csv, NORMALIZED_META if normalized else None)
+    return _compiled_doc(slug, title, qs, source_etag)
+
+
+def compile_pack_stream(slug: str, source: BinaryIO, encoding: str, source_etag: str = "") -> Dict[str, Any]:
+    """同 compile_pack 一樣，但由檔案逐行讀（上載嘅暫存檔），唔使成個 CSV 放入記憶體。"""
+    source.seek(0)
+    text = io.TextIOWrapper(source, encoding=encoding, errors="replace", newline="")
+    try:
+        title, qs = normalize_rows(csv.DictReader(text))
+    finally:
+        text.detach()  # 唔好連 source 一齊 close
+    return _compiled_doc(slug, title, qs, source_etag)
+
+
+def _compiled_doc(slug: str, title: str, qs: List[Dict[str, Any]], source_etag: str) -> Dict[str, Any]:
+    return {
+        "v": ARTIFACT_VERSION,
+        "slug": slug,
+        "title": title,
+        "count": len(qs),
+        "source_etag": source_etag,
+        "compiled_at": int(time.time()),
+        "facets": build_facets(qs),
+        "questions": qs,
+    }
+
+
+def _dumps(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dump_artifact(doc: Dict[str, Any]) -> bytes:
+    header = {k: v for k, v in doc.items() if k != "questions"}
+    lines = [_dumps(header)]
+    lines.extend(_dumps(q) for q in doc.get("questions") or [])
+    return b"\n".join(lines) + b"\n"
+
+
+def row_offsets(body: bytes) -> Tuple[Dict[str, Any], List[int]]:
+    """
+    v2 產物 → (header, offsets)。
+    offsets 長度 = count + 1；第 i 條題目係 body[offsets[i]:offsets[i + 1]]。
+    """
+    end = body.find(b"\n")
+    if end < 0:
+        raise ValueError("not a v2 artifact")
+    header = json.loads(body[:end])
+    if not isinstance(header, dict) or header.get("v") not in READABLE_ARTIFACT_VERSIONS:
+        raise ValueError("not a v2 artifact")
+    offsets = [end + 1]
+    pos = end + 1
+    n = len(body)
+    while pos < n:
+        nl = body.find(b"\n", pos)
+        pos = n if nl < 0 else nl + 1
+        offsets.append(pos)
+    return header, offsets
+
+
+def decode_row(chunk: bytes) -> Dict[str, Any]:
+    return json.loads(chunk)
+
+
+def load_artifact(raw: bytes) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+    """讀取編譯產物（v1 / v2）；版本唔啱或格式壞咗就回傳 None（由 caller fallback 去 CSV）。"""
+    try:
+        header, offsets = row_offsets(raw)
+        qs = [decode_row(raw[offsets[i]:offsets[i + 1]]) for i in range(len(offsets) - 1)]
+        return str(header.get("title") or ""), qs
+    except ValueError:
+        pass
+    try:
+        doc = json.loads(raw)
+    except ValueError:
+        return None
+    if not isinstance(doc, dict) or doc.get("v") != 1:
+        return None
+    qs = doc.get("questions")
+    if not isinstance(qs, list):
+        return None
+    return str(doc.get("title") or ""), qs
+
+
+# === Row-offset index（packs/<slug>.idx） ===
+def slug_to_index_key(slug: str) -> str:
+    return f"{PREFIX}{slug}.idx"
+
+
+def put_index(s3, bucket: str, slug: str, header: Dict[str, Any], offsets: List[int], artifact_etag: str) -> None:
+    doc = {
+        "v": 1,
+        "artifact_etag": artifact_etag,
+        "title": header.get("title") or "",
+        "count": len(offsets) - 1,
+        "bytes": offsets[-1] if offsets else 0,
+        "offsets": offsets,
+        "facets": header.get("facets"),
+    }
+    s3.put_object(
+        Bucket=bucket,
+        Key=slug_to_index_key(slug),
+        Body=_dumps(doc),
+        ContentType="application/json; charset=utf-8",
+    )
+
+
+def get_index(s3, bucket: str, slug: str) -> Optional[Dict[str, Any]]:
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=slug_to_index_key(slug))
+    except Exception as e:
+        if is_missing(e):
+            return None
+        raise
+    try:
+        doc = json.loads(obj["Body"].read())
+    except ValueError:
+        return None
+    if not isinstance(doc, dict) or doc.get("v") != 1 or not isinstance(doc.get("offsets"), list):
+        return None
+    return doc
+
+
+def put_artifact(
+    s3, bucket: str, slug: str, raw_csv: bytes, source_etag: str = "", normalized: bool = False
+) -> Dict[str, Any]:
+    """編譯並寫入 sidecar + row-offset index，回傳 {"bytes", "count", "title", "indexed"}。"""
+    return put_compiled(s3, bucket, slug, compile_pack(slug, raw_csv, source_etag, normalized))
+
+
+def put_compiled(s3, bucket: str, slug: str, doc: Dict[str, Any]) -> Dict[str, Any]:
+    """寫入已編譯嘅 doc（sidecar + index）；回傳同 put_artifact 一樣。"""
+    source_etag = doc.get("source_etag") or ""
+    body = dump_artifact(doc)
+    resp = s3.put_object(
+        Bucket=bucket,
+        Key=slug_to_artifact_key(slug),
+        Body=body,
+        ContentType="application/x-ndjson; charset=utf-8",
+        Metadata={"source-etag": source_etag.strip('"'), "artifact-v": str(ARTIFACT_VERSION)},
+    )
+    indexed = True
+    try:
+        header, offsets = row_offsets(body)
+        put_index(s3, bucket, slug, header, offsets, (resp or {}).get("ETag") or "")
+    except Exception:
+        indexed = False
+    return {"bytes": len(body), "count": doc["count"], "title": doc["title"], "indexed": indexed}
+
+
+# === S3 讀取 ===
+def is_not_modified(e: Exception) -> bool:
+    resp = getattr(e, "response", None) or {}
+    code = str((resp.get("Error") or {}).get("Code") or "")
+    status = (resp.get("ResponseMetadata") or {}).get("HTTPStatusCode")
+    return status == 304 or code in ("304", "NotModified")
+
+
+def is_missing(e: Exception) -> bool:
+    resp = getattr(e, "response", None) or {}
+    code = str((resp.get("Error") or {}).get("Code") or "")
+    status = (resp.get("ResponseMetadata") or {}).get("HTTPStatusCode")
+    return status == 404 or code in ("404", "NoSuchKey", "NotFound")
+
+
+def is_precondition_failed(e: Exception) -> bool:
+    resp = getattr(e, "response", None) or {}
+    code = str((resp.get("Error") or {}).get("Code") or "")
+    status = (resp.get("ResponseMetadata") or {}).get("HTTPStatusCode")
+    return status in (409, 412) or code in ("PreconditionFailed", "ConditionalRequestConflict")
+
+
+def _get_object(s3, bucket: str, key: str, etag: Optional[str]):
+    """條件式 GET：未改回傳 None。"""
+    kwargs: Dict[str, Any] = {"Bucket": bucket, "Key": key}
+    if etag:
+        kwargs["IfNoneMatch"] = etag
+    try:
+        return s3.get_object(**kwargs)
+    except Exception as e:
+        if etag and is_not_modified(e):
+            return None
+        raise
+
+
+def questions_pack(key: str, etag: str, title: str, qs: List[Dict[str, Any]], source: str) -> CachedPack:
+    """全 decode 形態；順手 serialize 好每條題目（每個版本做一次）。"""
+    return CachedPack(
+        key=key,
+        etag=etag,
+        title=title,
+        questions=qs,
+        source=source,
+        fragments=[dumps_bytes(q) for q in qs],
+        facets=build_facets(qs),
+    )
+
+
+def pack_from_artifact(key: str, source: str, raw: bytes, etag: str) -> Optional[CachedPack]:
+    """
+    v2 產物：大題包（>= PACK_LAZY_MIN_ROWS）只留 bytes + offsets，抽題時先 decode 抽中嘅行；
+    細題包照舊全部 decode。
+    """
+    try:
+        header, offsets = row_offsets(raw)
+    except ValueError:
+        loaded = load_artifact(raw)
+        if loaded is None:
+            return None
+        title, qs = loaded
+        return questions_pack(key, etag, title, qs, source)
+
+    title = str(header.get("title") or "")
+    facets = header.get("facets")
+    if len(offsets) - 1 >= PACK_LAZY_MIN_ROWS:
+        if facets is None:
+            # v2 產物冇索引：呢個版本 decode 一次補建（backfill-artifacts 重編譯之後就唔使）
+            facets = build_facets(decode_row(raw[offsets[i]:offsets[i + 1]]) for i in range(len(offsets) - 1))
+        return CachedPack(
+            key=key, etag=etag, title=title, questions=None, source=source, buffer=raw, offsets=offsets, facets=facets
+        )
+    # 細題包：decode 一次俾篩選用，同時保留每行原本嘅 JSON bytes 做 response fragment
+    lines = [raw[offsets[i]:offsets[i + 1]].rstrip(b"\n") for i in range(len(offsets) - 1)]
+    qs = [decode_row(b) for b in lines]
+    return CachedPack(
+        key=key,
+        etag=etag,
+        title=title,
+        questions=qs,
+        source=source,
+        fragments=lines,
+        facets=facets if facets is not None else build_facets(qs),
+    )
+
+
+def _index_current(s3, bucket: str, art_key: str, index: Dict[str, Any]) -> bool:
+    """index 只可以配返佢建立時嗰個版本嘅產物（HEAD 對 ETag）。"""
+    try:
+        head = s3.head_object(Bucket=bucket, Key=art_key)
+    except Exception as e:
+        if is_missing(e):
+            return False
+        raise
+    return (head.get("ETag") or "") == index.get("artifact_etag")
+
+
+def fetch_pack(
+    s3, bucket: str, slug: str, prev: Optional[CachedPack] = None, artifact_bytes: Optional[int] = None
+) -> Optional[CachedPack]:
+    """
+    讀取並正規化一個題包：
+    1) 有 index 而且產物夠大（>= PACK_RANGE_MIN_BYTES）：只載入 offsets，抽題時用 byte-range GET
+       （artifact_bytes = 目錄記低嘅產物大細；知道係細題包就連 index 嘅 GET / HEAD 都慳返）
+    2) 讀編譯產物 packs/<slug>.json（唔使解碼 / 對欄位別名）；冇 index 就順手建立
+    3) 冇產物（舊題包）先 fallback 讀 CSV
+    有 prev 時對返同一個來源物件做條件式 GET / HEAD：未改就回傳 None。
+    """
+    key = slug_to_key(slug)
+    art_key = slug_to_artifact_key(slug)
+    if prev is not None and prev.source:
+        obj: Any = False
+        if prev.is_remote:
+            try:
+                head = s3.head_object(Bucket=bucket, Key=prev.source)
+                if (head.get("ETag") or "") == prev.etag:
+                    return None
+            except Exception as e:
+                if not is_missing(e):
+                    raise
+        else:
+            try:
+                obj = _get_object(s3, bucket, prev.source, prev.etag)
+            except Exception as e:
+                if not is_missing(e):
+                    raise
+                obj = False  # 來源冇咗（例如產物被刪），重新完整載入
+            if obj is None:
+                return None
+        if obj:
+            raw = obj["Body"].read()
+            etag = obj.get("ETag") or ""
+            if prev.source == key:
+                title, qs = parse_csv_bytes(raw, obj.get("Metadata"))
+                return questions_pack(key, etag, title, qs, key)
+            pack = pack_from_artifact(key, prev.source, raw, etag)
+            if pack is not None:
+                return pack
+
+    index = None
+    if PACK_RANGE_MIN_BYTES > 0 and (artifact_bytes is None or artifact_bytes >= PACK_RANGE_MIN_BYTES):
+        index = get_index(s3, bucket, slug)
+        if index is not None and int(index.get("bytes") or 0) >= PACK_RANGE_MIN_BYTES and _index_current(s3, bucket, art_key, index):
+            return CachedPack(
+                key=key,
+                etag=index.get("artifact_etag") or "",
+                title=str(index.get("title") or ""),
+                questions=None,
+                source=art_key,
+                offsets=index["offsets"],
+                facets=index.get("facets"),
+            )
+
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=art_key)
+    except Exception as e:
+        if not is_missing(e):
+            raise
+        obj = None
+    if obj is not None:
+        raw = obj["Body"].read()
+        etag = obj.get("ETag") or ""
+        pack = pack_from_artifact(key, art_key, raw, etag)
+        if pack is not None:
+            if len(raw) >= PACK_RANGE_MIN_BYTES > 0 and (index is None or index.get("artifact_etag") != etag):
+                # 第一次讀：補返 index，之後大題包就可以行 range GET（細題包用唔着 index）
+                try:
+                    header, offsets = row_offsets(raw)
+                    put_index(s3, bucket, slug, header, offsets, etag)
+                except Exception:
+                    pass
+            return pack
+
+    obj = s3.get_object(Bucket=bucket, Key=key)
+    title, qs = parse_csv_bytes(obj["Body"].read(), obj.get("Metadata"))
+    return questions_pack(key, obj.get("ETag") or "", title, qs, key)
+
+
+def read_artifact_range(s3, bucket: str, key: str, etag: str, start: int, end: int) -> bytes:
+    """讀產物 [start, end)；用 If-Match 鎖死版本，產物改咗會 raise（caller 要 reload）。"""
+    kwargs: Dict[str, Any] = {"Bucket": bucket, "Key": key, "Range": f"bytes={start}-{end - 1}"}
+    if etag:
+        kwargs["IfMatch"] = etag
+    return s3.get_object(**kwargs)["Body"].read()
@@ -0,0 +1,142 @@
+# apps/backend/app/quiz_mix.py
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .pack_cache import CachedPack
+from .sampling import make_rng, pick_count, pick_indices
+
+# === 設定 ===
+MIX_MAX_PACKS = int(os.getenv("QUIZ_MIX_MAX_PACKS", "50"))
+# 同時載入幾多個題包（每個 request 計；真正 I/O 仲受 storage executor 限制）
+MIX_CONCURRENCY = max(1, int(os.getenv("QUIZ_MIX_CONCURRENCY", "8")))
+# 去重會剔走重複題：每個題包預多抽幾條嚟補位
+MIX_DEDUP_SLACK = int(os.getenv("QUIZ_MIX_DEDUP_SLACK", "5"))
+
+_DEDUP_FIELDS = ("type", "question", "left", "right", "pairs", "answer", "answers")
+
+
+def question_key(q: Dict[str, Any]) -> Tuple[str, ...]:
+    """去重用：題型 + 題目內容（唔計 id / 解說 / 圖片），忽略大細楷同前後空白。"""
+    return tuple(" ".join(str(q.get(f) or "").split()).lower() for f in _DEDUP_FIELDS)
+
+
+def allocate(counts: Sequence[int], total: int) -> List[int]:
+    """
+    total 條題按題包大細比例分（largest remainder），每包唔超過自己嘅題數。
+    結果只取決於 counts + total，所以同一 seed 分配一樣。
+    """
+    avail = sum(counts)
+    total = max(0, min(total, avail))
+    if total == 0:
+        return [0] * len(counts)
+    exact = [total * c / avail for c in counts]
+    alloc = [int(x) for x in exact]
+    order = sorted(range(len(counts)), key=lambda i: (-(exact[i] - alloc[i]), i))
+    left = total - sum(alloc)
+    while left > 0:
+        moved = False
+        for i in order:
+            if left == 0:
+                break
+            if alloc[i] < counts[i]:
+                alloc[i] += 1
+                left -= 1
+                moved = True
+        if not moved:
+            break
+    return alloc
+
+
+async def load_packs(storage, slugs: Sequence[str]) -> Dict[str, Any]:
+    """並發載入（有上限）；失敗嘅題包值係 Exception，唔會拖冧成個 request。"""
+    sem = asyncio.Semaphore(MIX_CONCURRENCY)
+
+    async def one(slug: str):
+        async with sem:
+            return await storage.load_pack(slug)
+
+    results = await asyncio.gather(*(one(s) for s in slugs), return_exceptions=True)
+    return dict(zip(slugs, results))
+
+
+async def mix_quiz(
+    storage,
+    packs: Dict[str, CachedPack],
+    *,
+    per: Optional[int],
+    n: Optional[int],
+    nmin: int,
+    nmax: int,
+    seed: Optional[str],
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    由已載入嘅題包抽題 → (題目 list, 每包摘要)。
+    - per：每包抽幾多；否則總數（n 或 [nmin, nmax]）按題包大細分配
+    - 有 seed：每包用 f"{seed}:{slug}" 獨立 RNG，最後次序用 seed 洗，結果可重現
+    - 跨題包去重（題目內容一樣只留第一次出現，slug 次序）
+    """
+    slugs = sorted(packs)
+    counts = [packs[s].count for s in slugs]
+    rnd = make_rng(seed)
+    if per and per > 0:
+        alloc = [min(per, c) for c in counts]
+    else:
+        alloc = allocate(counts, pick_count(sum(counts), n, nmin, nmax, rnd))
+
+    async def candidates(slug: str, k: int) -> List[Dict[str, Any]]:
+        if k <= 0:
+            return []
+        pack = packs[slug]
+        prnd = make_rng(f"{seed}:{slug}") if seed else random
+        idx = pick_indices(pack.count, min(pack.count, k + MIX_DEDUP_SLACK), prnd)
+        return await storage.load_rows(pack, idx)
+
+    sem = asyncio.Semaphore(MIX_CONCURRENCY)
+
+    async def bounded(slug: str, k: int) -> List[Dict[str, Any]]:
+        async with sem:
+            return await candidates(slug, k)
+
+    rows = await asyncio.gather(*(bounded(s, k) for s, k in zip(slugs, alloc)))
+
+    seen: set = set()
+    picked: List[Dict[str, Any]] = []
+    took = [0] * len(slugs)
+    spare: List[Tuple[int, Dict[str, Any]]] = []
+    for i, (slug, k, cands) in enumerate(zip(slugs, alloc, rows)):
+        for q in cands:
+            key = question_key(q)
+            if key in seen:
+                continue
+            if took[i] >= k:
+                spare.append((i, q))
+                continue
+            seen.add(key)
+            picked.append({**q, "pack": slug})
+            took[i] += 1
+
+    # 按總數抽時，去重後唔夠數就用其他題包預抽嘅補位
+    if not (per and per > 0):
+        for i, q in spare:
+            if len(picked) >= sum(alloc):
+                break
+            key = question_key(q)
+            if key in seen:
+                continue
+            seen.add(key)
+            picked.append({**q, "pack": slugs[i]})
+            took[i] += 1
+
+    summary = [
+        {"slug": s, "title": packs[s].title, "rows": packs[s].count, "picked": t} for s, t in zip(slugs, took)
+    ]
+
+    rnd.shuffle(picked)
+    # 唔同題包嘅 id 會撞，重新編號
+    for i, q in enumerate(picked, 1):
+        q["id"] = str(i)
+    return picked, summary
@@ -8,6 +8,7 @@ import calendar
 from typing import Optional, Tuple
 
 from fastapi import APIRouter, HTTPException, Header, Query
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 
 from datetime import datetime, time as dtime, timezone, timedelta
@@ -17,7 +18,7 @@ except Exception:
     ZoneInfo = None
 
 # === 匯入內部工具 ===
-from ..entitlements import has_access, current_plan
+from ..entitlements import has_access_async, current_plan_async
 from mailer_sendgrid import send_report_email
 
 router = APIRouter(prefix="/report", tags=["report"])
@@ -129,7 +130,7 @@ class ReportPayload(BaseModel):
 
 # === 主路由 ===
 @router.post("/send")
-def send_report(
+async def send_report(
     payload: ReportPayload,
     slug: Optional[str] = Query(default=None, description="例如 chinese-p1 / math-grade2"),
     x_user_id: Optional[str] = Header(default=None, alias="X-User-Id"),
@@ -151,7 +152,7 @@ def send_report(
         if not x_user_id:
             raise HTTPException(401, "Missing X-User-Id")
 
-        if not has_access(x_user_id, subject, grade):
+        if not await has_access_async(x_user_id, subject, grade):
             raise HTTPException(402, "報告功能需購買方案")
 
         # 計算當地日界線
@@ -161,7 +162,7 @@ def send_report(
             off = None
         local_day_start = _midnight_ts_from_client(x_user_tz, off)
 
-        plan = current_plan(x_user_id)
+        plan = await current_plan_async(x_user_id)
         if plan not in ("starter", "pro"):
             raise HTTPException(402, "報告功能需購買方案")
 
@@ -195,7 +196,8 @@ def send_report(
     """.strip()
 
     # 5) 發送郵件
-    ok, msg = send_report_email(
+    ok, msg = await run_in_threadpool(
+        send_report_email,
         to_email=to_email,
         subject=f"Study Game 報告：{student_name} · {subject_title} · {grade_disp}",
         html=html,
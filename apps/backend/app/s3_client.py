@@ -0,0 +1,152 @@
+# apps/backend/app/s3_client.py
+from __future__ import annotations
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+# boto3 (optional)
+try:
+    import boto3
+    from botocore.config import Config
+except ModuleNotFoundError:
+    boto3 = None
+    Config = None
+
+
+class S3ConfigError(RuntimeError):
+    """S3/R2 未安裝或 env 未設定。"""
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _read_settings() -> Dict[str, Any]:
+    return {
+        "bucket": os.getenv("S3_BUCKET"),
+        "access_key": os.getenv("S3_ACCESS_KEY"),
+        "secret_key": os.getenv("S3_SECRET_KEY"),
+        "endpoint": os.getenv("S3_ENDPOINT") or None,
+        "region": os.getenv("S3_REGION", "auto"),
+        "max_pool_connections": _env_int("S3_MAX_POOL_CONNECTIONS", 50),
+        "connect_timeout": _env_float("S3_CONNECT_TIMEOUT", 3.0),
+        "read_timeout": _env_float("S3_READ_TIMEOUT", 10.0),
+        "max_attempts": _env_int("S3_MAX_ATTEMPTS", 3),
+        "retry_mode": os.getenv("S3_RETRY_MODE", "standard"),
+        "tcp_keepalive": os.getenv("S3_TCP_KEEPALIVE", "true").lower() in ("1", "true", "yes"),
+    }
+
+
+class S3ClientRegistry:
+    """
+    全 process 共用一個 boto3 S3 client（boto3 client 本身係 thread-safe）。
+    - 第一次用先建立；env 有變（key/endpoint/pool 設定）就重建
+    - urllib3 連線池大小由 S3_MAX_POOL_CONNECTIONS 控制，keep-alive 重用 TLS 連線
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._client = None
+        self._fingerprint: Optional[Tuple] = None
+        self._settings: Dict[str, Any] = {}
+        self.builds = 0
+
+    def get(self) -> Tuple[Any, str]:
+        if boto3 is None:
+            raise S3ConfigError("boto3 not installed")
+
+        st = _read_settings()
+        if not st["bucket"] or not st["access_key"] or not st["secret_key"]:
+            raise S3ConfigError("Missing S3 env vars: S3_BUCKET/S3_ACCESS_KEY/S3_SECRET_KEY")
+
+        fp = tuple(sorted(st.items()))
+        client = self._client
+        if client is not None and fp == self._fingerprint:
+            return client, st["bucket"]
+
+        with self._lock:
+            if self._client is None or fp != self._fingerprint:
+                self._client = self._build(st)
+                self._fingerprint = fp
+                self._settings = st
+                self.builds += 1
+            return self._client, st["bucket"]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._client = None
+            self._fingerprint = None
+
+    def warm(self, connections: Optional[int] = None) -> int:
+        """
+        預先打開 N 條連線（並發 head_bucket），等第一批請求唔使再做 TLS handshake。
+        回傳成功數目；失敗唔會 raise（boot 唔應該因此失敗）。
+        """
+        try:
+            s3, bucket = self.get()
+        except S3ConfigError:
+            return 0
+
+        n = connections if connections is not None else _env_int("S3_WARM_CONNECTIONS", 4)
+        n = max(0, min(n, self._settings.get("max_pool_connections", 10)))
+        if n == 0:
+            return 0
+
+        def _ping(_: int) -> bool:
+            try:
+                s3.head_bucket(Bucket=bucket)
+                return True
+            except Exception:
+                return False
+
+        with ThreadPoolExecutor(max_workers=n) as ex:
+            return sum(1 for ok in ex.map(_ping, range(n)) if ok)
+
+    def stats(self) -> Dict[str, Any]:
+        st = self._settings
+        return {
+            "ready": self._client is not None,
+            "builds": self.builds,
+            "max_pool_connections": st.get("max_pool_connections"),
+            "connect_timeout": st.get("connect_timeout"),
+            "read_timeout": st.get("read_timeout"),
+            "max_attempts": st.get("max_attempts"),
+        }
+
+    @staticmethod
+    def _build(st: Dict[str, Any]):
+        cfg = None
+        if Config:
+            cfg = Config(
+                s3={"addressing_style": "path"},
+                max_pool_connections=st["max_pool_connections"],
+                connect_timeout=st["connect_timeout"],
+                read_timeout=st["read_timeout"],
+                retries={"max_attempts": st["max_attempts"], "mode": st["retry_mode"]},
+                tcp_keepalive=st["tcp_keepalive"],
+            )
+        # 用獨立 Session，避免 boto3 default session 喺多 thread 下初始化有 race
+        session = boto3.session.Session()
+        return session.client(
+            "s3",
+            endpoint_url=st["endpoint"],
+            aws_access_key_id=st["access_key"],
+            aws_secret_access_key=st["secret_key"],
+            region_name=st["region"],
+            config=cfg,
+        )
+
+
+s3_registry = S3ClientRegistry()
@@ -0,0 +1,85 @@
+# apps/backend/app/sampling.py
+from __future__ import annotations
+
+import random
+from typing import List, Optional
+
+
+def make_rng(seed: Optional[str]):
+    """有 seed 用獨立 random.Random（可重現）；冇 seed 直接用 random module。"""
+    return random.Random(str(seed)) if seed else random
+
+
+def pick_count(total: int, n: Optional[int], nmin: int, nmax: int, rnd) -> int:
+    """抽幾多題：有 n 用 n，否則喺 [nmin, nmax] 隨機（同舊版 get_quiz 一樣）。"""
+    if total <= 0:
+        return 0
+    if n and n > 0:
+        return min(max(1, n), total)
+    lo, hi = sorted([nmin, nmax])
+    lo = max(1, lo)
+    hi = max(lo, hi)
+    return min(rnd.randint(lo, hi), total)
+
+
+def shuffled_prefix(total: int, k: int, rnd: random.Random) -> List[int]:
+    """
+    等同 `idx = list(range(total)); rnd.shuffle(idx); idx[:k]`：同一個 seed 抽出嚟嘅題目同舊版完全一樣。
+    只係將 random.shuffle 入面嘅 _randbelow inline，再按 bit 數分段（每段 getrandbits 位數固定），
+    只郁 int list，唔使搬題目 dict；大題包快大約 2-3 倍。
+
+    注意：呢度依賴 CPython 嘅實作細節（唔係 random 嘅公開保證）：
+    - Random.shuffle 係 `for i in reversed(range(1, n)): j = _randbelow(i + 1)`
+    - _randbelow 係 _randbelow_with_getrandbits：每次攞 n.bit_length() 個 bit，>= n 就重抽
+    自訂 RNG（_randbelow 唔同）會行返 rnd.shuffle；import 時 _FAST_SHUFFLE 再同 rnd.shuffle 對一次，
+    將來 CPython 改咗以上任何一樣都會自動退返標準做法（seed 結果跟新版 CPython 走）。
+    """
+    k = max(0, min(k, total))
+    if k == 0:
+        return []
+    x = list(range(total))
+    if not _FAST_SHUFFLE or getattr(type(rnd), "_randbelow", None) is not getattr(
+        random.Random, "_randbelow_with_getrandbits", object()
+    ):
+        rnd.shuffle(x)  # 自訂 RNG / 快速版對唔上：行返標準做法
+        return x[:k]
+    return _fast_shuffle(x, rnd)[:k]
+
+
+def _fast_shuffle(x: List[int], rnd: random.Random) -> List[int]:
+    getrandbits = rnd.getrandbits
+    top = len(x)
+    while top > 1:
+        bits = top.bit_length()
+        low = max(1 << (bits - 1), 2)
+        for n in range(top, low - 1, -1):  # n = i + 1
+            j = getrandbits(bits)
+            while j >= n:
+                j = getrandbits(bits)
+            i = n - 1
+            x[i], x[j] = x[j], x[i]
+        top = low - 1
+    return x
+
+
+def _fast_shuffle_matches() -> bool:
+    """用幾個固定 seed / 長度（跨過 bit 數分段）同 rnd.shuffle 對結果。"""
+    for seed, total in (("a", 2), ("b", 17), ("c", 300), ("d", 1025)):
+        expected = list(range(total))
+        random.Random(seed).shuffle(expected)
+        if _fast_shuffle(list(range(total)), random.Random(seed)) != expected:
+            return False
+    return True
+
+
+_FAST_SHUFFLE = _fast_shuffle_matches()
+
+
+def pick_indices(total: int, k: int, rnd) -> List[int]:
+    """抽 k 個 row index；有 seed 保證可重現（同舊版一致），冇 seed 用 O(k) 嘅 random.sample。"""
+    k = max(0, min(k, total))
+    if k == 0:
+        return []
+    if isinstance(rnd, random.Random):
+        return shuffled_prefix(total, k, rnd)
+    return rnd.sample(range(total), k)
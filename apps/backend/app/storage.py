@@ -0,0 +1,548 @@
+# apps/backend/app/storage.py
+from __future__ import annotations
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .catalog import catalog, make_entry
+from .facets import Facets, build_facets
+from .pack_cache import CachedPack, pack_cache
+from .packs import (
+    NORMALIZED_META,
+    decode_row,
+    fetch_pack,
+    is_missing,
+    is_precondition_failed,
+    key_to_slug,
+    normalize_to_utf8,
+    compile_pack_stream,
+    put_artifact,
+    put_compiled,
+    read_artifact_range,
+    slug_to_artifact_key,
+    slug_to_key,
+)
+from .s3_client import s3_registry
+from .upload_stream import MultipartUpload, transcode_chunks
+
+STORAGE_THREADS = int(os.getenv("STORAGE_THREADS", "64"))
+# range GET 合併：兩行之間空隙細過呢個數就用同一個 request 讀埋
+RANGE_MERGE_GAP = int(os.getenv("RANGE_MERGE_GAP", str(64 * 1024)))
+
+
+# =========================================================
+# 同步 helper（S3 I/O；由 storage executor 或 CLI 直接呼叫）
+# =========================================================
+def put_csv(s3, bucket: str, slug: str, raw: bytes) -> Tuple[str, str, bytes]:
+    """
+    CSV 轉做 UTF-8（無 BOM）先寫入，metadata 記低原本編碼；讀取時見到 encoding=utf-8 就唔使再估。
+    回傳 (etag, 原本編碼, 實際寫入嘅 bytes)。
+    """
+    content, source_encoding = normalize_to_utf8(raw)
+    resp = s3.put_object(
+        Bucket=bucket,
+        Key=slug_to_key(slug),
+        Body=content,
+        ContentType="text/csv; charset=utf-8",
+        Metadata={**NORMALIZED_META, "source-encoding": source_encoding},
+    )
+    return (resp or {}).get("ETag") or "", source_encoding, content
+
+
+def compile_published(
+    s3, bucket: str, slug: str, content: bytes, csv_etag: str, normalized: bool = False
+) -> Tuple[bool, Dict[str, Any]]:
+    """
+    編譯 sidecar + 清 cache，回傳 (compiled, 目錄條目)；唔郁目錄 manifest（批量匯入最後先一次過寫）。
+    """
+    return _compile_with(
+        s3, bucket, slug, lambda: put_artifact(s3, bucket, slug, content, csv_etag, normalized), len(content), csv_etag
+    )
+
+
+def _compile_with(
+    s3, bucket: str, slug: str, build: Callable[[], Dict[str, Any]], size: int, csv_etag: str
+) -> Tuple[bool, Dict[str, Any]]:
+    # 編譯 sidecar（已正規化 JSON）；失敗就刪走舊產物，讀取時 fallback 去 CSV
+    compiled = True
+    info: Dict[str, Any] = {}
+    try:
+        info = build()
+    except Exception:
+        compiled = False
+        try:
+            s3.delete_object(Bucket=bucket, Key=slug_to_artifact_key(slug))
+        except Exception:
+            pass
+
+    pack_cache.invalidate(slug_to_key(slug))
+    entry = make_entry(
+        slug,
+        size=size,
+        etag=csv_etag,
+        rows=info.get("count"),
+        pack_title=info.get("title") or "",
+        artifact_bytes=info.get("bytes"),
+    )
+    return compiled, entry
+
+
+def update_catalog_sync(entries: Sequence[Dict[str, Any]]) -> bool:
+    """一次過寫入多個目錄條目（失敗之後可以用 rebuild-catalog 補返）。"""
+    if not entries:
+        return True
+    s3, bucket = s3_registry.get()
+    try:
+        catalog.update(s3, bucket, upserts=entries)
+    except Exception:
+        return False
+    return True
+
+
+def publish_pack(
+    s3, bucket: str, slug: str, content: bytes, csv_etag: str, normalized: bool = False
+) -> tuple[bool, bool]:
+    """
+    CSV 已經寫入之後嘅收尾：編譯 sidecar、清 cache、更新目錄 manifest。
+    回傳 (compiled, cataloged)；兩樣都係 best-effort，唔會令上載失敗。
+    """
+    compiled, entry = compile_published(s3, bucket, slug, content, csv_etag, normalized)
+    return compiled, _catalog_upsert(s3, bucket, entry)
+
+
+def _catalog_upsert(s3, bucket: str, entry: Dict[str, Any]) -> bool:
+    # 更新題包目錄 manifest（失敗之後可以用 rebuild-catalog 補返）
+    cataloged = True
+    try:
+        catalog.update(s3, bucket, upserts=[entry])
+    except Exception:
+        cataloged = False
+    return cataloged
+
+
+def put_pack_sync(slug: str, content: bytes, update_catalog: bool = True) -> Dict[str, Any]:
+    """
+    寫入 CSV（轉 UTF-8；失敗會 raise）再 publish。
+    update_catalog=False：唔寫目錄，條目放喺回傳嘅 "entry"，由 caller 一次過 update_catalog。
+    """
+    s3, bucket = s3_registry.get()
+    etag, encoding, content = put_csv(s3, bucket, slug, content)
+    if update_catalog:
+        compiled, cataloged = publish_pack(s3, bucket, slug, content, etag, normalized=True)
+        return {"etag": etag, "encoding": encoding, "compiled": compiled, "cataloged": cataloged}
+    compiled, entry = compile_published(s3, bucket, slug, content, etag, normalized=True)
+    return {"etag": etag, "encoding": encoding, "compiled": compiled, "cataloged": False, "entry": entry}
+
+
+def mark_normalized_sync(slug: str, csv_etag: str, source_encoding: str) -> Optional[str]:
+    """
+    串流上載本身已經係 UTF-8（無 BOM）：server-side copy 補返 metadata，唔使經 app 重寫內容。
+    CopySourceIf-Match 鎖住版本；期間有人再上載就回傳 None（交俾新上載自己 publish）。
+    """
+    s3, bucket = s3_registry.get()
+    key = slug_to_key(slug)
+    try:
+        resp = s3.copy_object(
+            Bucket=bucket,
+            Key=key,
+            CopySource={"Bucket": bucket, "Key": key},
+            CopySourceIfMatch=csv_etag,
+            MetadataDirective="REPLACE",
+            ContentType="text/csv; charset=utf-8",
+            Metadata={**NORMALIZED_META, "source-encoding": source_encoding},
+        )
+    except Exception as e:
+        if is_precondition_failed(e):
+            return None
+        raise
+    return ((resp or {}).get("CopyObjectResult") or {}).get("ETag") or csv_etag
+
+
+def publish_upload_sync(slug: str, source: BinaryIO, encoding: str, csv_etag: str, size: int) -> Tuple[bool, bool]:
+    """串流上載嘅收尾：由暫存檔逐行編譯（唔使成個 CSV 入記憶體）、清 cache、更新目錄。"""
+    s3, bucket = s3_registry.get()
+    compiled, entry = _compile_with(
+        s3,
+        bucket,
+        slug,
+        lambda: put_compiled(s3, bucket, slug, compile_pack_stream(slug, source, encoding, csv_etag)),
+        size,
+        csv_etag,
+    )
+    return compiled, _catalog_upsert(s3, bucket, entry)
+
+
+def _artifact_bytes_hint(slug: str) -> Optional[int]:
+    """目錄記低嘅產物大細（舊條目冇就 None）；只睇記憶體，唔會為咗呢個 hint 做 I/O。"""
+    doc = catalog.peek()
+    entry = ((doc or {}).get("packs") or {}).get(slug) or {}
+    size = entry.get("artifact_bytes")
+    return int(size) if isinstance(size, int) else None
+
+
+def load_pack_sync(slug: str) -> CachedPack:
+    s3, bucket = s3_registry.get()
+    key = slug_to_key(slug)
+    return pack_cache.get_or_load(
+        key, lambda prev: fetch_pack(s3, bucket, slug, prev, artifact_bytes=_artifact_bytes_hint(slug))
+    )
+
+
+def plan_ranges(offsets: Sequence[int], indices: Sequence[int], gap: int = RANGE_MERGE_GAP) -> List[Tuple[int, int, List[int]]]:
+    """抽中嘅行 → 合併後嘅 byte ranges：[(start, end, [row index...]), ...]"""
+    spans: List[Tuple[int, int, List[int]]] = []
+    for i in sorted(set(indices)):
+        start, end = offsets[i], offsets[i + 1]
+        if spans and start - spans[-1][1] <= gap:
+            s0, _, rows = spans[-1]
+            rows.append(i)
+            spans[-1] = (s0, end, rows)
+        else:
+            spans.append((start, end, [i]))
+    return spans
+
+
+def read_span_sync(pack: CachedPack, start: int, end: int, rows: List[int]) -> Dict[int, bytes]:
+    s3, bucket = s3_registry.get()
+    raw = read_artifact_range(s3, bucket, pack.source, pack.etag, start, end)
+    off = pack.offsets or []
+    return {i: raw[off[i] - start:off[i + 1] - start].rstrip(b"\n") for i in rows}
+
+
+def discard_artifact_sync(slug: str) -> None:
+    """CSV 被直接覆寫（串流上載）：舊 sidecar 即刻作廢，重新編譯之前讀取會 fallback 去新 CSV。"""
+    s3, bucket = s3_registry.get()
+    try:
+        s3.delete_object(Bucket=bucket, Key=slug_to_artifact_key(slug))
+    except Exception:
+        pass
+    pack_cache.invalidate(slug_to_key(slug))
+
+
+def read_blob_sync(key: str) -> Optional[bytes]:
+    s3, bucket = s3_registry.get()
+    try:
+        return s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+    except Exception as e:
+        if is_missing(e):
+            return None
+        raise
+
+
+def write_blob_sync(
+    key: str, data: bytes, content_type: str = "application/json; charset=utf-8", cache_control: Optional[str] = None
+) -> None:
+    s3, bucket = s3_registry.get()
+    kwargs: Dict[str, Any] = {"Bucket": bucket, "Key": key, "Body": data, "ContentType": content_type}
+    if cache_control:
+        kwargs["CacheControl"] = cache_control  # CDN 直出 bucket 時都帶住
+    s3.put_object(**kwargs)
+
+
+def read_blob_versioned_sync(key: str) -> Tuple[Optional[bytes], Optional[str]]:
+    """(內容, ETag)；唔存在回傳 (None, None)。配 write_blob_if_sync 做讀-改-寫。"""
+    s3, bucket = s3_registry.get()
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=key)
+    except Exception as e:
+        if is_missing(e):
+            return None, None
+        raise
+    return obj["Body"].read(), obj.get("ETag") or None
+
+
+def write_blob_if_sync(
+    key: str, data: bytes, etag: Optional[str], content_type: str = "application/json; charset=utf-8"
+) -> bool:
+    """
+    條件式寫入（同 catalog 一樣）：etag 有值用 If-Match，None 用 If-None-Match: *。
+    撞車（其他 worker 啱啱寫咗）回傳 False；舊版 botocore 唔識條件參數就退返普通 put。
+    """
+    s3, bucket = s3_registry.get()
+    kwargs: Dict[str, Any] = {"Bucket": bucket, "Key": key, "Body": data, "ContentType": content_type}
+    if etag:
+        kwargs["IfMatch"] = etag
+    else:
+        kwargs["IfNoneMatch"] = "*"
+    try:
+        s3.put_object(**kwargs)
+    except Exception as e:
+        if is_precondition_failed(e):
+            return False
+        if type(e).__name__ != "ParamValidationError":
+            raise
+        kwargs.pop("IfMatch", None)
+        kwargs.pop("IfNoneMatch", None)
+        s3.put_object(**kwargs)
+    return True
+
+
+def catalog_sync() -> Dict[str, Any]:
+    """由 manifest 讀（記憶體 + ETag 重新驗證）；未有 manifest 就掃一次 bucket 建立。"""
+    s3, bucket = s3_registry.get()
+    doc = catalog.get(s3, bucket)
+    if doc is None:
+        doc = catalog.rebuild(s3, bucket)
+    return doc
+
+
+# =========================================================
+# Async 介面（endpoint 只認呢個）
+# =========================================================
+class PackStorage:
+    """
+    題包儲存嘅 async 介面。可以換實作：
+    - ThreadedPackStorage：沿用 boto3，I/O 丟去專用 executor（預設）
+    - LocalPackStorage（local_store.py）：本地目錄 + mmap，PACK_STORAGE=local
+    - 原生 async S3 client（例如 aioboto3）：繼承並覆寫以下方法
+    """
+
+    async def load_pack(self, slug: str) -> CachedPack:
+        raise NotImplementedError
+
+    async def load_rows(self, pack: CachedPack, indices: Sequence[int]) -> List[Dict[str, Any]]:
+        """按 indices 次序回傳題目；本地有嘅直接取，remote 題包由實作讀。"""
+        return pack.rows(indices)
+
+    async def load_rows_json(self, pack: CachedPack, indices: Sequence[int]) -> List[bytes]:
+        """同 load_rows，但回傳每條題目嘅 JSON bytes（直接砌 response 用）。"""
+        return pack.row_bytes(indices)
+
+    async def ensure_facets(self, pack: CachedPack) -> Facets:
+        """
+        倒排索引：本地形態載入時一定有；remote 題包嘅 index 由舊（v2）產物建立就冇，
+        呢度讀晒行補建一次，記喺 pack 度（同一版本之後嘅 request 共用）。
+        """
+        if pack.facets is None:
+            rows = await self.load_rows_json(pack, range(pack.count))
+            pack.facets = await asyncio.to_thread(build_facets, (decode_row(r) for r in rows))
+        return pack.facets
+
+    async def catalog(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def put_pack(self, slug: str, content: bytes, update_catalog: bool = True) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def update_catalog(self, entries: Sequence[Dict[str, Any]]) -> bool:
+        """批量寫入後一次過更新目錄；entries 來自 put_pack(update_catalog=False) 嘅 "entry"。"""
+        raise NotImplementedError
+
+    async def republish(self, slug: str, upload: Any, encoding: str, csv_etag: str) -> None:
+        """串流上載完成後（upload 係 open_upload 嗰個 writer）：轉 UTF-8、編譯、更新目錄。"""
+        raise NotImplementedError
+
+    async def open_upload(self, slug: str) -> Any:
+        """串流寫入 CSV：回傳有 write / complete（回傳版本）/ abort / bytes / parts 嘅 writer。"""
+        raise NotImplementedError
+
+    async def discard_artifact(self, slug: str) -> None:
+        raise NotImplementedError
+
+    async def read_blob(self, key: str) -> Optional[bytes]:
+        """細嘅營運檔案（例如熱門題包統計）；唔存在回傳 None。"""
+        raise NotImplementedError
+
+    async def write_blob(
+        self, key: str, data: bytes, content_type: str = "application/json; charset=utf-8", cache_control: Optional[str] = None
+    ) -> None:
+        raise NotImplementedError
+
+    async def read_blob_versioned(self, key: str) -> Tuple[Optional[bytes], Optional[str]]:
+        """(內容, 版本)；唔存在回傳 (None, None)。"""
+        raise NotImplementedError
+
+    async def write_blob_if(
+        self, key: str, data: bytes, version: Optional[str], content_type: str = "application/json; charset=utf-8"
+    ) -> bool:
+        """版本仲係 version（None = 未存在）先寫；被其他 worker 搶先回傳 False。"""
+        raise NotImplementedError
+
+    def location(self, key: str) -> str:
+        _, bucket = s3_registry.get()
+        return f"s3://{bucket}/{key}"
+
+    def public_url(self, key: str) -> str:
+        _, bucket = s3_registry.get()
+        return f"https://{bucket}.r2.cloudflarestorage.com/{key}"
+
+    def stats(self) -> Dict[str, Any]:
+        return {"impl": type(self).__name__}
+
+
+class ThreadedPackStorage(PackStorage):
+    """
+    同步 boto3 + 專用 ThreadPoolExecutor（唔同 Starlette 預設 threadpool 爭位）。
+    - cache 命中直接喺 event loop 答，唔使開 thread
+    - 同一題包並發 miss 只做一次 fetch，其他 request 等同一個結果
+    """
+
+    def __init__(self, max_workers: int = STORAGE_THREADS):
+        self.max_workers = max(1, max_workers)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._inflight: Dict[str, "asyncio.Future[CachedPack]"] = {}
+        self.offloaded = 0
+        self.coalesced = 0
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="storage")
+        return self._executor
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        self.offloaded += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(fn, *args, **kwargs))
+
+    async def load_pack(self, slug: str) -> CachedPack:
+        key = slug_to_key(slug)
+        hit = pack_cache.get_fresh(key)
+        if hit is not None:
+            return hit
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(self.run(self.load_pack_sync, slug))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    def load_pack_sync(self, slug: str) -> CachedPack:
+        """cache miss / 過期時喺 executor 行；子類換來源只要覆寫呢個。"""
+        return load_pack_sync(slug)
+
+    async def load_rows(self, pack: CachedPack, indices: Sequence[int]) -> List[Dict[str, Any]]:
+        if not pack.is_remote:
+            return pack.rows(indices)
+        return [decode_row(b) for b in await self._remote_rows(pack, indices)]
+
+    async def load_rows_json(self, pack: CachedPack, indices: Sequence[int]) -> List[bytes]:
+        if not pack.is_remote:
+            return pack.row_bytes(indices)
+        return await self._remote_rows(pack, indices)
+
+    async def _remote_rows(self, pack: CachedPack, indices: Sequence[int]) -> List[bytes]:
+        try:
+            return await self._read_remote_rows(pack, indices)
+        except Exception as e:
+            if not is_precondition_failed(e):
+                raise
+        # 產物喺我哋讀緊期間被改咗：作廢 cache，重新載入一次
+        pack_cache.invalidate(pack.key)
+        fresh = await self.load_pack(key_to_slug(pack.key))
+        if fresh.count != pack.count:
+            raise RuntimeError("pack changed while sampling")
+        if not fresh.is_remote:
+            return fresh.row_bytes(indices)
+        return await self._read_remote_rows(fresh, indices)
+
+    async def _read_remote_rows(self, pack: CachedPack, indices: Sequence[int]) -> List[bytes]:
+        spans = plan_ranges(pack.offsets or [], indices)
+        parts = await asyncio.gather(*(self.run(read_span_sync, pack, a, b, rows) for a, b, rows in spans))
+        by_index: Dict[int, bytes] = {}
+        for p in parts:
+            by_index.update(p)
+        return [by_index[i] for i in indices]
+
+    async def catalog(self) -> Dict[str, Any]:
+        doc = catalog.get_fresh()
+        if doc is not None:
+            return doc
+        return await self.run(catalog_sync)
+
+    async def put_pack(self, slug: str, content: bytes, update_catalog: bool = True) -> Dict[str, Any]:
+        return await self.run(put_pack_sync, slug, content, update_catalog)
+
+    async def update_catalog(self, entries: Sequence[Dict[str, Any]]) -> bool:
+        return await self.run(update_catalog_sync, entries)
+
+    async def republish(self, slug: str, upload: MultipartUpload, encoding: str, csv_etag: str) -> None:
+        # 由上載時嘅暫存檔做，唔使由 S3 讀返成個 CSV 再寫過
+        try:
+            size = upload.bytes
+            if encoding == "utf-8":
+                csv_etag = await self.run(mark_normalized_sync, slug, csv_etag, encoding)
+                if csv_etag is None:
+                    return
+            else:
+                s3, bucket = s3_registry.get()
+                out = MultipartUpload(
+                    s3,
+                    bucket,
+                    slug_to_key(slug),
+                    content_type="text/csv; charset=utf-8",
+                    run=self.run,
+                    metadata={**NORMALIZED_META, "source-encoding": encoding},
+                )
+                chunks = transcode_chunks(upload.source(), encoding)
+                try:
+                    while True:
+                        chunk = await self.run(next, chunks, None)
+                        if chunk is None:
+                            break
+                        await out.write(chunk)
+                    csv_etag = await out.complete()
+                except BaseException:
+                    await out.abort()
+                    raise
+                size = out.bytes
+            await self.run(publish_upload_sync, slug, upload.source(), encoding, csv_etag, size)
+        finally:
+            upload.close()
+
+    async def open_upload(self, slug: str) -> MultipartUpload:
+        s3, bucket = s3_registry.get()
+        return MultipartUpload(s3, bucket, slug_to_key(slug), run=self.run, spool=True)
+
+    async def discard_artifact(self, slug: str) -> None:
+        await self.run(discard_artifact_sync, slug)
+
+    async def read_blob(self, key: str) -> Optional[bytes]:
+        return await self.run(read_blob_sync, key)
+
+    async def write_blob(
+        self, key: str, data: bytes, content_type: str = "application/json; charset=utf-8", cache_control: Optional[str] = None
+    ) -> None:
+        await self.run(write_blob_sync, key, data, content_type, cache_control)
+
+    async def read_blob_versioned(self, key: str) -> Tuple[Optional[bytes], Optional[str]]:
+        return await self.run(read_blob_versioned_sync, key)
+
+    async def write_blob_if(
+        self, key: str, data: bytes, version: Optional[str], content_type: str = "application/json; charset=utf-8"
+    ) -> bool:
+        return await self.run(write_blob_if_sync, key, data, version, content_type)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "impl": type(self).__name__,
+            "max_workers": self.max_workers,
+            "inflight": len(self._inflight),
+            "offloaded": self.offloaded,
+            "coalesced": self.coalesced,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+_storage: PackStorage = ThreadedPackStorage()
+
+
+def get_storage() -> PackStorage:
+    return _storage
+
+
+def set_storage(impl: PackStorage) -> None:
+    """換實作（例如 async S3 client、測試用假 storage）。"""
+    global _storage
+    _storage = impl
@@ -0,0 +1,233 @@
+# apps/backend/app/upload_stream.py
+from __future__ import annotations
+
+import codecs
+import csv
+import io
+import os
+import tempfile
+from typing import Any, Awaitable, BinaryIO, Callable, Dict, Iterator, List, Optional
+
+from .packs import ENCODINGS, QUESTION_COLUMNS
+
+# === 設定 ===
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+# S3 multipart：除最後一 part 外每 part 最少 5 MiB
+UPLOAD_PART_SIZE = max(5 * 1024 * 1024, int(os.getenv("UPLOAD_PART_SIZE", str(8 * 1024 * 1024))))
+_MAX_HEADER_CHARS = 64 * 1024
+
+
+class UploadRejected(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def first_record_end(text: str) -> Optional[int]:
+    """第一個完整 CSV record 嘅結尾位置（雙引號入面嘅換行唔計）；未齊回傳 None。"""
+    in_quotes = False
+    for i, ch in enumerate(text):
+        if ch == '"':
+            in_quotes = not in_quotes
+        elif ch == "\n" and not in_quotes:
+            return i + 1
+    return None
+
+
+class CsvStreamValidator:
+    """
+    邊收邊驗：
+    - 編碼：同 smart_decode 一樣嘅候選次序，每個 chunk 用 incremental decoder 試；
+      解唔到嘅候選即刻剔走，全部都失敗就拒絕
+    - header：第一行一齊就檢查有冇題目欄
+    """
+
+    def __init__(self):
+        self._decoders = [(enc, codecs.getincrementaldecoder(enc)()) for enc in ENCODINGS]
+        self._heads: Dict[str, str] = {enc: "" for enc in ENCODINGS}
+        self.header: Optional[List[str]] = None
+        self.bytes = 0
+
+    @property
+    def encoding(self) -> str:
+        return self._decoders[0][0] if self._decoders else ""
+
+    def feed(self, chunk: bytes, final: bool = False) -> None:
+        if self.bytes == 0 and chunk.startswith(codecs.BOM_UTF8):
+            # 同 detect_encoding 一樣：有 BOM 就只會係 utf-8-sig
+            self._decoders = [("utf-8-sig", codecs.getincrementaldecoder("utf-8-sig")())]
+            self._heads = {"utf-8-sig": ""}
+        self.bytes += len(chunk)
+        alive = []
+        for enc, dec in self._decoders:
+            try:
+                text = dec.decode(chunk, final)
+            except UnicodeDecodeError:
+                continue
+            alive.append((enc, dec))
+            if self.header is None:
+                self._heads[enc] += text
+        if not alive:
+            raise UploadRejected(400, "unsupported or invalid text encoding")
+        self._decoders = alive
+
+        if final and self.bytes == 0:
+            raise UploadRejected(400, "empty file")
+        if self.header is None:
+            self._check_header(final)
+
+    def _check_header(self, final: bool) -> None:
+        head = self._heads[self.encoding]
+        cut = first_record_end(head)
+        if cut is None:
+            if len(head) > _MAX_HEADER_CHARS:
+                raise UploadRejected(400, "header row too long")
+            if not final:
+                return
+            cut = len(head)
+        header = next(csv.reader(io.StringIO(head[:cut])), [])
+        cols = [h.strip() for h in header]
+        if not QUESTION_COLUMNS.intersection(cols):
+            raise UploadRejected(400, "CSV header missing question column (question/題目/pairs/left)")
+        self.header = cols
+        self._heads = {}
+
+
+class MultipartUpload:
+    """
+    有上限嘅緩衝：湊夠一個 part 就 upload_part，記憶體最多約一個 part。
+    成個檔案細過一個 part 就直接 put_object（慳返 create/complete 兩次 round trip）。
+    - run：storage 嘅 executor（ThreadedPackStorage.run），唔同 Starlette 預設 threadpool 爭位
+    - spool=True：收到嘅 bytes 同時寫落暫存檔（超過一個 part 就落 disk），
+      上載完直接由暫存檔轉碼 / 編譯，唔使由 S3 讀返成個 CSV
+    """
+
+    def __init__(
+        self,
+        s3,
+        bucket: str,
+        key: str,
+        content_type: str = "text/csv",
+        part_size: int = UPLOAD_PART_SIZE,
+        *,
+        run: Callable[..., Awaitable[Any]],
+        metadata: Optional[Dict[str, str]] = None,
+        spool: bool = False,
+    ):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.content_type = content_type
+        self.part_size = part_size
+        self.metadata = metadata
+        self._run = run
+        self._buf = bytearray()
+        self._upload_id: Optional[str] = None
+        self._parts: List[Dict[str, Any]] = []
+        self._spool: Optional[BinaryIO] = tempfile.SpooledTemporaryFile(max_size=part_size) if spool else None
+        self.bytes = 0
+
+    @property
+    def parts(self) -> int:
+        return len(self._parts)
+
+    def source(self) -> BinaryIO:
+        """上載咗嘅原始 bytes（暫存檔）；用完要 close()。"""
+        if self._spool is None:
+            raise RuntimeError("upload was opened without spool")
+        self._spool.seek(0)
+        return self._spool
+
+    def close(self) -> None:
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+
+    async def write(self, data: bytes) -> None:
+        self._buf += data
+        self.bytes += len(data)
+        if self._spool is not None:
+            await self._run(self._spool.write, data)
+        while len(self._buf) >= self.part_size:
+            part = bytes(self._buf[: self.part_size])
+            del self._buf[: self.part_size]
+            await self._upload_part(part)
+
+    def _extra(self) -> Dict[str, Any]:
+        return {"Metadata": self.metadata} if self.metadata else {}
+
+    async def complete(self) -> str:
+        if self._upload_id is None:
+            resp = await self._run(
+                self.s3.put_object,
+                Bucket=self.bucket,
+                Key=self.key,
+                Body=bytes(self._buf),
+                ContentType=self.content_type,
+                **self._extra(),
+            )
+            self._parts.append({"PartNumber": 1, "ETag": (resp or {}).get("ETag") or ""})
+            self._buf = bytearray()
+            return (resp or {}).get("ETag") or ""
+
+        if self._buf:
+            await self._upload_part(bytes(self._buf))
+            self._buf = bytearray()
+        resp = await self._run(
+            self.s3.complete_multipart_upload,
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            MultipartUpload={"Parts": self._parts},
+        )
+        return (resp or {}).get("ETag") or ""
+
+    async def abort(self) -> None:
+        self._buf = bytearray()
+        self.close()
+        if self._upload_id is None:
+            return
+        try:
+            await self._run(
+                self.s3.abort_multipart_upload,
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self._upload_id,
+            )
+        except Exception:
+            pass
+
+    async def _upload_part(self, data: bytes) -> None:
+        if self._upload_id is None:
+            resp = await self._run(
+                self.s3.create_multipart_upload,
+                Bucket=self.bucket,
+                Key=self.key,
+                ContentType=self.content_type,
+                **self._extra(),
+            )
+            self._upload_id = resp["UploadId"]
+        n = len(self._parts) + 1
+        resp = await self._run(
+            self.s3.upload_part,
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            PartNumber=n,
+            Body=data,
+        )
+        self._parts.append({"PartNumber": n, "ETag": resp["ETag"]})
+
+
+def transcode_chunks(source: BinaryIO, encoding: str, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+    """逐塊將 source 由 encoding 轉做 UTF-8（無 BOM）；記憶體只用一塊。"""
+    source.seek(0)
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    while True:
+        raw = source.read(chunk_size)
+        text = decoder.decode(raw, final=not raw)
+        if text:
+            yield text.encode("utf-8")
+        if not raw:
+            return
@@ -0,0 +1,221 @@
+# apps/backend/app/warmup.py
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from .s3_client import s3_registry
+
+# === 設定 ===
+WARM_ENABLED = os.getenv("WARM_ENABLED", "1").strip().lower() not in ("0", "false", "no", "")
+# 指定要預載嘅 slug（逗號分隔）；冇設定就用熱門統計嘅 top-N
+WARM_PACKS = [s.strip().strip("/") for s in os.getenv("WARM_PACKS", "").split(",") if s.strip()]
+WARM_TOP_N = int(os.getenv("WARM_TOP_N", "20"))
+WARM_CONCURRENCY = max(1, int(os.getenv("WARM_CONCURRENCY", "4")))
+WARM_DB_CONNECTIONS = int(os.getenv("WARM_DB_CONNECTIONS", "2"))
+WARM_STATS_KEY = os.getenv("WARM_STATS_KEY", "catalog/hot.json")
+WARM_STATS_FLUSH = float(os.getenv("WARM_STATS_FLUSH", "300"))  # 秒；0 = 只喺 shutdown 寫
+# 舊統計每過 WARM_STATS_FLUSH 秒乘呢個數一次（按距離上次寫入嘅時間計，幾多個 worker 寫都一樣）：最近熱門嘅排前
+WARM_STATS_DECAY = float(os.getenv("WARM_STATS_DECAY", "0.5"))
+_MAX_WRITE_RETRIES = 5
+
+
+class AccessStats:
+    """題包讀取次數（process 內）；定期同 shutdown 時併入 WARM_STATS_KEY，下次 boot 揀 top-N 用。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Counter = Counter()
+        self.flushed_at = 0.0
+
+    def hit(self, slug: str, n: int = 1) -> None:
+        with self._lock:
+            self._counts[slug] += n
+
+    def drain(self) -> Counter:
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        return counts
+
+    def restore(self, counts: Counter) -> None:
+        """寫入失敗：計數放返入去，下次再試。"""
+        with self._lock:
+            self._counts.update(counts)
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(self._counts.values())
+
+
+access_stats = AccessStats()
+
+
+def _parse_doc(raw: Optional[bytes]) -> Tuple[Dict[str, float], float]:
+    """(計數, updated_at)；壞檔當冇。"""
+    if not raw:
+        return {}, 0.0
+    try:
+        doc = json.loads(raw)
+    except ValueError:
+        return {}, 0.0
+    if not isinstance(doc, dict):
+        return {}, 0.0
+    counts = doc.get("counts")
+    updated_at = doc.get("updated_at")
+    updated_at = float(updated_at) if isinstance(updated_at, (int, float)) else 0.0
+    if not isinstance(counts, dict):
+        return {}, updated_at
+    return {str(k): float(v) for k, v in counts.items() if isinstance(v, (int, float))}, updated_at
+
+
+def _parse_stats(raw: Optional[bytes]) -> Dict[str, float]:
+    return _parse_doc(raw)[0]
+
+
+def _decay_factor(updated_at: float, now: float) -> float:
+    if not updated_at or WARM_STATS_FLUSH <= 0:
+        return WARM_STATS_DECAY
+    return WARM_STATS_DECAY ** (max(0.0, now - updated_at) / WARM_STATS_FLUSH)
+
+
+async def top_slugs(storage, n: int) -> List[str]:
+    counts = _parse_stats(await storage.read_blob(WARM_STATS_KEY))
+    return [s for s, _ in sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))[:n]]
+
+
+async def flush_access_stats(storage) -> int:
+    """
+    將未寫入嘅計數併入 WARM_STATS_KEY（舊數按時間衰減）；回傳寫入咗幾多次讀取。
+    多個 worker 共用同一個檔：讀 → 併 → 條件式寫（同 catalog 一樣），撞車就重讀再併，唔會蓋走人哋嘅計數。
+    """
+    fresh = access_stats.drain()
+    if not fresh:
+        return 0
+    try:
+        for _ in range(_MAX_WRITE_RETRIES):
+            raw, version = await storage.read_blob_versioned(WARM_STATS_KEY)
+            counts, updated_at = _parse_doc(raw)
+            now = time.time()
+            decay = _decay_factor(updated_at, now)
+            merged = {k: v * decay for k, v in counts.items()}
+            for slug, c in fresh.items():
+                merged[slug] = merged.get(slug, 0.0) + c
+            # 太細嘅尾巴唔使留
+            merged = {k: round(v, 3) for k, v in merged.items() if v >= 0.01}
+            doc = {"updated_at": now, "counts": merged}
+            if await storage.write_blob_if(WARM_STATS_KEY, json.dumps(doc, ensure_ascii=False).encode("utf-8"), version):
+                break
+        else:
+            raise RuntimeError("access stats flush conflicted too many times")
+    except Exception:
+        access_stats.restore(fresh)
+        raise
+    access_stats.flushed_at = time.time()
+    return sum(fresh.values())
+
+
+class WarmupState:
+    """預熱進度（/internal/warmup 睇）。"""
+
+    def __init__(self):
+        self.state = "idle"  # idle / running / done / failed / disabled
+        self.phase = ""
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.source = ""  # env / stats
+        self.total = 0
+        self.loaded = 0
+        self.failed: List[str] = []
+        self.s3_connections = 0
+        self.db_connections = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        return {
+            "state": self.state,
+            "phase": self.phase,
+            "source": self.source,
+            "total": self.total,
+            "loaded": self.loaded,
+            "failed": list(self.failed),
+            "s3_connections": self.s3_connections,
+            "db_connections": self.db_connections,
+            "seconds": round(end - self.started_at, 3) if self.started_at else None,
+        }
+
+
+warmup_state = WarmupState()
+
+
+async def warm_up(storage, *, warm_s3: bool = True, warm_db=None) -> WarmupState:
+    """
+    背景預熱：
+    1) 連線：S3 連線池（head_bucket）、DB pool（warm_db(n)）——並行做
+    2) 題包：WARM_PACKS 或熱門統計 top-N，有上限咁並發 load_pack 入 pack cache
+    任何一步失敗都只記錄，唔會影響服務。
+    """
+    st = warmup_state
+    if not WARM_ENABLED:
+        st.state = "disabled"
+        return st
+    st.state, st.started_at, st.finished_at = "running", time.time(), None
+    loop = asyncio.get_running_loop()
+    try:
+        st.phase = "connections"
+        jobs = []
+        if warm_s3:
+            jobs.append(loop.run_in_executor(None, s3_registry.warm))
+        if warm_db is not None and WARM_DB_CONNECTIONS > 0:
+            jobs.append(loop.run_in_executor(None, warm_db, WARM_DB_CONNECTIONS))
+        results = await asyncio.gather(*jobs, return_exceptions=True)
+        if warm_s3 and not isinstance(results[0], BaseException):
+            st.s3_connections = results[0]
+        if warm_db is not None and WARM_DB_CONNECTIONS > 0 and not isinstance(results[-1], BaseException):
+            st.db_connections = results[-1]
+
+        st.phase = "packs"
+        if WARM_PACKS:
+            st.source, slugs = "env", list(WARM_PACKS)
+        else:
+            st.source = "stats"
+            try:
+                slugs = await top_slugs(storage, WARM_TOP_N) if WARM_TOP_N > 0 else []
+            except Exception:
+                slugs = []
+        st.total = len(slugs)
+
+        sem = asyncio.Semaphore(WARM_CONCURRENCY)
+
+        async def one(slug: str) -> None:
+            async with sem:
+                try:
+                    await storage.load_pack(slug)
+                    st.loaded += 1
+                except Exception:
+                    st.failed.append(slug)
+
+        await asyncio.gather(*(one(s) for s in slugs))
+        st.state = "done"
+    except Exception:
+        st.state = "failed"
+    finally:
+        st.phase = ""
+        st.finished_at = time.time()
+    return st
+
+
+async def flush_loop(storage) -> None:
+    """每 WARM_STATS_FLUSH 秒寫一次熱門統計。"""
+    if WARM_STATS_FLUSH <= 0:
+        return
+    while True:
+        await asyncio.sleep(WARM_STATS_FLUSH)
+        try:
+            await flush_access_stats(storage)
+        except Exception:
+            pass
@@ -1,5 +1,6 @@
 # apps/backend/auth/__init__.py
 from .auth_routes import router as auth_router
+from .deps import TokenEntitlement, optional_token_entitlement, token_entitlement
 
-__all__ = ["auth_router"]
+__all__ = ["auth_router", "TokenEntitlement", "optional_token_entitlement", "token_entitlement"]
 
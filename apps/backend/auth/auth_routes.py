@@ -5,11 +5,15 @@ from datetime import datetime, timedelta
 import random
 
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, EmailStr
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.entitlements import DIGEST_CLAIM, UID_CLAIM, entitlement_digest_async
+from app.models import Customer
 from app.models.user_auth_models import User, LoginCode
-from database import get_db
+from database import get_async_db
 from mailer_sendgrid import send_email
 from .auth_utils import create_access_token
 
@@ -31,6 +35,8 @@ class AuthOut(BaseModel):
     plan: str
     starter_subject: str | None = None
     starter_grade: str | None = None
+    # 授權（grant）用嘅 uid：同付款時 localStorage 嗰個一樣；未付過款就 None
+    uid: str | None = None
 
 
 def _clean_email(e: str) -> str:
@@ -42,7 +48,7 @@ def _clean_code(c: str) -> str:
 
 
 @router.post("/request-code")
-def request_code(body: RequestCodeIn, db: Session = Depends(get_db)):
+async def request_code(body: RequestCodeIn, db: AsyncSession = Depends(get_async_db)):
     email = _clean_email(body.email)
     if not email:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="email is required")
@@ -52,10 +58,12 @@ def request_code(body: RequestCodeIn, db: Session = Depends(get_db)):
 
     login_code = LoginCode(email=email, code=code, expires_at=expires_at, used=False)
     db.add(login_code)
-    db.commit()
+    await db.commit()
 
     try:
-        send_email(
+        # SendGrid client 係同步 HTTP：丟去 threadpool
+        await run_in_threadpool(
+            send_email,
             to=email,
             subject="你的登入驗證碼",
             html=f"<p>你的登入驗證碼是：<b>{code}</b>（10 分鐘內有效）</p>",
@@ -70,7 +78,7 @@ def request_code(body: RequestCodeIn, db: Session = Depends(get_db)):
 
 
 @router.post("/verify-code", response_model=AuthOut)
-def verify_code(body: VerifyCodeIn, db: Session = Depends(get_db)):
+async def verify_code(body: VerifyCodeIn, db: AsyncSession = Depends(get_async_db)):
     email = _clean_email(body.email)
     code = _clean_code(body.code)
 
@@ -80,30 +88,47 @@ def verify_code(body: VerifyCodeIn, db: Session = Depends(get_db)):
     now = datetime.utcnow()
 
     login_code = (
-        db.query(LoginCode)
-        .filter(
-            LoginCode.email == email,
-            LoginCode.code == code,
-            LoginCode.used.is_(False),
-            LoginCode.expires_at > now,
+        await db.execute(
+            select(LoginCode)
+            .where(
+                LoginCode.email == email,
+                LoginCode.code == code,
+                LoginCode.used.is_(False),
+                LoginCode.expires_at > now,
+            )
+            .order_by(LoginCode.id.desc())
+            .limit(1)
         )
-        .order_by(LoginCode.id.desc())
-        .first()
-    )
+    ).scalar_one_or_none()
     if not login_code:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="驗證碼錯誤或已過期")
 
     login_code.used = True
 
-    user = db.query(User).filter(User.email == email).first()
+    user = (await db.execute(select(User).where(User.email == email).limit(1))).scalar_one_or_none()
     if not user:
         user = User(email=email)
         db.add(user)
 
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
+
+    # grant / customers 係用前端 localStorage uid（Stripe client_reference_id）做 key，唔係 users.id；
+    # webhook 會將付款 email 記喺 customers，所以用已驗證嘅 email 搵返嗰個 uid。
+    ent_uid = (
+        await db.execute(
+            select(Customer.user_id)
+            .where(func.lower(Customer.email) == email)
+            .order_by(Customer.updated_at.desc())
+            .limit(1)
+        )
+    ).scalar_one_or_none()
 
-    token = create_access_token(user_id=str(user.id), email=user.email)
+    claims = {"sub": str(user.id), "user_id": str(user.id), "email": user.email}
+    if ent_uid:
+        # 授權摘要跟 token 一齊簽：之後 access check 唔使返 DB（見 auth.deps.token_entitlement）
+        claims.update({UID_CLAIM: ent_uid, DIGEST_CLAIM: await entitlement_digest_async(ent_uid)})
+    token = create_access_token(claims)
 
     return AuthOut(
         token=token,
@@ -111,4 +136,5 @@ def verify_code(body: VerifyCodeIn, db: Session = Depends(get_db)):
         plan=user.plan or "free",
         starter_subject=user.starter_subject,
         starter_grade=user.starter_grade,
+        uid=ent_uid,
     )
@@ -12,17 +12,20 @@ JWT_ALG = os.getenv("JWT_ALG", "HS256")
 JWT_EXPIRES_MIN = int(os.getenv("JWT_EXPIRES_MIN", "60"))  # 1 hour default
 
 
+def _secret() -> str:
+    if not JWT_SECRET:
+        # Dev-safe default (but you SHOULD set JWT_SECRET in prod!)
+        # Using a fixed fallback avoids crashing when running locally.
+        return "dev-insecure-secret-change-me"
+    return JWT_SECRET
+
+
 def create_access_token(payload: Dict[str, Any], expires_minutes: int | None = None) -> str:
     """Create a signed JWT access token.
 
     payload: will be embedded under standard claims (plus your fields).
     """
-    if not JWT_SECRET:
-        # Dev-safe default (but you SHOULD set JWT_SECRET in prod!)
-        # Using a fixed fallback avoids crashing when running locally.
-        secret = "dev-insecure-secret-change-me"
-    else:
-        secret = JWT_SECRET
+    secret = _secret()
 
     now = datetime.now(timezone.utc)
     exp = now + timedelta(minutes=expires_minutes or JWT_EXPIRES_MIN)
@@ -33,3 +36,8 @@ def create_access_token(payload: Dict[str, Any], expires_minutes: int | None = N
         "exp": int(exp.timestamp()),
     })
     return jwt.encode(claims, secret, algorithm=JWT_ALG)
+
+
+def decode_access_token(token: str) -> Dict[str, Any]:
+    """Verify signature + exp and return the claims. Raises jwt.PyJWTError if invalid."""
+    return jwt.decode(token, _secret(), algorithms=[JWT_ALG])
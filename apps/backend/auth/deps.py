@@ -0,0 +1,90 @@
+# apps/backend/auth/deps.py
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional
+
+import jwt
+from fastapi import Header, HTTPException, status
+
+from app.entitlements import (
+    DIGEST_CLAIM,
+    UID_CLAIM,
+    AccessBitmap,
+    access_target,
+    check_access_bitmap,
+    current_grant_version,
+    load_snapshot,
+)
+from .auth_utils import decode_access_token
+
+
+@dataclass
+class TokenEntitlement:
+    """
+    由 JWT 授權摘要（ent claim）答 access check；user_id 係授權 uid（可以係空）。
+    摘要 version 同 customers.grant_version 一致、bitmap 未過期 → 完全唔使查 DB；
+    否則 refreshed=True，代表已經由 DB 重新讀（前端可以重新登入攞新 token）。
+    """
+
+    user_id: str
+    email: str
+    plan: str
+    bitmap: AccessBitmap
+    version: int
+    refreshed: bool = False
+
+    def has_access(self, subject_or_slug: str, grade: str | int | None = None) -> bool:
+        # 同 entitlements.has_access 一樣接受 slug 或者 (subject, grade)
+        subj, gnum = access_target(subject_or_slug, grade)
+        return gnum != 0 and self.bitmap.test(subj, gnum)
+
+    def check_many(self, slugs: Iterable[str]) -> Dict[str, bool]:
+        return check_access_bitmap(self.bitmap, slugs)
+
+
+def _from_claims(claims: dict) -> TokenEntitlement:
+    email = claims.get("email") or ""
+    # 授權係跟 customers.user_id（付款 uid）走；token 冇 uid = 登入咗但未連到任何付款
+    user_id = str(claims.get(UID_CLAIM) or "")
+    if not user_id:
+        return TokenEntitlement("", email, "free", AccessBitmap(), 0)
+
+    digest = claims.get(DIGEST_CLAIM) or {}
+    bitmap: Optional[AccessBitmap] = None
+    try:
+        bitmap = AccessBitmap.loads(digest.get("a", ""))
+        version = int(digest.get("v"))
+    except (AttributeError, TypeError, ValueError):
+        bitmap = None
+    if bitmap is not None and not bitmap.stale() and version == current_grant_version(user_id):
+        return TokenEntitlement(user_id, email, digest.get("p") or "free", bitmap, version)
+
+    # 冇摘要 / 授權有變 / 有 grant 過咗期：返 DB（snapshot cache）攞
+    snap = load_snapshot(user_id)
+    return TokenEntitlement(user_id, email, snap.plan(), snap.bitmap(), snap.version, refreshed=True)
+
+
+def _bearer(authorization: Optional[str]) -> str:
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        raise HTTPException(status.HTTP_401_UNAUTHORIZED, "missing bearer token")
+    return token.strip()
+
+
+def token_entitlement(authorization: Optional[str] = Header(default=None, alias="Authorization")) -> TokenEntitlement:
+    """FastAPI dependency：驗 JWT，回傳可以直接答 access check 嘅 TokenEntitlement。"""
+    try:
+        claims = decode_access_token(_bearer(authorization))
+    except jwt.PyJWTError:
+        raise HTTPException(status.HTTP_401_UNAUTHORIZED, "invalid or expired token")
+    return _from_claims(claims)
+
+
+def optional_token_entitlement(
+    authorization: Optional[str] = Header(default=None, alias="Authorization"),
+) -> Optional[TokenEntitlement]:
+    """冇帶 token 回 None；有帶但無效照樣 401。"""
+    if not authorization:
+        return None
+    return token_entitlement(authorization)
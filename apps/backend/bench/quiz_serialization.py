@@ -0,0 +1,88 @@
+# apps/backend/bench/quiz_serialization.py
+# /api/quiz 回應組裝 microbenchmark（唔使 S3 / FastAPI）：
+#   cd apps/backend && python -m bench.quiz_serialization [--rows 200 20000] [--iters 2000]
+#
+# before：cache 入面係 dict list → 抄一份 shuffle → 整個 response dict 用 stdlib json（Starlette JSONResponse）
+# after ：抽 index → 攞預先 serialize 好嘅 fragment → bytes join
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import time
+
+from app.jsonfmt import USE_ORJSON, assemble_quiz
+from app.packs import pack_from_artifact, compile_pack, dump_artifact
+from app.sampling import make_rng, pick_count, pick_indices
+
+
+def _csv(rows: int) -> bytes:
+    lines = ["id,題目,A,B,C,D,答案,解析"]
+    for i in range(rows):
+        lines.append(f"Q{i:05d},第{i}題：以下哪一個係正確答案？,選項甲,選項乙,選項丙,選項丁,A,因為甲係啱嘅答案")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def _starlette_render(content) -> bytes:
+    # 同 starlette.responses.JSONResponse.render 一樣
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def bench(rows: int, iters: int) -> None:
+    body = dump_artifact(compile_pack("bench/grade1/x", _csv(rows)))
+    pack = pack_from_artifact("packs/bench/grade1/x.csv", "packs/bench/grade1/x.json", body, '"e"')
+    qs_all = pack.rows(range(pack.count))  # 舊版 cache 入面嘅形態
+    url = "s3://bucket/packs/bench/grade1/x.csv"
+
+    # --- before ---
+    t_sample = t_ser = 0.0
+    for it in range(iters):
+        t0 = time.perf_counter()
+        rnd = random.Random(str(it))
+        k = pick_count(len(qs_all), None, 10, 15, rnd)
+        copy = qs_all[:]
+        rnd.shuffle(copy)
+        picked = copy[:k]
+        t1 = time.perf_counter()
+        _starlette_render({"title": pack.title, "list": picked, "usedUrl": url, "debug": f"rows={rows}"})
+        t2 = time.perf_counter()
+        t_sample += t1 - t0
+        t_ser += t2 - t1
+    _report("before", rows, iters, t_sample, t_ser)
+
+    # --- after ---
+    t_sample = t_ser = 0.0
+    for it in range(iters):
+        t0 = time.perf_counter()
+        rnd = make_rng(str(it))
+        k = pick_count(pack.count, None, 10, 15, rnd)
+        frags = pack.row_bytes(pick_indices(pack.count, k, rnd))
+        t1 = time.perf_counter()
+        assemble_quiz(pack.title, frags, url, f"rows={rows}")
+        t2 = time.perf_counter()
+        t_sample += t1 - t0
+        t_ser += t2 - t1
+    _report("after", rows, iters, t_sample, t_ser)
+
+
+def _report(label: str, rows: int, iters: int, t_sample: float, t_ser: float) -> None:
+    total = t_sample + t_ser
+    print(
+        f"{label:<6} rows={rows:<6} per-request={total / iters * 1e6:9.1f}us "
+        f"sample={t_sample / iters * 1e6:9.1f}us serialize={t_ser / iters * 1e6:7.1f}us "
+        f"serialize-share={t_ser / total:6.1%}"
+    )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, nargs="+", default=[200, 20000])
+    ap.add_argument("--iters", type=int, default=2000)
+    args = ap.parse_args()
+    print(f"orjson={'on' if USE_ORJSON else 'off'}")
+    for rows in args.rows:
+        bench(rows, args.iters)
+
+
+if __name__ == "__main__":
+    main()
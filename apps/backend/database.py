@@ -2,10 +2,17 @@
 from __future__ import annotations
 
 import os
-from typing import Generator, Optional
+import threading
+import time
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, AsyncGenerator, Dict, Generator, List, Optional
 
-from sqlalchemy import create_engine
+import sqlalchemy
+from sqlalchemy import create_engine, event, exc as sa_exc, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, DeclarativeBase, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 # NOTE:
 # - Do NOT crash at import-time if DATABASE_URL is missing.
@@ -14,6 +21,15 @@ from sqlalchemy.orm import sessionmaker, DeclarativeBase, Session
 
 DATABASE_URL: Optional[str] = os.getenv("DATABASE_URL")
 
+# Connection pool (QueuePool). Defaults match SQLAlchemy's except recycle, which
+# stays under the idle cutoff of most managed Postgres / proxies.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds waiting for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds; -1 = never
+# Per-connection statement_timeout (Postgres only); 0 = server default
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+
 
 class Base(DeclarativeBase):
     pass
@@ -21,6 +37,156 @@ class Base(DeclarativeBase):
 
 _engine = None
 _SessionLocal = None
+_async_engine = None
+_AsyncSessionLocal = None
+
+
+class PoolStats:
+    """Pool counters fed by TimedQueuePool and pool events; see pool_stats()."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidated = 0
+        self.checked_out_peak = 0
+
+    def record_wait(self, seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def peak(self, checked_out: int) -> None:
+        with self._lock:
+            self.checked_out_peak = max(self.checked_out_peak, checked_out)
+
+    def incr(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "wait_tracked": _TIMED_CHECKOUT,
+                "checkouts": self.checkouts,
+                "wait_avg_ms": round(1000 * self.wait_total / self.checkouts, 3) if self.checkouts else 0.0,
+                "wait_max_ms": round(1000 * self.wait_max, 3),
+                "timeouts": self.timeouts,
+                "connects": self.connects,
+                "invalidated": self.invalidated,
+                "checked_out_peak": self.checked_out_peak,
+            }
+
+
+_pool_stats = PoolStats()
+
+
+# The wait timer hooks QueuePool._do_get / _create_connection, which are private
+# SQLAlchemy API (no public "checkout requested" event exists). Only install it on
+# the 2.x line where those hooks are known; otherwise use the stock pools and report
+# no wait numbers.
+_TIMED_CHECKOUT = (
+    sqlalchemy.__version__.split(".")[0] == "2"
+    and callable(getattr(QueuePool, "_do_get", None))
+    and callable(getattr(QueuePool, "_create_connection", None))
+)
+# Set while a checkout is being timed: _do_get recurses into itself on overflow races
+_in_checkout: ContextVar[bool] = ContextVar("db_pool_in_checkout", default=False)
+_CREATE_SECONDS = "_pool_create_seconds"
+
+
+class _TimedCheckout:
+    """
+    Pool mixin that records how long each checkout waited for a free connection.
+    Time spent opening a brand-new connection (connect + connect events) is not wait;
+    it is measured in _create_connection and subtracted.
+    """
+
+    def _do_get(self):
+        if _in_checkout.get():
+            return super()._do_get()
+        token = _in_checkout.set(True)
+        t0 = time.perf_counter()
+        try:
+            rec = super()._do_get()
+        except sa_exc.TimeoutError:
+            _pool_stats.record_wait(time.perf_counter() - t0, timed_out=True)
+            raise
+        finally:
+            _in_checkout.reset(token)
+        elapsed = time.perf_counter() - t0
+        created = rec.info.pop(_CREATE_SECONDS, 0.0)
+        _pool_stats.record_wait(max(0.0, elapsed - created))
+        return rec
+
+    def _create_connection(self):
+        t0 = time.perf_counter()
+        rec = super()._create_connection()
+        rec.info[_CREATE_SECONDS] = time.perf_counter() - t0
+        return rec
+
+
+if _TIMED_CHECKOUT:
+
+    class TimedQueuePool(_TimedCheckout, QueuePool):
+        pass
+
+    class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+        pass
+
+else:
+    TimedQueuePool = QueuePool  # type: ignore[misc,assignment]
+    TimedAsyncQueuePool = AsyncAdaptedQueuePool  # type: ignore[misc,assignment]
+
+
+def _install_pool_events(engine) -> None:
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, _record):
+        _pool_stats.incr("connects")
+        if DB_STATEMENT_TIMEOUT_MS > 0 and engine.dialect.name == "postgresql":
+            cur = dbapi_conn.cursor()
+            try:
+                cur.execute(f"SET statement_timeout = {int(DB_STATEMENT_TIMEOUT_MS)}")
+            finally:
+                cur.close()
+            # psycopg opens a transaction for SET; don't leave the fresh connection idle-in-transaction
+            dbapi_conn.commit()
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(_dbapi_conn, _record, _proxy):
+        if isinstance(engine.pool, QueuePool):
+            _pool_stats.peak(engine.pool.checkedout())
+
+    @event.listens_for(engine, "invalidate")
+    def _on_invalidate(_dbapi_conn, _record, _exc):
+        _pool_stats.incr("invalidated")
+
+
+def _database_url() -> str:
+    url = (os.getenv("DATABASE_URL") or DATABASE_URL or "").strip()
+    if not url:
+        raise RuntimeError("Missing DATABASE_URL environment variable")
+    return url
+
+
+def _engine_kwargs(url: str, poolclass) -> Dict[str, Any]:
+    kwargs: Dict[str, Any] = {"pool_pre_ping": True}
+    if not url.startswith("sqlite"):
+        kwargs.update(
+            poolclass=poolclass,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    return kwargs
 
 
 def _get_engine():
@@ -28,15 +194,91 @@ def _get_engine():
     if _engine is not None:
         return _engine
 
-    url = (os.getenv("DATABASE_URL") or DATABASE_URL or "").strip()
-    if not url:
-        raise RuntimeError("Missing DATABASE_URL environment variable")
+    url = _database_url()
 
     # Create engine lazily
-    _engine = create_engine(url, pool_pre_ping=True)
+    _engine = create_engine(url, **_engine_kwargs(url, TimedQueuePool))
+    _install_pool_events(_engine)
     return _engine
 
 
+def async_database_url(url: str) -> str:
+    """
+    Same database, async driver: psycopg 3 runs async under the same package;
+    SQLite needs aiosqlite. ASYNC_DATABASE_URL overrides.
+    """
+    override = os.getenv("ASYNC_DATABASE_URL", "").strip()
+    if override:
+        return override
+    scheme, sep, rest = url.partition("://")
+    if scheme in ("postgres", "postgresql", "postgresql+psycopg2", "postgresql+psycopg"):
+        return f"postgresql+psycopg{sep}{rest}"
+    if scheme == "sqlite":
+        return f"sqlite+aiosqlite{sep}{rest}"
+    return url
+
+
+def _get_async_engine():
+    global _async_engine
+    if _async_engine is not None:
+        return _async_engine
+
+    url = async_database_url(_database_url())
+    # Own pool (same sizing env) next to the sync one; both feed pool_stats()
+    _async_engine = create_async_engine(url, **_engine_kwargs(url, TimedAsyncQueuePool))
+    _install_pool_events(_async_engine.sync_engine)
+    return _async_engine
+
+
+def _pool_info(engine) -> Dict[str, Any]:
+    pool = engine.pool
+    out: Dict[str, Any] = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        out.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=max(0, pool.overflow()),
+            max_overflow=DB_MAX_OVERFLOW,
+            timeout=DB_POOL_TIMEOUT,
+        )
+    return out
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Live pool state + counters for /internal/metrics (empty until an engine exists)."""
+    if _engine is None and _async_engine is None:
+        return {}
+    out: Dict[str, Any] = dict(_pool_stats.snapshot())
+    if _engine is not None:
+        out.update(_pool_info(_engine))
+    if _async_engine is not None:
+        out["async"] = _pool_info(_async_engine.sync_engine)
+    return out
+
+
+def warm_pool(connections: int) -> int:
+    """
+    Open up to `connections` pooled connections up front so the first requests
+    skip the TCP/TLS/auth handshake. Returns how many succeeded; never raises.
+    """
+    try:
+        engine = _get_engine()
+    except Exception:
+        return 0
+    opened = []
+    try:
+        for _ in range(max(0, connections)):
+            try:
+                opened.append(engine.connect())
+            except Exception:
+                break
+        return len(opened)
+    finally:
+        for conn in opened:
+            conn.close()  # back to the pool, still open
+
+
 def SessionLocal() -> Session:
     """Return a new SQLAlchemy Session (lazy-init engine)."""
     global _SessionLocal
@@ -53,3 +295,58 @@ def get_db() -> Generator[Session, None, None]:
         yield db
     finally:
         db.close()
+
+
+def AsyncSessionLocal() -> AsyncSession:
+    """Return a new AsyncSession (lazy-init async engine)."""
+    global _AsyncSessionLocal
+    if _AsyncSessionLocal is None:
+        engine = _get_async_engine()
+        _AsyncSessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+    return _AsyncSessionLocal()
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """FastAPI dependency (async handlers; DB waits don't hold a threadpool slot)"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# === Schema migrations =====================================================
+# Plain SQL files in apps/backend/migrations, applied in name order by
+# `python -m app.cli migrate` (run it in the deploy step, before the new code
+# starts). Each file runs in autocommit mode so CREATE INDEX CONCURRENTLY works;
+# keep statements idempotent (IF [NOT] EXISTS) so a half-applied file can be re-run.
+MIGRATIONS_DIR = Path(__file__).resolve().parent / "migrations"
+
+
+def _split_sql(sql: str) -> List[str]:
+    body = "\n".join(line for line in sql.splitlines() if not line.strip().startswith("--"))
+    return [stmt.strip() for stmt in body.split(";") if stmt.strip()]
+
+
+def pending_migrations() -> List[Path]:
+    engine = _get_engine()
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "name varchar PRIMARY KEY, applied_at timestamp with time zone NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+        )
+        done = {row[0] for row in conn.exec_driver_sql("SELECT name FROM schema_migrations")}
+    return [p for p in sorted(MIGRATIONS_DIR.glob("*.sql")) if p.name not in done]
+
+
+def apply_migrations(dry_run: bool = False) -> List[str]:
+    """Apply pending migrations in order; returns their file names."""
+    pending = pending_migrations()
+    if dry_run:
+        return [p.name for p in pending]
+    engine = _get_engine()
+    applied = []
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for path in pending:
+            for stmt in _split_sql(path.read_text(encoding="utf-8")):
+                conn.exec_driver_sql(stmt)
+            conn.execute(text("INSERT INTO schema_migrations (name) VALUES (:name)"), {"name": path.name})
+            applied.append(path.name)
+    return applied
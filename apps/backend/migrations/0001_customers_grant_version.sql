@@ -0,0 +1,3 @@
+-- customers.grant_version：add_access 每次 +1，JWT 授權摘要靠佢判斷係咪過時
+-- （Postgres 11+ 加有 default 嘅 column 唔使 rewrite table）
+ALTER TABLE customers ADD COLUMN IF NOT EXISTS grant_version bigint NOT NULL DEFAULT 0;
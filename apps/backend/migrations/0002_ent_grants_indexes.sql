@@ -0,0 +1,10 @@
+-- ent_grants 授權查詢 / 過期清理用嘅 index（對應 models.py）
+-- CONCURRENTLY：唔鎖寫入；失敗會留低 INVALID index，DROP 咗再跑過
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_ent_grants_access
+    ON ent_grants (user_id, subject, grade_from, grade_to) INCLUDE (plan, expires_at, id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_ent_grants_expiring
+    ON ent_grants (expires_at) WHERE expires_at IS NOT NULL;
+
+-- ix_ent_grants_access 嘅前綴已經覆蓋佢
+DROP INDEX CONCURRENTLY IF EXISTS ix_ent_grants_user_subject;
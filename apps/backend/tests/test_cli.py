@@ -0,0 +1,40 @@
+# apps/backend/tests/test_cli.py
+# 維護指令嘅 smoke test（喺 apps/backend 底下行：python -m pytest tests）：經 app.cli.main 行，同 `python -m app.cli ...` 一樣，用 SQLite 暫存 DB
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import Integer
+
+import database
+from app import cli
+from app.models import models
+
+
+@pytest.fixture()
+def sqlite_db(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'cli.db'}")
+    monkeypatch.setattr(database, "_engine", None)
+    monkeypatch.setattr(database, "_SessionLocal", None)
+    # SQLite 只有 INTEGER PRIMARY KEY 先會自動遞增（Postgres 用 BIGINT identity）
+    monkeypatch.setattr(models.EntGrant.__table__.c.id, "type", Integer())
+    models.Base.metadata.create_all(database._get_engine())
+    yield
+    database._get_engine().dispose()
+
+
+def test_compact_grants_command(sqlite_db, capsys):
+    later = datetime.now(timezone.utc) + timedelta(days=30)
+    with database.SessionLocal() as s, s.begin():
+        s.add(models.Customer(user_id="u1", email="a@example.com"))
+        # 兩行相鄰、到期一樣 → 併成一行
+        s.add(models.EntGrant(user_id="u1", plan="pro", subject="math", grade_from=1, grade_to=2, expires_at=later))
+        s.add(models.EntGrant(user_id="u1", plan="pro", subject="math", grade_from=3, grade_to=4, expires_at=later))
+
+    assert cli.main(["compact-grants"]) == 0
+    assert "compacted users=1 added=0 removed=1" in capsys.readouterr().out
+
+    with database.SessionLocal() as s:
+        rows = s.query(models.EntGrant).all()
+    assert [(g.grade_from, g.grade_to) for g in rows] == [(1, 4)]